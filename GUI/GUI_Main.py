@@ -17,6 +17,7 @@ from PyQt5.QtWidgets import *
 from GUI.Graph1Class import Graph1
 from GUI.Graph2Class import Graph2
 from GUI.Graph3Class import Graph3
+from GUI.Graph4Class import Graph4, TIME_WINDOWS
 from models.config_manager import ConfigManager
 from GUI.BreezeStyleSheets import breeze_resources
 #Connecting with the main code
@@ -26,6 +27,7 @@ import threading
 import json
 import logging
 import os
+from datetime import datetime
 from models import config_manager
 
 #ICONS
@@ -47,39 +49,127 @@ class MainWindow(QtWidgets.QMainWindow):
     def loadDataB(self):
         try:
             #Import Data Base
-            from models import database_manager
-            db = database_manager.DBHandler().open_connection()
+            from models import storage
+            db = storage.handler().open_connection()
             result = [tuple for tuple in db.select_all()]
             #Defining table widget
             self.tableWidget.setRowCount(0)
             self.tableWidget.setVisible(True)
             self.tableWidget.horizontalHeader().setVisible(True)
             self.tableWidget.setHorizontalHeaderLabels(
-                ["Alarm", "DeviceIP", "Severity", "Description", "Time", "Notified", "Ceased"])
+                ["Alarm", "DeviceIP", "Severity", "Description", "Time", "Notified", "Ceased", "Ingested"])
             #Insert Data on table
-            for row_number, row_data in enumerate(result):
-                self.tableWidget.insertRow(row_number)
-                for column_number, data in enumerate(row_data):
-                    self.tableWidget.setItem(row_number, column_number, QtWidgets.QTableWidgetItem(str(data)))
+            self.tableRowById = {}
+            for row_data in result:
+                self.appendTableRow(row_data)
 
             db.close_connection()
         except Exception as e:
             logging.log(logging.ERROR, "something wrong opening the Data Base" + str(e))
+    #Add a single alarm at the bottom of the table
+    def appendTableRow(self, row_data):
+        row_number = self.tableWidget.rowCount()
+        self.tableWidget.insertRow(row_number)
+        for column_number, data in enumerate(row_data):
+            if column_number == 7 and data is not None:  # ingested: epoch when the collector received the alarm
+                data = datetime.fromtimestamp(data).strftime('%Y-%m-%d %H:%M:%S')
+            self.tableWidget.setItem(row_number, column_number, QtWidgets.QTableWidgetItem(str(data)))
+        self.tableRowById[row_data[0]] = row_number
+    #Live Mode check box
+    def liveModeChanged(self):
+        if self.liveModeBox.isChecked():
+            try:
+                from models import storage
+                db = storage.handler().open_connection()
+                # read the position in the change feed before the full load: nothing can be lost in between
+                self.lastChangeSeq = db.select_last_change_seq()
+                db.close_connection()
+            except Exception as e:
+                logging.log(logging.ERROR, "something wrong opening the Data Base" + str(e))
+                self.liveModeBox.setChecked(False)
+                return
+            self.loadDataB()
+            self.reFresh()
+            self.liveTimer.start(ConfigManager().get_live_refresh_rate() * 1000)
+        else:
+            self.liveTimer.stop()
+    #Remove the alarms deleted by the retention from the table
+    #@return: the removed rows, as tuples of the texts of the table cells (same columns of the alarm table)
+    def removeTableRows(self, IDs):
+        rowNumbers = sorted((self.tableRowById[ID] for ID in IDs if ID in self.tableRowById), reverse=True)
+        removed = []
+        for row_number in rowNumbers:  # bottom up: the row numbers still to remove do not move
+            removed.append(tuple(self.tableWidget.item(row_number, column).text()
+                                 for column in range(self.tableWidget.columnCount())))
+            self.tableWidget.removeRow(row_number)
+        if len(removed) > 0:
+            # the rows below the removed ones moved up
+            self.tableRowById = {int(self.tableWidget.item(row_number, 0).text()): row_number
+                                 for row_number in range(self.tableWidget.rowCount())}
+        return removed
+    #Live Mode timer: apply only the alarms inserted, ceased or deleted since the last check
+    def liveRefresh(self):
+        try:
+            from models import storage
+            db = storage.handler().open_connection()
+            if self.lastChangeSeq < db.select_change_horizon():
+                # the retention trimmed changes not seen yet: start again from a full load
+                self.lastChangeSeq = db.select_last_change_seq()
+                db.close_connection()
+                self.loadDataB()
+                self.reFresh()
+                return
+            changes = db.select_changes_since(self.lastChangeSeq)
+            if len(changes) == 0:
+                db.close_connection()
+                return
+            self.lastChangeSeq = changes[-1][0]
+            insertedIDs = set(change[1] for change in changes if change[2] == 'insert')
+            ceasedIDs = [change[1] for change in changes if change[2] == 'cease']
+            deletedIDs = [change[1] for change in changes if change[2] == 'delete']
+            insertedAlarms = db.select_alarms_by_IDs(insertedIDs)
+            db.close_connection()
+        except Exception as e:
+            logging.log(logging.ERROR, "something wrong opening the Data Base" + str(e))
+            return
+
+        # the deletes go first: a deleted row must not hide a new alarm with its ID (databases created before
+        # the alarm IDs were AUTOINCREMENT can reuse them)
+        deletedAlarms = self.removeTableRows(deletedIDs)
+        # rows already loaded by the full load that followed the seq read are skipped
+        newAlarms = [row for row in insertedAlarms if row[0] not in self.tableRowById]
+        for row_data in newAlarms:
+            self.appendTableRow(row_data)
+        for ID in ceasedIDs:
+            if ID in self.tableRowById:
+                self.tableWidget.setItem(self.tableRowById[ID], 6, QtWidgets.QTableWidgetItem('1'))
+
+        # graph 1 and 3 read the counters rollup, graph 2 just adds the new rows and removes the deleted ones
+        self.plotWidget1.reFreshGraph1()
+        self.plotWidget2.updateGraph2(newAlarms, deletedAlarms)
+        self.plotWidget3.reFreshGraph3()
+        self.plotWidget4.reFreshGraph4()
+
+        self.plotWidget1.draw_idle()
+        self.plotWidget2.draw_idle()
+        self.plotWidget3.draw_idle()
+        self.plotWidget4.draw_idle()
     #Refresh Button
     def reFresh(self):
-
-        self.plotWidget1.axes.cla()
+        # the graphs update their artists in place: no need to clear the axes
         self.plotWidget1.reFreshGraph1()
-
-        self.plotWidget2.axes.cla()
         self.plotWidget2.reFreshGraph2()
-
-        self.plotWidget3.axes.cla()
         self.plotWidget3.reFreshGraph3()
-
-        self.plotWidget1.draw()
-        self.plotWidget2.draw()
-        self.plotWidget3.draw()
+        self.plotWidget4.reFreshGraph4()
+
+        self.plotWidget1.draw_idle()
+        self.plotWidget2.draw_idle()
+        self.plotWidget3.draw_idle()
+        self.plotWidget4.draw_idle()
+    #Time window of graph 4 has been changed
+    def timeWindowChanged(self, window):
+        self.plotWidget4.setWindow(window)
+        self.plotWidget4.draw_idle()
     #Save Notification information
     def Json_Notification(self):
         Notification[0]=(self.Send_Mail.displayText())
@@ -202,7 +292,9 @@ class MainWindow(QtWidgets.QMainWindow):
         self.tab_2.setEnabled(True)
         self.tab_3.setEnabled(True)
         self.tab_4.setEnabled(True)
+        self.tab_5.setEnabled(True)
         self.refreshButton.setEnabled(True)
+        self.liveModeBox.setEnabled(True)
     #Exit toolbar triggered
     def Exit(self):
         self.close()
@@ -250,6 +342,7 @@ class MainWindow(QtWidgets.QMainWindow):
             self.plotWidget1.saveGraph1(directory)
             self.plotWidget2.saveGraph2(directory)
             self.plotWidget3.saveGraph3(directory)
+            self.plotWidget4.saveGraph4(directory)
 
     def save1Clicked(self):
         msg = QMessageBox()
@@ -306,6 +399,25 @@ class MainWindow(QtWidgets.QMainWindow):
         if msg.clickedButton().text() == "Save":
             directory = self.textbox.text()
             self.plotWidget3.saveGraph3(directory)
+
+    def save4Clicked(self):
+        msg = QMessageBox()
+        msg.setWindowTitle("Select the directory path where you want to store graph 4")
+        msg.setWindowIcon(QtGui.QIcon(floppy_icon))
+        msg.setText(
+            "                                                                                                                               ")
+        msg.setIcon(QMessageBox.Information)
+        msg.setStandardButtons(QMessageBox.Save | QMessageBox.Cancel)
+        msg.setDefaultButton(QMessageBox.Save)
+
+        self.textbox = QLineEdit(msg)
+        self.textbox.move(50, 20)
+        self.textbox.resize(280, 20)
+
+        msg.exec()
+        if msg.clickedButton().text() == "Save":
+            directory = self.textbox.text()
+            self.plotWidget4.saveGraph4(directory)
     #Main Window definition
     def setupUi(self, MainWindow):
         self.setObjectName("MainWindow")
@@ -336,6 +448,11 @@ class MainWindow(QtWidgets.QMainWindow):
         self.tab_4.setObjectName("tab_4")
         self.tabWidget.addTab(self.tab_4, "")
         self.tab_4.setEnabled(False)
+
+        self.tab_5 = QtWidgets.QWidget()
+        self.tab_5.setObjectName("tab_5")
+        self.tabWidget.addTab(self.tab_5, "")
+        self.tab_5.setEnabled(False)
         #Title and subtitle of the main window
         self.label = QtWidgets.QLabel(self.centralwidget)
         self.label.setGeometry(QtCore.QRect(410, 10, 400, 50))
@@ -360,7 +477,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.tableWidget = QtWidgets.QTableWidget(self.tab)
         self.tableWidget.setGeometry(QtCore.QRect(420, 100, 720, 350))
         self.tableWidget.setObjectName("tableWidget")
-        self.tableWidget.setColumnCount(7)
+        self.tableWidget.setColumnCount(8)
         self.tableWidget.setRowCount(0)
         #Defining the Load Button
         self.load_db = QtWidgets.QPushButton(self.tab)
@@ -384,6 +501,14 @@ class MainWindow(QtWidgets.QMainWindow):
         self.refreshButton.setGeometry(QtCore.QRect(870, 525, 110, 25))
         self.refreshButton.setObjectName("button_refreash")
         self.refreshButton.setEnabled(False)
+        # Defining the Live Mode check box and its timer
+        self.liveModeBox = QCheckBox(self.tab)
+        self.liveModeBox.setGeometry(QtCore.QRect(990, 525, 100, 25))
+        self.liveModeBox.setObjectName("liveModeBox")
+        self.liveModeBox.setEnabled(False)
+        self.liveTimer = QtCore.QTimer(self)
+        self.tableRowById = {}
+        self.lastChangeSeq = 0
         #Defining the Notification Options Box
         self.Send_Mail = QLineEdit()
         self.Password = QLineEdit()
@@ -437,6 +562,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.button_Device.clicked.connect(self.Json_Network)
         self.button_RUN.clicked.connect(self.Verification_changes)
         self.refreshButton.clicked.connect(self.reFresh)
+        self.liveModeBox.stateChanged.connect(self.liveModeChanged)
+        self.liveTimer.timeout.connect(self.liveRefresh)
         #Defining Graphs
         self.plotWidget1 = Graph1(self.tab_2, width=12, height=4.5, dpi=100)
         self.plotWidget1.move(0, 100)
@@ -444,6 +571,14 @@ class MainWindow(QtWidgets.QMainWindow):
         self.plotWidget2.move(0, 80)
         self.plotWidget3 = Graph3(self.tab_4, width=12, height=4.5, dpi=100)
         self.plotWidget3.move(20, 100)
+        self.plotWidget4 = Graph4(self.tab_5, width=12, height=4.5, dpi=100)
+        self.plotWidget4.move(0, 100)
+        #Defining the time window selector of graph 4
+        self.timeWindowBox = QComboBox(self.tab_5)
+        self.timeWindowBox.setGeometry(QtCore.QRect(1050, 60, 100, 25))
+        self.timeWindowBox.addItems(list(TIME_WINDOWS))
+        self.timeWindowBox.setCurrentText(self.plotWidget4.window)
+        self.timeWindowBox.currentTextChanged.connect(self.timeWindowChanged)
 
         self.setCentralWidget(self.centralwidget)
         #DEfining and setting the toolbar
@@ -483,17 +618,23 @@ class MainWindow(QtWidgets.QMainWindow):
         self.actionSave3 = QtWidgets.QAction()
         self.actionSave3.setObjectName("actionSave3")
         self.actionSave3.setIcon(QtGui.QIcon(floppy_icon))
+
+        self.actionSave4 = QtWidgets.QAction()
+        self.actionSave4.setObjectName("actionSave4")
+        self.actionSave4.setIcon(QtGui.QIcon(floppy_icon))
         #Toolbar buttons connections
         self.actionExit.triggered.connect(self.Exit)
         self.actionSaveAll.triggered.connect(self.saveAllClicked)
         self.actionSave1.triggered.connect(self.save1Clicked)
         self.actionSave2.triggered.connect(self.save2Clicked)
         self.actionSave3.triggered.connect(self.save3Clicked)
+        self.actionSave4.triggered.connect(self.save4Clicked)
 
         self.menuFile.addAction(self.actionSaveAll)
         self.menuFile.addAction(self.actionSave1)
         self.menuFile.addAction(self.actionSave2)
         self.menuFile.addAction(self.actionSave3)
+        self.menuFile.addAction(self.actionSave4)
 
         self.menuFile.addAction(self.actionExit)
         self.menuAbout.addAction(self.actionAbout)
@@ -514,11 +655,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.button_Device.setText(_translate("MainWindow", "Insert Device"))
         self.button_RUN.setText(_translate("MainWindow", "Run"))
         self.refreshButton.setText(_translate("MainWindow", "Refresh ALL graphs"))
+        self.liveModeBox.setText(_translate("MainWindow", "Live mode"))
 
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab), _translate("MainWindow", "Home"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_2), _translate("MainWindow", "Graph 1"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_3), _translate("MainWindow", "Graph 2"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_4), _translate("MainWindow", "Graph 3"))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_5), _translate("MainWindow", "Alarm Rate"))
 
         self.menuFile.setTitle(_translate("MainWindow", "File      "))
         self.menuAbout.setTitle(_translate("MainWindow", "?        "))
@@ -528,6 +671,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.actionSave1.setText(_translate("MainWindow", "Save Graph 1"))
         self.actionSave2.setText(_translate("MainWindow", "Save Graph 2"))
         self.actionSave3.setText(_translate("MainWindow", "Save Graph 3"))
+        self.actionSave4.setText(_translate("MainWindow", "Save Alarm Rate Graph"))
 
 
 def __main():
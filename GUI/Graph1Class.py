@@ -4,8 +4,9 @@ Author Fabio Carminati , 05-2020
 This class defines the first graph: on the x-axis there are all the various severity levels (fetched from the config.json file )
 while on the y-axis there are the correspondent number of alarms received from each host (fetched from the local DB)
 
-The graph is updated every time the user clicks the RefreshButton on the GUI
-(i.e. we redo the plot with the new data retrieved from the local DB)
+The graph is updated every time the user clicks the RefreshButton on the GUI:
+bars, labels and legend are kept between refreshes and only their heights/positions are updated,
+new artists are created only for new hosts (the plot is redone from scratch if the severity levels change)
 
 Documentation of matplotlib has been found on: https://matplotlib.org/3.1.1/index.html
 """
@@ -19,8 +20,6 @@ import datetime
 import logging
 dirname = os.path.dirname(__file__)
 
-logging.basicConfig(filename="../log.log", level=logging.ERROR)
-
 class Graph1(FigureCanvas):
     def __init__(self, parent=None, width=5, height=5.3, dpi=100):
         self.fig = Figure(figsize=(width, height), dpi=dpi)
@@ -38,6 +37,8 @@ class Graph1(FigureCanvas):
         self.axes.tick_params(axis='x', colors='white')
         self.axes.tick_params(axis='y', colors='white')
         self.axes.text(0.5, 0.5,"No data",horizontalalignment='center',verticalalignment='center',fontsize=20)
+        # nothing has been plotted yet: the first refresh will clear the "No data" text
+        self.plottedSeverities = None
 
     #RefreshButton has been clicked
     def reFreshGraph1(self):
@@ -45,63 +46,89 @@ class Graph1(FigureCanvas):
         self.totalAlarmsPerSeverity.clear()
 
         getData = CommonFunctions()
-        results = getData.fetchDataFromDB()
+        counters = getData.fetchCountersFromDB()
 
         try:
-            if (len(results)==0):
+            if (len(counters)==0):
                 raise Exception("No plot of graph 1")
-            self.alarmsPerHost = getData.organizeAlarmsPerHost(results)
-            self.totalAlarmsPerSeverity = getData.organizeTotalAlarmsPerSeverity(results)
+            self.alarmsPerHost = getData.organizeAlarmsPerHostFromCounters(counters)
+            self.totalAlarmsPerSeverity = getData.organizeTotalAlarmsPerSeverityFromCounters(counters)
             self.plotGraph1(self.axes)
         except Exception as e:
             logging.log(logging.ERROR, "The alarm table is empty: " + str(e))
+            self.resetGraph1(self.axes)
             self.axes.text(0.5, 0.5, "Error loading data", horizontalalignment='center', verticalalignment='center', fontsize=20)
 
+    #Remove every artist: the next plotGraph1 will build the graph from scratch
+    def resetGraph1(self, ax):
+        ax.cla()
+        # self.bars/self.barLabels: keys are the host IpAddresses, items the bar container and its text labels
+        self.bars = {}
+        self.barLabels = {}
+        self.plottedSeverities = []
+        self.averageLine = None
+        self.infoText = None
+
     def plotGraph1(self, ax):
-        ax.set_xlabel("Severity Level",color='white')
-        ax.set_ylabel("Number of alarms",color='white')
-        ax.set_title("Alarms received per host ",color='white')
-
-        reverseDictionary=defaultdict(lambda: defaultdict(int))
-        ipList=[]
-        for host in sorted(self.alarmsPerHost):
-            for severity in sorted(self.alarmsPerHost[host]):
-                reverseDictionary[severity][host]=self.alarmsPerHost[host][severity]
-            ipList.append(host)
-
-        rects,descriptionList=[],[]
-        getDescription=CommonFunctions()
-        for severity in sorted(reverseDictionary):
-            descriptionList.append(getDescription.getInfo(int(severity)))
+        severities = sorted(self.totalAlarmsPerSeverity)
+        ipList = sorted(self.alarmsPerHost)
 
-        for ip in sorted(ipList):
-            means = []
-            for severity in sorted(reverseDictionary):
-                means.append(reverseDictionary[severity][ip])
-            rects.append(means)
+        # the artists are kept between refreshes: rebuild them only if the severity levels changed
+        if severities != self.plottedSeverities:
+            self.resetGraph1(ax)
+            self.plottedSeverities = severities
 
-        x = np.arange(len(self.totalAlarmsPerSeverity))
-        width = 1.5 / len(reverseDictionary)
+            ax.set_xlabel("Severity Level",color='white')
+            ax.set_ylabel("Number of alarms",color='white')
+            ax.set_title("Alarms received per host ",color='white')
 
-        for i in range(0, len(rects)):
-            bar=ax.bar(x + (i - (len(rects) - 1) / 2) * width / 2, rects[i],width / 2,label=list(ipList)[i])
-            getDescription.autolabel(bar,ax)
+        getDescription=CommonFunctions()
+        x = np.arange(len(severities))
+        width = 1.5 / len(severities)
+
+        # the legend must be rebuilt also when a host disappears, or it keeps its entry
+        hostsChanged = False
+        for host in [host for host in self.bars if host not in self.alarmsPerHost]:
+            hostsChanged = True
+            self.bars.pop(host).remove()
+            for label in self.barLabels.pop(host):
+                label.remove()
+
+        for i, ip in enumerate(ipList):
+            xCenters = x + (i - (len(ipList) - 1) / 2) * width / 2
+            means = [self.alarmsPerHost[ip][str(severity)] for severity in severities]
+
+            if ip in self.bars:
+                getDescription.updateBars(self.bars[ip], xCenters, width / 2, means)
+                getDescription.updateLabels(self.bars[ip], self.barLabels[ip])
+            else:
+                hostsChanged = True
+                self.bars[ip] = ax.bar(xCenters, means, width / 2, label=ip)
+                self.barLabels[ip] = getDescription.autolabel(self.bars[ip], ax)
 
         ax.set_xticks(x)
-        ax.set_xticklabels(descriptionList)
+        ax.set_xticklabels([getDescription.getInfo(severity) for severity in severities])
+
+        yAverageList = [self.totalAlarmsPerSeverity[severity] / len(self.alarmsPerHost) for severity in severities]
+
+        if self.averageLine is None:
+            self.averageLine, = ax.plot(severities, yAverageList, color='red', linestyle='--', marker='o',
+                                        label="Average number of alarms per severity")
+        else:
+            self.averageLine.set_data(severities, yAverageList)
 
-        yAverageList = []
-        xAverageList = []
-        for key, item in sorted(self.totalAlarmsPerSeverity.items()):
-            avg = item / len(self.alarmsPerHost)
-            yAverageList.append(avg)
-            xAverageList.append(int(key))
+        if hostsChanged:
+            ax.legend(fancybox=True, framealpha=0.2)
 
-        ax.plot(xAverageList, yAverageList, color='red', linestyle='--',marker='o', label="Average number of alarms per severity")
-        ax.legend(fancybox=True, framealpha=0.2)
         infoRefresh = "Last reFresh at time:" + datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        ax.text(0, -0.12, infoRefresh, verticalalignment='center',
-                transform=ax.transAxes,color='white')
+        if self.infoText is None:
+            self.infoText = ax.text(0, -0.12, infoRefresh, verticalalignment='center',
+                                    transform=ax.transAxes,color='white')
+        else:
+            self.infoText.set_text(infoRefresh)
+
+        ax.relim()
+        ax.autoscale_view()
 
     #The user has required to save either this graph or all the graphs
     def saveGraph1(self, directory):
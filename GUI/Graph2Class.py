@@ -5,23 +5,23 @@ Author Andrés Rodriguez
 This class defines the second graph: it describes in details the reasons why the various severity alarms have been generated
 by the various hosts
 
-The graph is updated every time the user clicks the RefreshButton on the GUI
-(i.e. we redo the plot with the new data retrieved from the local DB)
+The graph is updated every time the user clicks the RefreshButton on the GUI:
+the counters are read with a single GROUP BY query and the bars are updated in place
+(the plot is redone from scratch only if the set of hosts changes)
 
 Documentation of matplotlib has been found on: https://matplotlib.org/3.1.1/index.html
 """
 import logging
+from collections import defaultdict
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 import os
 import numpy as np
 import datetime
-from models import database_manager
+from models import storage
 from GUI.commonPlotFunctions import CommonFunctions
 dirname = os.path.dirname(__file__)
 
-logging.basicConfig(filename="../../log.log", level=logging.ERROR)
-
 class Graph2(FigureCanvas):
     def __init__(self, parent=None, width=10, height=4, dpi=100):
         self.fig = Figure(figsize=(width, height), dpi=dpi)
@@ -35,56 +35,119 @@ class Graph2(FigureCanvas):
         self.axes.tick_params(axis='x', colors='white')
         self.axes.tick_params(axis='y', colors='white')
         self.axes.text(0.5, 0.5, "No data", horizontalalignment='center', verticalalignment='center', fontsize=20)
+        # nothing has been plotted yet: the first refresh will clear the "No data" text
+        self.plottedLabels = None
+        # self.countsPerDescription: keys are the alarm descriptions, items are the counters per host IpAddress
+        self.countsPerDescription = defaultdict(lambda: defaultdict(int))
 
-    #RefreshButton has been clicked:redo the graph
+    #RefreshButton has been clicked:update the graph
     def reFreshGraph2(self):
+        try:
+            db = storage.handler().open_connection()
+            counters = db.count_alarms_by_description_and_device()
+            db.close_connection()
+
+            self.countsPerDescription.clear()
+            for description, ip, counter in counters:
+                self.countsPerDescription[description][ip] = counter
+
+            self.plotGraph2(self.axes)
+
+        except Exception as e:
+            logging.log(logging.ERROR, "something wrong opening the Data Base" + str(e))
+
+    #Live mode: add only the new rows (tuples of the alarm table) to the counters and subtract the deleted ones,
+    #without reading the whole table
+    def updateGraph2(self, newAlarms, deletedAlarms=()):
+        for alarm in newAlarms:
+            self.countsPerDescription[alarm[3]][alarm[1]] += 1
+
+        for alarm in deletedAlarms:
+            counts = self.countsPerDescription.get(alarm[3])
+            if counts is None or alarm[1] not in counts:
+                continue
+            counts[alarm[1]] -= 1
+            # no bar (and no legend entry, no host label) for what is gone
+            if counts[alarm[1]] <= 0:
+                del counts[alarm[1]]
+            if len(counts) == 0:
+                del self.countsPerDescription[alarm[3]]
 
         self.plotGraph2(self.axes)
 
-    def plotGraph2(self,axes):
-        axes.set_xlabel('IP addresses of the hosts',color='white')
-        axes.set_ylabel('Number of Alarms',color='white')
-        axes.set_title('Alarms by IP',color='white')
+    #Remove every artist: the next plotGraph2 will build the graph from scratch
+    def resetGraph2(self, axes):
+        axes.cla()
+        # self.bars: keys are the alarm descriptions, items the correspondent bar container
+        self.bars = {}
+        self.plottedLabels = []
+        self.infoText = None
 
+    def plotGraph2(self,axes):
         try:
-            db = database_manager.DBHandler().open_connection()
-            result = [tuple[1] for tuple in db.select_all()]
-            labels = set(result)
+            countsPerDescription = self.countsPerDescription
+
+            labels = sorted(set(ip for description in countsPerDescription for ip in countsPerDescription[description]))
+            alarms_description = sorted(countsPerDescription)
 
-            result = [tuple[3] for tuple in db.select_all()]
-            alarms_description = set(result)
-            rects = []
+            if len(alarms_description) == 0:
+                # no bars to draw (and no width to divide): the empty state of the other graphs
+                if self.plottedLabels is not None:
+                    self.resetGraph2(axes)
+                    self.plottedLabels = None
+                    axes.text(0.5, 0.5, "No data", horizontalalignment='center', verticalalignment='center', fontsize=20)
+                return
 
-            for alarms in alarms_description:
-                means = []
-                for ip in labels:
-                    result = db.select_count_by_device_ip(alarms,ip)
-                    means.append(result[0][0])
-                rects.append(means)
+            # the artists are kept between refreshes: rebuild them only if the hosts changed
+            if labels != self.plottedLabels:
+                self.resetGraph2(axes)
+                self.plottedLabels = labels
 
+                axes.set_xlabel('IP addresses of the hosts',color='white')
+                axes.set_ylabel('Number of Alarms')
+                axes.set_title('Alarms by IP')
+
+            updateBars = CommonFunctions()
             x = np.arange(len(labels))  # the label locations
             width = 1.5/len(alarms_description)  # the width of the bars
 
-            for i in range(0, len(rects)):
-                bar = axes.bar(x + (i - (len(rects) - 1) / 2) * width / 2, rects[i], width / 2,
-                             label=list(alarms_description)[i])
+            # the legend must be rebuilt also when a description disappears, or it keeps its entry
+            descriptionsChanged = False
+            for description in [d for d in self.bars if d not in countsPerDescription]:
+                descriptionsChanged = True
+                self.bars.pop(description).remove()
+
+            for i, description in enumerate(alarms_description):
+                xCenters = x + (i - (len(alarms_description) - 1) / 2) * width / 2
+                # get(): indexing the defaultdict would add the hosts without this description to its counters
+                means = [countsPerDescription[description].get(ip, 0) for ip in labels]
+
+                if description in self.bars:
+                    updateBars.updateBars(self.bars[description], xCenters, width / 2, means)
+                else:
+                    descriptionsChanged = True
+                    self.bars[description] = axes.bar(xCenters, means, width / 2, label=description)
                 #Decomment these rows if we want to display above the bars their heights
                 #getData = CommonFunctions()
                 #getData.autolabel(bar,axes)
 
             axes.set_xticks(x)
             axes.set_xticklabels(labels)
-            axes.legend(fancybox=True,framealpha=0.2)
+            if descriptionsChanged:
+                axes.legend(fancybox=True,framealpha=0.2)
 
             infoRefresh = "Last reFresh at time:" + datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            axes.text(0, -0.12, infoRefresh, verticalalignment='center',
-                   transform=axes.transAxes,color='white')
-            axes.set_ylabel('Number of Alarms')
-            axes.set_title('Alarms by IP')
-            db.close_connection()
+            if self.infoText is None:
+                self.infoText = axes.text(0, -0.12, infoRefresh, verticalalignment='center',
+                                          transform=axes.transAxes,color='white')
+            else:
+                self.infoText.set_text(infoRefresh)
+
+            axes.relim()
+            axes.autoscale_view()
 
         except Exception as e:
-            logging.log(logging.ERROR, "something wrong opening the Data Base" + str(e))
+            logging.log(logging.ERROR, "Cannot plot: " + str(e))
 
     #The user has required to save either this graph or all the graphs
     def saveGraph2(self, directory):
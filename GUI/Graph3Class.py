@@ -4,8 +4,8 @@ Author Fabio Carminati , 05-2020
 This class defines the third graph: for each host (for all the hosts) we analyze the received alarms: we split them according to their severity
 such that we can show their relative percentages w.r.t. the total alarms received from that host (from all the hosts).
 
-The graph is updated every time the user clicks the RefreshButton on the GUI
-(i.e. we redo the plot with the new data retrieved from the local DB)
+The graph is updated every time the user clicks the RefreshButton on the GUI:
+bar widths and percentages are updated in place, the plot is redone from scratch only if hosts or severities change
 
 Documentation of matplotlib has been found on: https://matplotlib.org/3.1.1/index.html
 """
@@ -19,8 +19,6 @@ import numpy as np
 import logging
 dirname = os.path.dirname(__file__)
 
-logging.basicConfig(filename="../log.log", level=logging.ERROR)
-
 class Graph3(FigureCanvas):
     def __init__(self, parent=None, width=10, height=5, dpi=100):
         self.fig = Figure(figsize=(width, height), dpi=dpi)
@@ -39,33 +37,41 @@ class Graph3(FigureCanvas):
         self.axes.xaxis.set_visible(False)
         self.axes.set_title("Percentage of the various alarms ",color='white')
         self.axes.text(0.5, 0.5, "No data", horizontalalignment='center', verticalalignment='center', fontsize=20)
+        # nothing has been plotted yet: the first refresh will clear the "No data" text
+        self.plottedRows = None
 
-    #RefreshButton has been clicked:redo the graph
+    #RefreshButton has been clicked:update the graph
     def reFreshGraph3(self):
         self.alarmsPerHost.clear()
         self.totalAlarmsPerSeverity.clear()
         self.percentage.clear()
 
         getNewData = CommonFunctions()
-        results = getNewData.fetchDataFromDB()
+        counters = getNewData.fetchCountersFromDB()
         try:
-            if (len(results)==0):
+            if (len(counters)==0):
                 raise Exception("No plot of graph 3")
-            self.alarmsPerHost = getNewData.organizeAlarmsPerHost(results)
-            self.totalAlarmsPerSeverity = getNewData.organizeTotalAlarmsPerSeverity(results)
+            self.alarmsPerHost = getNewData.organizeAlarmsPerHostFromCounters(counters)
+            self.totalAlarmsPerSeverity = getNewData.organizeTotalAlarmsPerSeverityFromCounters(counters)
             self.plotGraph3(self.axes)
         except Exception as e:
             logging.log(logging.ERROR, "The alarm table is empty: " + str(e))
+            self.resetGraph3(self.axes)
             self.axes.text(0.5, 0.5, "Error loading data", horizontalalignment='center', verticalalignment='center',
                            fontsize=20)
 
-    def plotGraph3(self,ax):
+    #Remove every artist: the next plotGraph3 will build the graph from scratch
+    def resetGraph3(self, ax):
+        ax.cla()
+        # cla() also resets the y axis: the first row (Overall Alarms) goes back on top
         ax.invert_yaxis()
-        ax.xaxis.set_visible(False)
-        ax.set_title("Percentage of the various alarms ", color='white')
-        ax.tick_params(axis='x', colors='white')
-        ax.tick_params(axis='y', colors='white')
+        # self.bars/self.barTexts: one bar container (and its percentages) per severity level
+        self.bars = []
+        self.barTexts = []
+        self.plottedRows = []
+        self.infoText = None
 
+    def plotGraph3(self,ax):
         getData = CommonFunctions()
         descriptionList,totalFractions = [],[]
         totAlarms=self.countAlarms(self.totalAlarmsPerSeverity)
@@ -93,31 +99,53 @@ class Graph3(FigureCanvas):
             if (len(colors_list)<len(totalFractions)):
                 raise Exception("If you want to plot, you have to define more colors in the colors_list")
 
+            # rows are categorical: the artists are rebuilt only when hosts or severities change
+            if (labels, descriptionList) != self.plottedRows:
+                self.resetGraph3(ax)
+                self.plottedRows = (labels, descriptionList)
+
+                ax.xaxis.set_visible(False)
+                ax.set_title("Percentage of the various alarms ", color='white')
+                ax.tick_params(axis='x', colors='white')
+                ax.tick_params(axis='y', colors='white')
+
             colors = colors_list[0:len(totalFractions)]
-            ax.invert_yaxis()
-            ax.xaxis.set_visible(False)
             ax.set_xlim(0, np.sum(data, axis=1).max())
 
             for i, (colname, color) in enumerate(zip(descriptionList, colors)):
                 widths = data[:, i]
                 starts = data_cum[:, i] - widths
-                ax.barh(labels, widths, left=starts, height=0.5,
-                        label=colname, color=color)
                 xcenters = starts + widths / 2
 
+                if i < len(self.bars):
+                    for rect, start, width in zip(self.bars[i], starts, widths):
+                        rect.set_x(start)
+                        rect.set_width(width)
+                else:
+                    self.bars.append(ax.barh(labels, widths, left=starts, height=0.5,
+                                             label=colname, color=color))
+                    self.barTexts.append([ax.text(x, y, "", ha='center', va='center')
+                                          for y, x in enumerate(xcenters)])
+
                 for y, (x, c) in enumerate(zip(xcenters, widths)):
                     cString=str(round(c,1))
                     if(round(c,1)<1):
                         showPercentage=""
                     else:
                         showPercentage=cString+"%"
-                    ax.text(x, y, showPercentage, ha='center', va='center')
+                    self.barTexts[i][y].set_position((x, y))
+                    self.barTexts[i][y].set_text(showPercentage)
+
+            if ax.get_legend() is None:
+                ax.legend(ncol=len(descriptionList), bbox_to_anchor=(0, -0.1),
+                          loc='lower left', fontsize='small')
 
-            ax.legend(ncol=len(descriptionList), bbox_to_anchor=(0, -0.1),
-                      loc='lower left', fontsize='small')
             infoRefresh="Last reFresh at time:"+datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            ax.text(0, -0.12, infoRefresh, verticalalignment='center',color='white',
-                    transform=ax.transAxes)
+            if self.infoText is None:
+                self.infoText = ax.text(0, -0.12, infoRefresh, verticalalignment='center',color='white',
+                                        transform=ax.transAxes)
+            else:
+                self.infoText.set_text(infoRefresh)
 
         except Exception as e:
             logging.log(logging.ERROR, "Cannot plot: " +str(e))
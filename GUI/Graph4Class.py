@@ -0,0 +1,134 @@
+"""
+This class defines the fourth graph: the alarm rate over time. On the x-axis there is the time (the 'time' column of the
+local DB, i.e. the NE condition timestamp in UTC) while on the y-axis there is the number of alarms received in each
+time bucket, one line for each severity level.
+
+The user can choose the time window (last hour, last day, last 30 days): the alarms are grouped in buckets inside the DB,
+then the lines are reduced with a min/max downsampling so that even months of history are drawn quickly.
+
+Documentation of matplotlib has been found on: https://matplotlib.org/3.1.1/index.html
+"""
+from GUI.commonPlotFunctions import CommonFunctions
+from models import storage
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+import matplotlib.dates as mdates
+import numpy as np
+import datetime
+import logging
+
+# window name: (window length, bucket length) in seconds
+TIME_WINDOWS = {'1 h': (3600, 10),
+                '24 h': (24 * 3600, 60),
+                '30 d': (30 * 24 * 3600, 300)}
+
+# maximum number of points of each line after the downsampling
+MAX_POINTS_PER_LINE = 2000
+
+
+class Graph4(FigureCanvas):
+    def __init__(self, parent=None, width=10, height=5, dpi=100):
+        self.fig = Figure(figsize=(width, height), dpi=dpi)
+        self.fig.patch.set_visible(False)
+        self.axes = self.fig.add_subplot(111)
+        FigureCanvas.__init__(self, self.fig)
+        self.setParent(parent)
+        self.window = '24 h'
+        # self.lines: keys are the severities while the items are the correspondent line artists
+        self.lines = {}
+        self.infoText = None
+        self.axes.set_xlabel("Time (UTC)",color='white')
+        self.axes.set_ylabel("Number of alarms",color='white')
+        self.axes.set_title("Alarm rate per severity",color='white')
+        self.axes.tick_params(axis='x', colors='white')
+        self.axes.tick_params(axis='y', colors='white')
+        self.axes.text(0.5, 0.5, "No data", horizontalalignment='center', verticalalignment='center', fontsize=20)
+        # nothing has been plotted yet: the first refresh will clear the "No data" text
+        self.plottedWindow = None
+
+    #The user selected another time window
+    def setWindow(self, window):
+        self.window = window
+        self.reFreshGraph4()
+
+    #RefreshButton has been clicked:update the graph
+    def reFreshGraph4(self):
+        windowLength, bucketLength = TIME_WINDOWS[self.window]
+        now = datetime.datetime.utcnow()
+        since = now - datetime.timedelta(seconds=windowLength)
+
+        try:
+            db = storage.handler().open_connection()
+            buckets = db.count_alarms_per_time_bucket(since.strftime('%Y-%m-%d %H:%M:%S'), bucketLength)
+            db.close_connection()
+
+            self.plotGraph4(self.axes, buckets, since, now, bucketLength)
+        except Exception as e:
+            logging.log(logging.ERROR, "something wrong opening the Data Base" + str(e))
+
+    #Remove every artist: the next plotGraph4 will build the graph from scratch
+    def resetGraph4(self, ax):
+        ax.cla()
+        self.lines = {}
+        self.infoText = None
+
+    def plotGraph4(self, ax, buckets, since, now, bucketLength):
+        if self.window != self.plottedWindow:
+            self.resetGraph4(ax)
+            self.plottedWindow = self.window
+
+            ax.set_xlabel("Time (UTC)",color='white')
+            ax.set_ylabel("Alarms every " + str(bucketLength) + " s",color='white')
+            ax.set_title("Alarm rate per severity (last " + self.window + ")",color='white')
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d %H:%M'))
+
+        # dense grid of buckets: the DB returns only the non-empty ones
+        epoch = datetime.datetime(1970, 1, 1)
+        first = int((since - epoch).total_seconds()) // bucketLength * bucketLength
+        last = int((now - epoch).total_seconds()) // bucketLength * bucketLength
+        bucketStarts = np.arange(first, last + bucketLength, bucketLength)
+
+        countsPerSeverity = {}
+        for bucket, severity, counter in buckets:
+            if bucket is None:  # time in a format sqlite doesn't understand
+                continue
+            counts = countsPerSeverity.setdefault(int(severity), np.zeros(len(bucketStarts), dtype=np.int64))
+            index = (bucket - first) // bucketLength
+            if 0 <= index < len(bucketStarts):
+                counts[index] += counter
+
+        getData = CommonFunctions()
+        xDates = bucketStarts / 86400.0 + mdates.date2num(epoch)  # matplotlib dates are days
+
+        for severity in [s for s in self.lines if s not in countsPerSeverity]:
+            self.lines.pop(severity).remove()
+
+        severitiesChanged = False
+        for severity in sorted(countsPerSeverity):
+            x, y = getData.minMaxDownsample(xDates, countsPerSeverity[severity], MAX_POINTS_PER_LINE)
+            if severity in self.lines:
+                self.lines[severity].set_data(x, y)
+            else:
+                severitiesChanged = True
+                self.lines[severity], = ax.plot(x, y, drawstyle='steps-post', linewidth=1,
+                                                label=getData.getInfo(severity))
+
+        if severitiesChanged and len(self.lines) > 0:
+            ax.legend(fancybox=True, framealpha=0.2)
+
+        infoRefresh = "Last reFresh at time:" + datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if self.infoText is None:
+            self.infoText = ax.text(0, -0.12, infoRefresh, verticalalignment='center',
+                                    transform=ax.transAxes,color='white')
+        else:
+            self.infoText.set_text(infoRefresh)
+
+        ax.set_xlim(xDates[0], xDates[-1])
+        ax.relim()
+        ax.autoscale_view(scalex=False)
+
+    #The user has required to save either this graph or all the graphs
+    def saveGraph4(self, directory):
+        path = directory + "\graph4.png"
+        saveObject = CommonFunctions()
+        saveObject.saveSingleGraph(path, self.fig, 4)
@@ -4,23 +4,27 @@ Author Fabio Carminati , 05-2020
 This class contains methods that are common amid the graph classes
 
 """
-from models.database_manager import DBHandler
+from models import storage
 from models.config_manager import ConfigManager
 from collections import defaultdict
 import logging
-import os
-
-logfile = os.path.join(os.path.dirname(__file__), '../log.log')
-logging.basicConfig(filename=logfile, level=logging.ERROR)
 
 class CommonFunctions(object):
     def fetchDataFromDB(self):
-        alarmTable = DBHandler()
+        alarmTable = storage.handler()
         alarmTable.open_connection()
         results = alarmTable.select_all()
         alarmTable.close_connection()
         return results
 
+    # Reads the alarm counters rollup: one row per (host, severity, ceased) instead of the whole history
+    def fetchCountersFromDB(self):
+        alarmTable = storage.handler()
+        alarmTable.open_connection()
+        counters = alarmTable.select_alarm_counters()
+        alarmTable.close_connection()
+        return counters
+
     def organizeAlarmsPerHost(self,results):
         alarmsPerHost=defaultdict(lambda: defaultdict(int))
 
@@ -49,6 +53,39 @@ class CommonFunctions(object):
                 totalAlarmsPerSeverity[item] = 0
         return totalAlarmsPerSeverity
 
+    # Same output of organizeAlarmsPerHost, built from the rows of fetchCountersFromDB
+    # ceased=None counts both active and ceased alarms, 0 only the active ones and 1 only the ceased ones
+    def organizeAlarmsPerHostFromCounters(self, counters, ceased=None):
+        alarmsPerHost = defaultdict(lambda: defaultdict(int))
+
+        for host, severity, isCeased, counter in counters:
+            if ceased is None or isCeased == ceased:
+                alarmsPerHost[host][str(severity)] += counter
+
+        config_manager = ConfigManager()
+        severity_levels = config_manager.get_severity_levels()
+
+        for key, item in severity_levels.items():
+            for host in alarmsPerHost:
+                if str(item) not in alarmsPerHost[host]:
+                    alarmsPerHost[host][str(item)] = 0
+        return alarmsPerHost
+
+    # Same output of organizeTotalAlarmsPerSeverity, built from the rows of fetchCountersFromDB
+    def organizeTotalAlarmsPerSeverityFromCounters(self, counters, ceased=None):
+        totalAlarmsPerSeverity = defaultdict(int)
+        for host, severity, isCeased, counter in counters:
+            if ceased is None or isCeased == ceased:
+                totalAlarmsPerSeverity[int(severity)] += counter
+
+        config_manager = ConfigManager()
+        severity_levels = config_manager.get_severity_levels()
+
+        for key, item in severity_levels.items():
+            if item not in totalAlarmsPerSeverity:
+                totalAlarmsPerSeverity[item] = 0
+        return totalAlarmsPerSeverity
+
     # Given the severity index it returns its description
     def getInfo(self, element):
         _config_manager = ConfigManager()
@@ -64,10 +101,50 @@ class CommonFunctions(object):
 
     #Attach a text label above each bar in *rects*, displaying its height
     def autolabel(self, rects, axes):
+        labels = []
         for rect in rects:
             height = rect.get_height()
-            axes.annotate('{}'.format(height),
+            labels.append(axes.annotate('{}'.format(height),
             xy=(rect.get_x() + rect.get_width() / 2, height),
                 xytext=(0, 3),  # 3 points vertical offset
                 textcoords="offset points",
-                ha='center', va='bottom')
\ No newline at end of file
+                ha='center', va='bottom'))
+        return labels
+
+    #Move the labels returned by autolabel on top of the (already updated) bars, instead of creating new ones
+    def updateLabels(self, rects, labels):
+        for rect, label in zip(rects, labels):
+            height = rect.get_height()
+            label.set_text('{}'.format(height))
+            label.xy = (rect.get_x() + rect.get_width() / 2, height)
+
+    #Update in place position, width and height of the bars in *rects*
+    def updateBars(self, rects, xCenters, width, heights):
+        for rect, x, height in zip(rects, xCenters, heights):
+            rect.set_x(x - width / 2)
+            rect.set_width(width)
+            rect.set_height(height)
+
+    #Reduce (x, y) to at most maxPoints points keeping, for each group of consecutive samples, its min and its max.
+    #Peaks survive the downsampling, so a line plot looks the same as the one with all the samples
+    def minMaxDownsample(self, x, y, maxPoints):
+        import numpy as np  # imported here: the telegram bot uses this class too and doesn't need numpy
+        x, y = np.asarray(x), np.asarray(y)
+        groups = maxPoints // 2
+        if groups < 1 or len(y) <= maxPoints:
+            return x, y
+
+        groupSize = int(np.ceil(len(y) / groups))
+        padding = groups * groupSize - len(y)
+        # the last group is padded repeating its last sample, it changes neither its min nor its max
+        yGroups = np.concatenate([y, np.repeat(y[-1], padding)]).reshape(groups, groupSize)
+        xGroups = np.concatenate([x, np.repeat(x[-1], padding)]).reshape(groups, groupSize)
+
+        rows = np.arange(groups)
+        minIndex, maxIndex = yGroups.argmin(axis=1), yGroups.argmax(axis=1)
+        # keep the two points of each group in their original order
+        first, second = np.minimum(minIndex, maxIndex), np.maximum(minIndex, maxIndex)
+
+        xResult = np.column_stack([xGroups[rows, first], xGroups[rows, second]]).ravel()
+        yResult = np.column_stack([yGroups[rows, first], yGroups[rows, second]]).ravel()
+        return xResult, yResult
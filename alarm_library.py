@@ -2,146 +2,398 @@
 Author Emanuele Gallone, 05-2020
 
 a bunch of useful methods retrieving alarms from SDN devices using NETCONF.
-uses a façade pattern exposing only one method.
+uses a façade pattern: start_threads() polls the devices of the config.json,
+AlarmCollector polls any device inventory it is built with.
+Importing this module has no side effects: nothing is read until a collector is built.
 
 """
 
-import threading, time, traceback, logging, os
+import threading, logging, os, multiprocessing, functools, time
 
-from models.database_manager import DBHandler
+from models import storage
 from models.config_manager import ConfigManager
 from models.device import Device
 from models.customXMLParser import CustomXMLParser
+from models.hash_ring import partition_devices
+from models.poll_scheduler import PollScheduler
+from models.adaptive_rate import AdaptiveRate, alarms_fingerprint
+from models.circuit_breaker import CircuitBreaker
+from models import log_manager, metrics, tracing
+from models.instrumented_lock import InstrumentedLock
 
 from ncclient import manager
-from typing import List
+from typing import Dict, List
 
-####################setting up globals###################
+lock = InstrumentedLock('alarm_library')  # wait and hold times per caller on /debug/locks
 
-logging.basicConfig(filename="log.log", level=logging.ERROR)
+POLLS = metrics.counter('alarm_polls_total', 'polls of the devices by outcome (ok, unreachable, breaker_open)',
+                        ['device', 'outcome'])
+POLL_SECONDS = metrics.histogram('alarm_poll_seconds', 'time to connect to a device and get its alarms')
+PARSE_SECONDS = metrics.histogram('alarm_parse_seconds', 'time to parse the alarms of a poll')
+POLL_INTERVAL = metrics.gauge('alarm_poll_interval_seconds', 'effective seconds between two polls', ['device'])
+ALARMS_PARSED = metrics.counter('alarms_parsed_total', 'alarms parsed from the polls')
+ALARMS_DEDUPED = metrics.counter('alarms_deduped_total', 'parsed alarms already in DB, not inserted again')
+ALARMS_INSERTED = metrics.counter('alarms_inserted_total', 'alarms inserted in DB')
+ALARM_INSERT_ERRORS = metrics.counter('alarm_insert_errors_total', 'alarms that could not be inserted in DB')
+WRITER_QUEUE_DEPTH = metrics.gauge('alarm_writer_queue_depth', 'polls waiting for the writer (sharded mode)')
 
-config_m = ConfigManager()
+# the only keys of the parsed alarms that are saved in DB (see CustomXMLParser.parse_all_alarms_xml())
+_ALARM_KEYS = ('notification-code', 'condition-description', 'ne-condition-timestamp')
+# ... plus the epoch when the poll got them, added by _parse() and saved with them
+_INGESTED_KEY = 'ingested'
+_QUEUED_KEYS = _ALARM_KEYS + (_INGESTED_KEY,)
 
-# reading the config.json and creating the devices
-devices = [Device(d['device_ip'],
-                  d['netconf_fetch_rate_in_sec'],
-                  d['netconf_port'],
-                  d['netconf_user'],
-                  d['netconf_password'])
-           for d in config_m.get_network_params()]
 
-lock = threading.Lock()
-
-
-#########################################
-
-
-def _worker(_delay, task, *args):
-    # todo specify thread's stop condition? maybe through a SIGINT
+def load_devices(config_manager=None) -> List:
     """
-    worker definition for thread task
-
-    @param _delay: it specifies the delay in which the task will be performed
-    @param task: pointer to the function that will be executed by the thread
-    @param args: list of arguments that will be passed to the task's parameters
-    @return: void
+    reads the devices listed under 'Network' inside the config.json
+    @param config_manager: ConfigManager to read from (a new one if None)
+    @return: list of Device objects
     """
-    next_time = time.time() + _delay
-    while True:
-        time.sleep(max(0, next_time - time.time()))  # making the threads not wasting CPU cycles
+    if config_manager is None:
+        config_manager = ConfigManager()
 
-        try:
-            task(*args)
-        except Exception:
-            traceback.print_exc()
+    jitter = config_manager.get_poll_jitter()
 
-            logging.exception("Problem while trying to retrieve alarms' data.")
-            # skip tasks if we are behind schedule: todo: refactor using schedule library
-        next_time += (time.time() - next_time) // _delay * _delay + _delay
+    return [Device(d['device_ip'],
+                   d['netconf_fetch_rate_in_sec'],
+                   d['netconf_port'],
+                   d['netconf_user'],
+                   d['netconf_password'],
+                   d.get('netconf_fetch_jitter', jitter))
+            for d in config_manager.get_network_params()]
 
 
+@functools.lru_cache(maxsize=1)
 def _detail_dummy_data_fetch() -> str:
     """
     I created this method to have a dummy data in case a device goes down or VPN isn't working
-    NB: for testing purpose only
+    NB: for testing purpose only (Simulation_mode). The file is read once and kept in memory
     @return: xml in string format
     """
 
     filename = os.path.join(os.path.dirname(__file__), 'dummy_data.xml')
-    string_result = ''
 
     with open(filename, 'r') as _file:
-        for _line in _file:
-            # if "<?xml " in line:  # remove the xml prolog
-            #     continue
+        return ''.join(_line.rstrip() for _line in _file)
+
+
+def _parse(_xml, ingested) -> List:
+    """@param ingested: epoch when the xml was received, stored in every alarm (end to end latency)"""
+    with PARSE_SECONDS.time(), tracing.span('parse'):
+        alarms = CustomXMLParser(_xml).parse_all_alarms_xml()
 
-            string_result += (_line.rstrip())
+    for alarm in alarms:
+        alarm[_INGESTED_KEY] = ingested
 
-    return string_result
+    ALARMS_PARSED.inc(len(alarms))
 
+    return alarms
 
-def _thread_get_alarms(device):
+
+class AlarmCollector(object):
     """
-    this method is ran by the various threads. It is the core concept of the alarm library
-    @param device: Device object containing all the informations. (see models/device.py)
-    @return: void
+    retrieves the alarms of a device inventory and saves them in the DB.
+    Nothing is read or started until it is explicitly asked: build it with the devices you want to poll
+    (or with from_config()) and call start().
     """
-    try:
-        _xml = _get_alarms_xml(device)  # try to connect to netconf
 
-    except Exception as e:  # in case the device or vpn are down, load dummy data (Testing Purpose)
+    def __init__(self, devices, config_manager=None, sink=None, coordinator=None):
+        """
+        @param devices: list of Device objects to poll (see models/device.py)
+        @param config_manager: ConfigManager used for severities and flags (a new one if None)
+        @param sink: function(host, parsed_metadata) receiving the parsed alarms of every poll.
+                     If None they are saved in DB by save_to_db()
+        @param coordinator: ClusterCoordinator (see models/cluster_coordinator.py). If given, only the devices
+                            of the shards owned by this node are polled
+        """
+        self.devices = list(devices)
+        self._config_manager = config_manager if config_manager is not None else ConfigManager()
+        self._sink = sink if sink is not None else self.save_to_db
+        self._coordinator = coordinator
+        self._adaptive_rate = AdaptiveRate.from_config(self._config_manager)  # None if not enabled
+        self._simulation_mode = self._config_manager.get_simulation_mode()
+        self._breakers = {device.ip: CircuitBreaker.from_config(self._config_manager) for device in self.devices}
+        self.scheduler = None
+
+    @classmethod
+    def from_config(cls, config_manager=None, coordinator=None):
+        """@return: an AlarmCollector for all the devices listed inside the config.json"""
+        if config_manager is None:
+            config_manager = ConfigManager()
+
+        return cls(load_devices(config_manager), config_manager, coordinator=coordinator)
+
+    def poll(self, device):
+        """
+        this method is ran by the various threads. It is the core concept of the alarm library
+        @param device: Device object containing all the informations. (see models/device.py)
+        @return: void
+        """
+        if self._coordinator is not None and not self._coordinator.owns(device.ip):
+            return  # another node of the cluster is polling it
+
+        with tracing.trace('poll', device=device.ip):  # sampled: see models/tracing.py
+            alarms, reachable = self._fetch(device)
 
-        logging.log(logging.ERROR, "Could not retrieve data from netconf! switching to dummy data\n" + str(e))
-        _xml = _detail_dummy_data_fetch()
+            if alarms is not None:
+                self._sink(device.ip, alarms)  # finally save the information in DB
 
-    alarms_metadata = CustomXMLParser(_xml).parse_all_alarms_xml()
+        if self._adaptive_rate is not None and self.scheduler is not None:
+            fingerprint = alarms_fingerprint(alarms, _ALARM_KEYS) if alarms is not None else None
+            rate = self._adaptive_rate.observe(device.ip, fingerprint, reachable)
+            self.scheduler.set_interval(device.ip, rate)
+            POLL_INTERVAL.labels(device.ip).set(rate)
 
-    #_check_if_alarm_has_ceased(host, alarms_metadata) # to be implemented
+    def fetch_alarms(self, device) -> List:
+        """
+        @param device: Device object containing all the informations. (see models/device.py)
+        @return: the alarms of the device, as returned by CustomXMLParser.parse_all_alarms_xml().
+                 None if the device could not be reached (and the simulation mode is off)
+        """
+        return self._fetch(device)[0]
 
-    _thread_save_to_db(device.ip, alarms_metadata)  # finally save the information in DB
+    def get_breaker_states(self) -> Dict:
+        """@return: dict device ip -> state of its circuit breaker ('closed', 'open' or 'half-open')"""
+        return {ip: breaker.state for ip, breaker in self._breakers.items()}
 
+    def get_polling_rates(self) -> Dict:
+        """@return: dict device ip -> effective seconds between two polls (adapted, if the adaptive mode is on)"""
+        if self.scheduler is None:
+            return {device.ip: device.netconf_rate for device in self.devices}
 
-def _thread_save_to_db(host, parsed_metadata):
-    """
-    method used by the various threads to save inside the local.db all the metadata that we need.
-    Here the things gets a little tricky:
-    basically, parsed_metadata is a list of dictionaries. Each dictionary is an alarm.
-    If you want to know how the dictionary is built look at _parse_all_alarms_xml(_root)
+        return {ip: stats['interval'] for ip, stats in self.scheduler.stats().items()}
 
-    @param host: specifies the host IP
-    @param parsed_metadata: is a list of dictionaries that is coming from the method '_parse_all_alarms_xml(_root)'
-    @return: void
-    """
+    def _fetch(self, device):
+        """
+        contacts the device only if its circuit breaker allows it: an unreachable device costs one probe
+        (with the shorter Probe_connect_timeout_in_sec) every reset timeout, instead of a full connect timeout per poll
 
-    _config_manager = ConfigManager()
-    flag = _config_manager.get_alarm_dummy_data_flag()
+        @return: (alarms of the device or None, False if it could not be reached)
+        """
+        breaker = self._breakers.get(device.ip)
+        if breaker is None:  # device added after the collector was built
+            breaker = self._breakers.setdefault(device.ip, CircuitBreaker.from_config(self._config_manager))
 
-    if flag == True:  # we do not want to save again the same alarms (DEBUG), should refactor this to be clearer
-        parsed_metadata = __filter_if_alarm_exists_in_db(host, parsed_metadata)
+        if breaker.allow_request():
+            timeout = self._config_manager.get_probe_connect_timeout() if breaker.is_probing() \
+                else self._config_manager.get_connect_timeout()
 
-    for alarm_dict in parsed_metadata:
+            try:
+                with POLL_SECONDS.time(), tracing.span('netconf_get', timeout=timeout):
+                    _xml = _get_alarms_xml(device, timeout)  # try to connect to netconf
 
-        try:
-            lock.acquire()  # need to lock also here because sqlite is s**t
+            except Exception as e:
+                breaker.record_failure()
+                POLLS.labels(device.ip, 'unreachable').inc()
+                logging.log(logging.ERROR, f"Could not retrieve data from netconf of {device.ip} "
+                                           f"(circuit breaker {breaker.state})\n" + str(e))
 
-            severity_levels = config_m.get_severity_levels()
-            severity = severity_levels[alarm_dict['notification-code']]
-            description = alarm_dict['condition-description']
-            timestamp = alarm_dict['ne-condition-timestamp']
+            else:
+                breaker.record_success()
+                POLLS.labels(device.ip, 'ok').inc()
 
-            db_handler = DBHandler().open_connection()
+                #_check_if_alarm_has_ceased(host, alarms_metadata) # to be implemented
 
-            db_handler.insert_row_alarm(device_ip=host,
-                                        severity=severity,
-                                        description=description,
-                                        _time=timestamp)
-            db_handler.close_connection()
+                # outside the try: a bad reply is not an unreachable device, the breaker must not open for it
+                return _parse(_xml, time.time()), True
+        else:
+            POLLS.labels(device.ip, 'breaker_open').inc()
 
-        except Exception as e:
-            logging.log(logging.ERROR, str(e))
+        if self._simulation_mode:  # the device or vpn are down, load dummy data (Testing Purpose)
+            return _parse(_detail_dummy_data_fetch(), time.time()), False
 
+        return None, False
+
+    def save_to_db(self, host, parsed_metadata):
+        """
+        method used by the various threads to save inside the local.db all the metadata that we need.
+        Here the things gets a little tricky:
+        basically, parsed_metadata is a list of dictionaries. Each dictionary is an alarm.
+        If you want to know how the dictionary is built look at CustomXMLParser.parse_all_alarms_xml()
+
+        @param host: specifies the host IP
+        @param parsed_metadata: is a list of dictionaries that is coming from CustomXMLParser.parse_all_alarms_xml()
+        @return: void
+        """
+
+        with tracing.span('save_to_db', alarms=len(parsed_metadata)):
+            flag = self._config_manager.get_alarm_dummy_data_flag()
+
+            # we do not want to save again the same alarms (DEBUG), should refactor this to be clearer
+            if flag == True:
+                parsed_count = len(parsed_metadata)
+                with tracing.span('filter_existing'):
+                    parsed_metadata = self._filter_if_alarm_exists_in_db(host, parsed_metadata)
+                ALARMS_DEDUPED.inc(parsed_count - len(parsed_metadata))
+
+            severity_levels = self._config_manager.get_severity_levels()
+            alarms = []
+
+            for alarm_dict in parsed_metadata:
+                try:
+                    alarms.append((host,
+                                   severity_levels[alarm_dict['notification-code']],
+                                   alarm_dict['condition-description'],
+                                   alarm_dict['ne-condition-timestamp'],
+                                   alarm_dict.get(_INGESTED_KEY)))
+
+                except Exception as e:  # e.g. a notification code missing in the Severity_levels
+                    ALARM_INSERT_ERRORS.inc()
+                    logging.log(logging.ERROR, str(e))
+
+            if len(alarms) == 0:
+                return
+
+            try:
+                with lock:  # need to lock also here because sqlite is s**t
+                    db_handler = storage.handler().open_connection()
+                    try:
+                        db_handler.insert_alarms(alarms)  # the alarms of a poll in a single commit
+                    finally:
+                        db_handler.close_connection()
+                ALARMS_INSERTED.inc(len(alarms))
+
+            except Exception as e:
+                ALARM_INSERT_ERRORS.inc(len(alarms))
+                logging.log(logging.ERROR, str(e))
+
+    def _filter_if_alarm_exists_in_db(self, host, array) -> List:
+        """
+        helper method to avoid the repetition of inserting existing alarms in db.
+        It is used due to not having the possibility to create alarms ourselves.
+        By not using this filter, every new alarms fetched through netconf will be seen as a 'new' alarm.
+
+        @param host: device ip
+        @param array: list of dict where each dict is an alarm
+        @return: list of dict alarms, where these alarms are not present in db
+        """
+
+        # needed for parsing the alarm notification code from text to int
+        _severity_levels = self._config_manager.get_severity_levels()
+
+        # element of array is a dict, each dict is an alarm
+        keys = [(_dict['ne-condition-timestamp'], _severity_levels[_dict['notification-code']]) for _dict in array]
+
+        _db_handler = storage.handler().open_connection()
+        try:
+            new_keys = set(_db_handler.filter_new_alarms(host, keys))  # a single query for the whole poll
         finally:
-            lock.release()
+            _db_handler.close_connection()
+
+        return [_dict for _dict, key in zip(array, keys) if key in new_keys]
+
+    def start(self) -> List:
+        """
+        schedules the polls of every device of the inventory (see models/poll_scheduler.py):
+        a single scheduler thread dispatches them to a pool of Poll_workers threads
+
+        @return: List of threads that need to be joined outside
+        """
+        self.scheduler = PollScheduler(self._config_manager.get_poll_workers())
+
+        for device in self.devices:
+            if self._adaptive_rate is not None:
+                self._adaptive_rate.register(device.ip, device.netconf_rate)
+            POLL_INTERVAL.labels(device.ip).set(device.netconf_rate)
+
+            self.scheduler.add(device.ip, device.netconf_rate, self.poll, device, jitter=device.jitter)
+
+        return [self.scheduler.start()]
+
+    def stop(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+
+class _QueueSink(object):
+    """sink of the shard processes: sends the parsed alarms to the writer as compact tuples"""
+
+    def __init__(self, _queue):
+        self._queue = _queue
+
+    def __call__(self, host, parsed_metadata):
+        self._queue.put((host, [tuple(_dict.get(key) for key in _QUEUED_KEYS) for _dict in parsed_metadata]))
+
+
+def _shard_main(devices, _queue):
+    """entry point of a shard process: it polls and parses its devices and never touches the DB"""
+    log_manager.setup_logging()  # spawned: nothing of the parent's logging is inherited
+    threads = AlarmCollector(devices, sink=_QueueSink(_queue)).start()
+
+    for t in threads:
+        t.join()
+
+
+class ShardedAlarmCollector(object):
+    """
+    splits the device inventory in shards (consistent hashing on the device ip) polled by separate processes,
+    so that XML parsing and the per-alarm work scale with the cores instead of sharing one GIL.
+    The processes send their parsed alarms to a single writer thread, the only one writing in DB.
+    """
+
+    def __init__(self, devices, processes=None, config_manager=None):
+        """
+        @param devices: list of Device objects to poll
+        @param processes: number of shard processes (number of cores if None or 0)
+        @param config_manager: ConfigManager used by the writer (a new one if None)
+        """
+        self.devices = list(devices)
+        self.processes = processes if processes else os.cpu_count()
+        self._writer = AlarmCollector([], config_manager)
+        # spawn instead of fork: the parent can have other threads running (GUI, notifier, bot)
+        self._context = multiprocessing.get_context('spawn')
+        self._queue = self._context.Queue()
+
+    @classmethod
+    def from_config(cls, config_manager=None):
+        """@return: a ShardedAlarmCollector for all the devices listed inside the config.json"""
+        if config_manager is None:
+            config_manager = ConfigManager()
+
+        return cls(load_devices(config_manager), config_manager.get_shard_processes(), config_manager)
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+
+            if item is None:  # stop() has been called
+                return
+
+            host, alarms = item
+
+            try:
+                self._writer.save_to_db(host, [dict(zip(_QUEUED_KEYS, alarm)) for alarm in alarms])
+            except Exception:
+                logging.exception("Problem while saving the alarms of " + str(host))
+
+    def start(self) -> List:
+        """
+        starts the shard processes and the writer thread
+
+        @return: List of processes and threads that need to be joined outside
+        """
+        workers = []
+
+        for shard in partition_devices(self.devices, self.processes):
+            if len(shard) == 0:
+                continue
+
+            _p = self._context.Process(target=_shard_main, args=(shard, self._queue), daemon=True)
+            _p.start()
+            workers.append(_p)
+
+        WRITER_QUEUE_DEPTH.set_function(self._queue.qsize)
+
+        writer = threading.Thread(target=self._write, name='alarm-writer')
+        writer.start()
+        workers.append(writer)
+
+        return workers
+
+    def stop(self):
+        """stops the writer thread (the shard processes are daemons and die with the main process)"""
+        self._queue.put(None)
 
 
 def _check_if_alarm_has_ceased(host, alarms):
@@ -156,7 +408,7 @@ def _check_if_alarm_has_ceased(host, alarms):
 
     raise NotImplementedError
 
-    _db_handler = DBHandler()
+    _db_handler = storage.handler()
 
     _db_handler.open_connection()
 
@@ -179,50 +431,19 @@ def _check_if_alarm_has_ceased(host, alarms):
             print("alarm ceased: " + str(_alarm_id))
 
 
-def __filter_if_alarm_exists_in_db(host, array) -> List:
-    """
-    helper method to avoid the repetition of inserting existing alarms in db.
-    It is used due to not having the possibility to create alarms ourselves.
-    By not using this filter, every new alarms fetched through netconf will be seen as a 'new' alarm.
-
-    @param host: device ip
-    @param array: list of dict where each dict is an alarm
-    @return: list of dict alarms, where these alarms are not present in db
-    """
-
-    _filtered_alarms = []
-
-    _db_handler = DBHandler()
-    _db_handler.open_connection()
-
-    _severity_levels = config_m.get_severity_levels()  # needed for parsing the alarm notification code from text to int
-
-    for _dict in array:  # element of array is a dict, each dict is an alarm
-        severity = _severity_levels[_dict['notification-code']]
-        timestamp = _dict['ne-condition-timestamp']
-
-        _result = _db_handler.select_alarm_by_host_time_severity(host, timestamp, severity)
-
-        if len(_result) == 0:
-            _filtered_alarms.append(_dict)
-
-    _db_handler.close_connection()
-
-    return _filtered_alarms
-
-
-def _get_alarms_xml(device) -> str:
+def _get_alarms_xml(device, timeout=10) -> str:
     """
     method that connect to the specified host,port using the credentials specified in user,password to retrieve
     alarm information
     @param device: Device object containing all the informations (see models/device.py)
+    @param timeout: seconds allowed to connect and to get the answer
     @return: xml from netconf, as a string
     """
     with manager.connect(host=device.ip,
                          port=device.netconf_port,
                          username=device.user,
                          password=device.password,
-                         timeout=10,
+                         timeout=timeout,
                          hostkey_verify=False) as conn:
 
         retrieve_all_alarms_criteria = """
@@ -239,22 +460,16 @@ def _get_alarms_xml(device) -> str:
 def start_threads() -> List:
     """
     method available on the outside. it start all the magic to retrieve the alarms on the devices
-    listed inside the config.json. It starts a thread for each device found in the config.json file
+    listed inside the config.json. The polls of all the devices are scheduled by a single PollScheduler
 
     @return: List of threads that need to be joined outside
     """
-    _threads = []
-
-    for device in devices:
-        _t = threading.Thread(target=lambda: _worker(device.netconf_rate, _thread_get_alarms, device))
-        _t.start()
-        _threads.append(_t)
-
-    return _threads
+    return AlarmCollector.from_config().start()
 
 
 if __name__ == "__main__":
     # DEBUG
+    log_manager.setup_logging()
 
     threads = start_threads()
 
@@ -0,0 +1,5 @@
+"""
+Benchmark suite of the alarm pipeline: parser, DB, notifier, graphs and end-to-end latency.
+The datasets are generated with fixed seeds, so the results of two versions can be compared.
+usage: python -m benchmarks --help
+"""
@@ -0,0 +1,112 @@
+"""
+runs the benchmarks and prints (or writes) the results as JSON
+
+    python -m benchmarks --quick --output results.json
+    python -m benchmarks --only parser,db --compare results.json
+
+--compare prints, for every measure, the change in percent against a previous results file.
+Durations (_ms, _sec) are better when lower, throughputs (_per_sec) when higher.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict
+
+from models.config_manager import ConfigManager
+from models.lazy_import import timed_import
+
+SUITES = {'parser': 'benchmarks.bench_parser',
+          'db': 'benchmarks.bench_db',
+          'notifier': 'benchmarks.bench_notifier',
+          'graphs': 'benchmarks.bench_graphs',
+          'end_to_end': 'benchmarks.bench_end_to_end'}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              timeout=10).stdout.strip()
+    except Exception:
+        return ''
+
+
+def _flatten(results, prefix='') -> Dict:
+    """@return: dict 'suite.case.measure' -> number"""
+    flat = {}
+
+    for key, value in results.items():
+        name = f'{prefix}.{key}' if prefix else key
+
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+
+    return flat
+
+
+def compare(previous, current) -> str:
+    """@return: one line per measure present in both results: previous, current and change in percent"""
+    before, after = _flatten(previous['results']), _flatten(current['results'])
+    lines = [f"{previous['meta'].get('commit', '?')} -> {current['meta'].get('commit', '?')}"]
+
+    for name in sorted(set(before) & set(after)):
+        if name.endswith('.count') or before[name] == 0:
+            continue
+
+        change = (after[name] - before[name]) / before[name] * 100
+        worse = change < 0 if name.endswith('_per_sec') else change > 0
+        flag = '  <-- worse' if worse and abs(change) >= 10 else ''
+
+        lines.append(f'{name:70s} {before[name]:14.3f} {after[name]:14.3f} {change:+8.1f}%{flag}')
+
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='benchmarks of the alarm pipeline')
+    parser.add_argument('--quick', action='store_true', help='smaller datasets (e.g. no 1M rows table)')
+    parser.add_argument('--only', help='comma separated suites among ' + ', '.join(SUITES))
+    parser.add_argument('--output', help='file where to write the results (stdout if missing)')
+    parser.add_argument('--compare', help='results file of a previous run to compare with')
+    args = parser.parse_args()
+
+    suites = args.only.split(',') if args.only else list(SUITES)
+    unknown = [name for name in suites if name not in SUITES]
+    if len(unknown) > 0:
+        parser.error('unknown suites: ' + ', '.join(unknown))
+
+    report = {'meta': {'version': ConfigManager().get_version(),
+                       'commit': _git_commit(),
+                       'date': datetime.now().isoformat(timespec='seconds'),
+                       'python': sys.version.split()[0],
+                       'platform': platform.platform(),
+                       'quick': args.quick},
+              'results': {}}
+
+    for name in suites:
+        start = time.perf_counter()
+        print(f'running {name}...', file=sys.stderr)
+
+        report['results'][name] = timed_import(SUITES[name]).run(args.quick)
+        report['meta'][f'{name}_sec'] = time.perf_counter() - start
+
+    output = json.dumps(report, indent=4)
+
+    if args.output:
+        with open(args.output, 'w') as _file:
+            _file.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as _file:
+            print(compare(json.load(_file), report), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
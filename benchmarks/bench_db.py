@@ -0,0 +1,100 @@
+"""insert and select throughput of the storage backends (sqlite and log store) on tables of 10k and 1M rows"""
+import os
+import tempfile
+from typing import Dict
+
+from benchmarks.datasets import device_ip, fill_db, fill_log_store
+from benchmarks.timing import durations, summary, throughput
+from models import log_store
+from models.database_manager import DBHandler
+from models.log_store import LogStore
+
+
+def _insert_one_per_connection(backend, db_url, rows):
+    # the worst case: a connection (and a commit) per alarm
+    for i in range(rows):
+        db = backend(db_url).open_connection()
+        db.insert_row_alarm(device_ip(i % 100), str(i % 6), 'benchmark', f'2030-01-01 00:00:{i % 60:02d}.{i:04d}')
+        db.close_connection()
+
+
+def _insert_in_one_connection(backend, db_url, rows):
+    db = backend(db_url).open_connection()
+    for i in range(rows):
+        db.insert_row_alarm(device_ip(i % 100), str(i % 6), 'benchmark', f'2030-01-01 00:00:{i % 60:02d}.{i:04d}')
+    db.close_connection()
+
+
+def _insert_polls(backend, db_url, rows):
+    # what AlarmCollector.save_to_db does: a dedup query and a batch insert per poll (here 50 alarms each)
+    for start in range(0, rows, 50):
+        alarms = [(device_ip(start % 100), str(i % 6), 'benchmark', f'2030-01-02 00:00:{i % 60:02d}.{i:04d}', None)
+                  for i in range(start, min(rows, start + 50))]
+
+        db = backend(db_url).open_connection()
+        db.filter_new_alarms(alarms[0][0], [(alarm[3], alarm[1]) for alarm in alarms])
+        db.insert_alarms(alarms)
+        db.close_connection()
+
+
+def _select(backend, db_url, method, *args):
+    db = backend(db_url).open_connection()
+    result = getattr(db, method)(*args)
+    db.close_connection()
+
+    return result
+
+
+def _bench_table(backend, db_url, rows, quick) -> Dict:
+    inserts = 200 if quick else 1000
+    repeat = 5 if quick else 20
+
+    results = {}
+
+    times = durations(_insert_one_per_connection, 1, backend, db_url, inserts)
+    results['insert_one_per_connection_rows_per_sec'] = throughput(inserts, sum(times))
+
+    times = durations(_insert_in_one_connection, 1, backend, db_url, inserts)
+    results['insert_in_one_connection_rows_per_sec'] = throughput(inserts, sum(times))
+
+    times = durations(_insert_polls, 1, backend, db_url, inserts)
+    results['insert_polls_rows_per_sec'] = throughput(inserts, sum(times))
+
+    selects = {'select_alarm_counters': (),
+               'select_alarm_by_severity_unnotified': (3,),
+               'select_alarms_page': (None, None, True),
+               'select_alarms_page_by_host': (device_ip(7),),
+               'count_alarms_by_description_and_device': (),
+               'count_alarms_per_time_bucket': ('2000-01-01 00:00:00', 3600)}
+
+    for name, args in selects.items():
+        method = 'select_alarms_page' if name.startswith('select_alarms_page') else name
+        # the full scans on big tables are slow: fewer repetitions
+        times = durations(_select, repeat if rows <= 100000 or name.startswith('select_') else 2, backend, db_url,
+                          method, *args)
+        results[name] = summary(times)
+
+    return results
+
+
+def run(quick=False) -> Dict:
+    results = {}
+    directory = tempfile.mkdtemp(prefix='bench-db-')
+
+    for rows in (10000,) if quick else (10000, 1000000):
+        db_url = os.path.join(directory, f'{rows}.db')
+        fill_db(db_url, rows)
+
+        results[f'{rows}_rows'] = _bench_table(DBHandler, db_url, rows, quick)
+
+        os.remove(db_url)
+
+        log_url = os.path.join(directory, f'{rows}.log')
+        fill_log_store(log_url, rows)
+
+        results[f'{rows}_rows_log_store'] = _bench_table(LogStore, log_url, rows, quick)
+
+        log_store.release(log_url)
+        os.remove(log_url)
+
+    return results
@@ -0,0 +1,93 @@
+"""
+latency from the moment a polled alarm is handed to the DB to the moment it is notified, with the collector and the
+notifier running concurrently as in production (the notification itself is only counted, see bench_notifier)
+"""
+import os
+import tempfile
+import threading
+import time
+from typing import Dict
+
+from alarm_library import AlarmCollector
+from benchmarks.timing import summary
+from models import database_manager, storage
+from models.config_manager import ConfigManager
+from models.customXMLParser import CustomXMLParser
+from models.database_manager import DBHandler
+from models.notification_manager import NotificationManager
+from simulator.workload import WorkloadGenerator
+
+
+class _CountingNotificationManager(NotificationManager):
+
+    def __init__(self, config_manager=None):
+        super().__init__(config_manager)
+        self.messages = 0
+
+    def notify(self, msg="DEBUG FROM NOTIFICATION MANAGER!"):
+        self.messages += 1
+
+
+def run(quick=False) -> Dict:
+    duration = 10 if quick else 60  # real seconds
+    notify_interval = 1 if quick else 5  # 5 s is the production interval of the notifier
+    poll_interval = 1
+
+    workload = WorkloadGenerator(devices=20, baseline_alarms=5)
+    workload.add_storm(duration / 3, devices_fraction=0.5, alarms_per_device=20, spread=duration / 10)
+    workload.add_flaps(0, devices=2, period=4 * poll_interval, count=int(duration // (4 * poll_interval)))
+
+    config_manager = ConfigManager()
+    collector = AlarmCollector([], config_manager)
+    notifier = _CountingNotificationManager(config_manager)
+    notifier.messages = 0
+
+    ingested = {}  # (device, time) -> when it was received
+    latencies = []
+    done = threading.Event()
+
+    def notify_loop():
+        while not done.wait(notify_interval):
+            notified = notifier.check_new_alarms(0)
+            now = time.perf_counter()
+            latencies.extend(now - ingested[(row[1], row[4])] for row in notified if (row[1], row[4]) in ingested)
+
+    previous_url = database_manager.default_url
+    database_manager.default_url = os.path.join(tempfile.mkdtemp(prefix='bench-e2e-'), 'e2e.db')
+    previous_backend = storage.set_backend('sqlite')  # the collector and the notifier use the default DB
+
+    try:
+        db = DBHandler().open_connection()
+        db.create_alarm_table()
+        db.close_connection()
+
+        notifier_thread = threading.Thread(target=notify_loop, name='bench-notifier')
+        notifier_thread.start()
+        start = time.perf_counter()
+
+        for t, device, xml in workload.snapshots(duration, poll_interval):
+            time.sleep(max(0.0, start + t - time.perf_counter()))
+
+            alarms = CustomXMLParser(xml).parse_all_alarms_xml()
+
+            # before saving: the notifier could pick the new alarms up before save_to_db returns
+            received = time.perf_counter()
+            for alarm in alarms:
+                ingested.setdefault((device, alarm['ne-condition-timestamp']), received)
+
+            collector.save_to_db(device, alarms)
+
+        time.sleep(2 * notify_interval)  # the last alarms get their chance to be notified
+        done.set()
+        notifier_thread.join()
+
+    finally:
+        database_manager.default_url = previous_url
+        storage.set_backend(previous_backend)
+
+    return {'duration_sec': duration,
+            'notify_interval_sec': notify_interval,
+            'alarms_ingested': len(ingested),
+            'alarms_notified': len(latencies),
+            'notification_messages': notifier.messages,
+            'ingest_to_notification': summary(latencies)}
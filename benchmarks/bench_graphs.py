@@ -0,0 +1,56 @@
+"""time to refresh and draw each GUI graph (offscreen) on tables of growing size"""
+import os
+import tempfile
+from typing import Dict
+
+from benchmarks.datasets import fill_db
+from benchmarks.timing import durations, summary
+from models import database_manager, storage
+
+
+def run(quick=False) -> Dict:
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')  # no window is ever shown
+
+    from PyQt5.QtWidgets import QApplication
+    from GUI.Graph1Class import Graph1
+    from GUI.Graph2Class import Graph2
+    from GUI.Graph3Class import Graph3
+    from GUI.Graph4Class import Graph4
+
+    app = QApplication.instance() or QApplication([])
+    directory = tempfile.mkdtemp(prefix='bench-graphs-')
+    repeat = 3 if quick else 10
+    results = {}
+
+    previous_url = database_manager.default_url
+    previous_backend = storage.set_backend('sqlite')
+
+    try:
+        for rows in (10000,) if quick else (10000, 100000):
+            db_url = os.path.join(directory, f'{rows}.db')
+            fill_db(db_url, rows)
+            database_manager.default_url = db_url  # the graphs read the default DB
+
+            graphs = {'graph1': (Graph1(), 'reFreshGraph1'),
+                      'graph2': (Graph2(), 'reFreshGraph2'),
+                      'graph3': (Graph3(), 'reFreshGraph3'),
+                      'graph4': (Graph4(), 'reFreshGraph4')}
+
+            results[f'{rows}_rows'] = {}
+
+            for name, (graph, refresh) in graphs.items():
+                first = durations(getattr(graph, refresh), 1)  # builds the artists
+                refreshes = durations(getattr(graph, refresh), repeat)  # updates them in place
+                draws = durations(graph.draw, repeat)
+
+                results[f'{rows}_rows'][name] = {'first_refresh': summary(first),
+                                                 'refresh': summary(refreshes),
+                                                 'draw': summary(draws)}
+            app.processEvents()
+            os.remove(db_url)
+
+    finally:
+        database_manager.default_url = previous_url
+        storage.set_backend(previous_backend)
+
+    return results
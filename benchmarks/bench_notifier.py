@@ -0,0 +1,60 @@
+"""NotificationManager.notify() dispatch throughput against local SMTP and telegram API stand-ins"""
+from typing import Dict
+
+from benchmarks.standins import BotAPIStandIn, SMTPStandIn
+from benchmarks.timing import durations, summary, throughput
+from models.config_manager import ConfigManager
+from models.lazy_import import timed_import
+from models.notification_manager import NotificationManager
+
+
+class _BenchNotificationManager(NotificationManager):
+    """its own singleton instance: the one of the application keeps the real config"""
+
+
+def _config(smtp, bot_api) -> ConfigManager:
+    config_manager = ConfigManager()
+
+    config_manager.data['Notification_config'].update({'SMTP_SERVER': smtp.server_address[0],
+                                                       'SMTP_PORT': smtp.server_address[1],
+                                                       'SMTP_STARTTLS': False,
+                                                       'Sender_email': 'bench@localhost',
+                                                       'Sender_email_password': 'bench',
+                                                       'Receiver_Email': 'bench@localhost'})
+    config_manager.data['Debug_Mode'] = False
+    config_manager.data.setdefault('Bot_config', {})['Api_url'] = bot_api.url
+
+    return config_manager
+
+
+def run(quick=False) -> Dict:
+    smtp = SMTPStandIn().start()
+    bot_api = BotAPIStandIn().start()
+
+    telegram_bot_service = timed_import('services.telegram_bot_service')
+    # the stand-in accepts any bot: no personal_credentials.json needed
+    telegram_bot_service.TOKEN = getattr(telegram_bot_service, 'TOKEN', 'benchmark')
+    telegram_bot_service.BOT_CHAT_GROUP_ID = getattr(telegram_bot_service, 'BOT_CHAT_GROUP_ID', 0)
+
+    config_manager = _config(smtp, bot_api)
+    notifier = _BenchNotificationManager(config_manager)
+    messages = 50 if quick else 500
+    msg = 'New Alarm(s): \n' + '\tDeviceIp: \'10.0.0.1\',\n\tDescription: Loss of Signal,\n' * 10
+
+    results = {}
+
+    try:
+        for name, send_email, send_message in (('email', True, False), ('telegram', False, True),
+                                               ('email_and_telegram', True, True)):
+            config_manager.data['Notification_config'].update({'Send_email': send_email, 'Send_message': send_message})
+
+            times = durations(notifier.notify, messages, msg)
+            results[name] = {'messages_per_sec': throughput(messages, sum(times)), 'notify': summary(times)}
+
+        results['received'] = {'smtp': smtp.messages, 'bot_api': bot_api.messages}
+
+    finally:
+        smtp.shutdown()
+        bot_api.shutdown()
+
+    return results
@@ -0,0 +1,22 @@
+"""CustomXMLParser.parse_all_alarms_xml() throughput on replies of growing size"""
+from typing import Dict
+
+from benchmarks.datasets import alarm_payload
+from benchmarks.timing import durations, summary, throughput
+from models.customXMLParser import CustomXMLParser
+
+
+def run(quick=False) -> Dict:
+    results = {}
+
+    for alarms in (10, 100, 1000) if quick else (10, 100, 1000, 10000):
+        payload = alarm_payload(alarms)
+        repeat = max(3, 20000 // alarms) if not quick else max(3, 2000 // alarms)
+
+        times = durations(lambda: CustomXMLParser(payload).parse_all_alarms_xml(), repeat)
+
+        results[f'{alarms}_alarms'] = {'payload_bytes': len(payload),
+                                       'alarms_per_sec': throughput(alarms * repeat, sum(times)),
+                                       'parse': summary(times)}
+
+    return results
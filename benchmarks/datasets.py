@@ -0,0 +1,70 @@
+"""
+Reproducible datasets of the benchmarks: the same arguments always give the same data.
+"""
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+from models.database_manager import DBHandler
+from models.log_store import LogStore
+from simulator.workload import WorkloadGenerator
+
+_DESCRIPTIONS = ['Ethernet link failure', 'Laser on delay', 'Loss of Signal', 'NTP server unavailable',
+                 'Server Signal Fail', 'Server Signal Fail payload', 'TCA unavailable seconds high']
+
+
+def alarm_payload(alarms, seed=0) -> str:
+    """@return: the <rpc-reply> of a device with that many active alarms"""
+    workload = WorkloadGenerator(devices=1, baseline_alarms=alarms, seed=seed)
+
+    return workload.reply_at(workload.devices[0], 0)
+
+
+def device_ip(index) -> str:
+    return '10.0.%d.%d' % (index // 250, index % 250 + 1)
+
+
+def alarm_rows(rows, devices=100, days=30, end=None, seed=0):
+    """
+    @param end: datetime (UTC, as the devices' timestamps) of the newest alarm. Now if None: the time windows
+                of the graphs must contain them
+    @return: generator of (deviceIP, severity, description, time, notified, ceased), the oldest first
+    """
+    _random = random.Random(seed)
+    end = end if end is not None else datetime.utcnow()
+    start = end - timedelta(days=days)
+    step = timedelta(days=days) / max(1, rows)
+
+    for i in range(rows):
+        yield (device_ip(_random.randrange(devices)),
+               _random.randint(0, 5),
+               _random.choice(_DESCRIPTIONS),
+               (start + step * i).strftime('%Y-%m-%d %H:%M:%S.%f')[:-2],
+               1,
+               1 if _random.random() < 0.7 else 0)
+
+
+def fill_db(db_url, rows, devices=100, seed=0):
+    """creates the tables in db_url and bulk loads rows alarms (already notified) with their counters"""
+    db = DBHandler(db_url).open_connection()
+    db.create_alarm_table()
+    db.close_connection()
+
+    # bulk load: insert_row_alarm would take hours for 1M rows, and that is not what is measured here
+    connection = sqlite3.connect(db_url)
+    connection.executemany('INSERT INTO alarm (deviceIP, severity, description, time, notified, ceased) '
+                           'VALUES (?, ?, ?, ?, ?, ?)', alarm_rows(rows, devices, seed=seed))
+    connection.commit()
+    connection.close()
+
+    db = DBHandler(db_url).open_connection()
+    db.rebuild_alarm_counters()
+    db.close_connection()
+
+
+def fill_log_store(path, rows, devices=100, seed=0):
+    """the same alarms of fill_db, in a log store file"""
+    db = LogStore(path).open_connection()
+    for row in alarm_rows(rows, devices, seed=seed):
+        db.insert_row_alarm(*row)
+    db.close_connection()
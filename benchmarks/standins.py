@@ -0,0 +1,87 @@
+"""
+Local stand-ins of the external services the notifier talks to: an SMTP server and the telegram bot API.
+They accept everything and only count what they receive, so the benchmarks measure our side of the dispatch.
+"""
+import json
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.__reply('220 localhost stand-in ESMTP')
+        in_data = False
+
+        for line in self.rfile:
+            if in_data:
+                if line.rstrip(b'\r\n') == b'.':
+                    in_data = False
+                    self.server.messages += 1
+                    self.__reply('250 OK')
+                continue
+
+            command = line[:4].upper()
+
+            if command == b'EHLO':
+                self.wfile.write(b'250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250 SIZE 10485760\r\n')
+            elif command == b'AUTH':
+                self.__reply('235 Authentication successful')
+            elif command == b'DATA':
+                in_data = True
+                self.__reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self.__reply('221 Bye')
+                return
+            else:  # HELO, MAIL, RCPT, RSET, NOOP
+                self.__reply('250 OK')
+
+    def __reply(self, text):
+        self.wfile.write(text.encode('ascii') + b'\r\n')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), _SMTPHandler)
+        self.messages = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='smtp-stand-in', daemon=True).start()
+        return self
+
+
+class _BotAPIHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.messages += 1
+
+        body = json.dumps({'ok': True, 'result': {'message_id': self.server.messages}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # one line per request would be the bottleneck
+
+
+class BotAPIStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), _BotAPIHandler)
+        self.messages = 0
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='bot-api-stand-in', daemon=True).start()
+        return self
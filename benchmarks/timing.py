@@ -0,0 +1,22 @@
+"""helpers shared by the benchmarks"""
+import time
+from typing import List
+
+from simulator.replay import percentile, summary  # noqa: F401 (re-exported for the benchmarks)
+
+
+def durations(function, repeat, *args) -> List:
+    """@return: list of the seconds taken by repeat calls of function(*args)"""
+    result = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        result.append(time.perf_counter() - start)
+
+    return result
+
+
+def throughput(items, seconds) -> float:
+    """@return: items per second"""
+    return items / seconds if seconds > 0 else 0.0
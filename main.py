@@ -1,26 +1,40 @@
+import time
 
-from models.database_manager import DBHandler
-from GUI import GUI_Main as GUI
+_start = time.perf_counter()  # import timing starts here
 
-import logging, os
+from models import storage
+from models.lazy_import import timed_import, import_times, import_report
+from models import log_manager
 
-logfile = os.path.join(os.path.dirname(__file__), 'log.log')
-logging.basicConfig(filename=logfile, level=logging.WARNING)
+import sys
 
-try:
-    from services import telegram_bot_service
+log_manager.setup_logging()
 
-except ImportError as e:
-    logging.log(logging.WARNING, 'Could not find the telegram bot' + str(e))
+import_times['main'] = time.perf_counter() - _start
 
 
 def _create_db():
-    db = DBHandler().open_connection()
+    db = storage.handler().open_connection()
     db.create_alarm_table()
     db.close_connection()
 
 
+def headless(print_import_timing=False):
+    """
+    starts only the alarm service: PyQt5 and matplotlib are never imported,
+    the telegram bot only if it is enabled in the config.json
+    """
+    main_service = timed_import('services.main_service')
+
+    if print_import_timing:
+        print(import_report())
+
+    main_service.main()
+
+
 def main():
+    # GUI only when needed: it alone takes most of the startup time
+    GUI = timed_import('GUI.GUI_Main')
 
     gui = GUI.gui_thread()
     gui.start()
@@ -31,6 +45,8 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
-
-
+    # usage: python main.py [--headless] [--import-timing]
+    if '--headless' in sys.argv:
+        headless('--import-timing' in sys.argv)
+    else:
+        main()
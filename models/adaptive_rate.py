@@ -0,0 +1,80 @@
+"""
+Adaptive polling rate: the interval of a device follows what its polls find.
+- the alarms changed since the previous poll: the interval is shortened (divided by the factor)
+- nothing changed, or the device is unreachable: the interval grows exponentially (multiplied by the factor)
+The interval always stays within [min_rate, max_rate].
+"""
+import logging
+import threading
+from typing import Dict
+
+
+def alarms_fingerprint(alarms, keys) -> int:
+    """@return: a hash of the set of the alarms, independent of their order"""
+    return hash(frozenset(tuple(_dict.get(key) for key in keys) for _dict in alarms))
+
+
+class AdaptiveRate(object):
+
+    def __init__(self, min_rate=1, max_rate=300, factor=2):
+        """
+        @param min_rate: shortest interval in seconds
+        @param max_rate: longest interval in seconds
+        @param factor: the interval is multiplied / divided by it at every step
+        """
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.factor = factor
+        self._rates = {}
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_manager):
+        """@return: an AdaptiveRate if the adaptive polling is enabled in the config.json, else None"""
+        if not config_manager.get_adaptive_polling():
+            return None
+
+        return cls(config_manager.get_adaptive_min_rate(),
+                   config_manager.get_adaptive_max_rate(),
+                   config_manager.get_adaptive_backoff_factor())
+
+    def register(self, key, rate):
+        """@param rate: starting interval of the device (its netconf_fetch_rate_in_sec)"""
+        with self._lock:
+            self._rates[key] = self.__bound(rate)
+
+    def observe(self, key, fingerprint, reachable) -> float:
+        """
+        @param fingerprint: alarms_fingerprint() of the alarms just fetched (ignored if not reachable)
+        @param reachable: False if the device could not be polled
+        @return: the new interval of the device
+        """
+        with self._lock:
+            rate = self._rates[key]
+
+            if not reachable:
+                new_rate = rate * self.factor
+            elif key in self._fingerprints and self._fingerprints[key] != fingerprint:
+                new_rate = rate / self.factor
+            else:
+                new_rate = rate * self.factor
+
+            if reachable:
+                self._fingerprints[key] = fingerprint
+
+            new_rate = self.__bound(new_rate)
+            self._rates[key] = new_rate
+
+        if new_rate != rate:
+            logging.log(logging.INFO, f'polling rate of {key}: {rate:g}s -> {new_rate:g}s')
+
+        return new_rate
+
+    def get_rates(self) -> Dict:
+        """@return: dict key -> current interval in seconds"""
+        with self._lock:
+            return dict(self._rates)
+
+    def __bound(self, rate):
+        return min(self.max_rate, max(self.min_rate, rate))
@@ -0,0 +1,74 @@
+"""
+Circuit breaker of a device: after failure_threshold failed polls in a row the device is considered down (open)
+and it is not contacted anymore until reset_timeout has passed. Then a single probe is let through (half-open):
+if it succeeds the breaker closes, if it fails it opens again for twice as long (up to max_reset_timeout).
+"""
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, failure_threshold=3, reset_timeout=30, max_reset_timeout=600, clock=time.monotonic):
+        """
+        @param failure_threshold: consecutive failures opening the breaker
+        @param reset_timeout: seconds before the first probe of an open breaker
+        @param max_reset_timeout: the backoff between two failed probes never gets longer than this
+        @param clock: monotonic clock in seconds (for testing)
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self._timeout = reset_timeout
+        self._opened_at = 0.0
+
+    @classmethod
+    def from_config(cls, config_manager):
+        return cls(config_manager.get_breaker_failure_threshold(),
+                   config_manager.get_breaker_reset_timeout(),
+                   config_manager.get_breaker_max_reset_timeout())
+
+    def allow_request(self) -> bool:
+        """@return: True if the device can be contacted now. When it returns True the caller must record the outcome"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN and self._clock() >= self._opened_at + self._timeout:
+                self.state = HALF_OPEN  # only this caller probes, the others keep being refused
+                return True
+
+            return False
+
+    def is_probing(self) -> bool:
+        with self._lock:
+            return self.state == HALF_OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._timeout = self.reset_timeout
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+            if self.state == HALF_OPEN:  # the probe failed: wait longer before the next one
+                self._timeout = min(self._timeout * 2, self.max_reset_timeout)
+                self.__open()
+
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self.__open()
+
+    def __open(self):
+        self.state = OPEN
+        self._opened_at = self._clock()
@@ -0,0 +1,185 @@
+"""
+Coordination of several collector nodes sharing the same DB (or at least the same coordination DB file).
+
+The devices are split in a fixed number of shards (consistent hashing on the device ip) and every node polls only
+the devices of the shards it holds a lease on. Each node heartbeats periodically: it renews its leases, releases the
+shards above its fair share and claims the free or expired ones. When a node dies its leases expire and the
+surviving nodes take its shards over, so no device is polled twice and none is forgotten for more than a lease.
+A node that cannot heartbeat (e.g. the DB file is unreachable) stops polling its shards a safety margin before its
+leases expire, whether or not it can tell the other nodes.
+
+SQLite serializes the heartbeats with BEGIN IMMEDIATE transactions: it works for nodes sharing a DB file
+(e.g. on a network share, or on the same host for testing).
+"""
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Set
+
+from models import database_manager
+from models.hash_ring import HashRing
+
+# the shards are given up lease_ttl / SAFETY_MARGIN_DIVISOR before their lease expires: room for the polls in flight
+# and for the clock skew between the nodes
+SAFETY_MARGIN_DIVISOR = 5
+
+
+class ClusterCoordinator(object):
+
+    def __init__(self, node_id=None, shards=64, lease_ttl=15, db_url=None, clock=time.time):
+        """
+        @param node_id: unique name of this node (hostname-pid if None)
+        @param shards: number of shards the devices are split in. Must be the same on every node
+        @param lease_ttl: seconds after which the leases (and the node) of a silent node expire
+        @param db_url: sqlite file shared by the nodes (the local.db if None)
+        @param clock: function returning the current time in seconds (for testing)
+        """
+        self.node_id = node_id if node_id else f'{socket.gethostname()}-{os.getpid()}'
+        self.shards = shards
+        self.lease_ttl = lease_ttl
+        self._db_url = db_url if db_url else database_manager.default_url
+        self._clock = clock
+        self._ring = HashRing(range(shards))
+        self._owned_shards = set()
+        self._owned_until = 0.0  # the shards are owned until then: lease of the last heartbeat minus a margin
+        self._owned_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.__execute_in_transaction(self.__create_tables)
+
+    @classmethod
+    def from_config(cls, config_manager):
+        return cls(config_manager.get_cluster_node_id(),
+                   config_manager.get_cluster_shards(),
+                   config_manager.get_cluster_lease_ttl(),
+                   config_manager.get_cluster_db_url())
+
+    def shard_of(self, device_ip) -> int:
+        return self._ring.get_node(device_ip)
+
+    def owns(self, device_ip) -> bool:
+        """@return: True if this node must poll the device"""
+        return self.shard_of(device_ip) in self.owned_shards()
+
+    def owned_shards(self) -> Set:
+        """@return: the shards of this node, none if its leases are about to expire (no successful heartbeat)"""
+        with self._owned_lock:
+            if self._clock() >= self._owned_until:
+                return set()
+            return set(self._owned_shards)
+
+    def heartbeat(self) -> Set:
+        """
+        renews this node's leases and rebalances the shards among the live nodes
+        @return: the shards owned by this node after the rebalancing
+        """
+        # taken before the transaction: the leases written in it expire at a later time, never at an earlier one
+        owned_until = self._clock() + self.lease_ttl - self.lease_ttl / SAFETY_MARGIN_DIVISOR
+        owned = self.__execute_in_transaction(self.__heartbeat)
+
+        with self._owned_lock:
+            if owned != self._owned_shards:
+                logging.log(logging.INFO, f'node {self.node_id} now owns {len(owned)} shards of {self.shards}')
+            self._owned_shards = owned
+            self._owned_until = owned_until
+
+        return set(owned)
+
+    def release_all(self):
+        """gives the shards back immediately (graceful shutdown), instead of waiting for the leases to expire"""
+        self.__execute_in_transaction(self.__release_all)
+
+        with self._owned_lock:
+            self._owned_shards = set()
+
+    def start(self) -> threading.Thread:
+        """heartbeats now and then every lease_ttl / 3 seconds in a background thread"""
+        self.heartbeat()
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.__heartbeat_thread, name='cluster-heartbeat', daemon=True)
+            self._thread.start()
+
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        self.release_all()
+
+    def __heartbeat_thread(self):
+        while not self._stop.wait(self.lease_ttl / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                # keep going: if the store is unreachable for longer than a lease, the other nodes take over
+                logging.log(logging.ERROR, 'cluster heartbeat failed: ' + str(e))
+
+                with self._owned_lock:
+                    if self._owned_shards and self._clock() >= self._owned_until:
+                        logging.log(logging.WARNING, f'node {self.node_id} lost the leases of '
+                                                     f'{len(self._owned_shards)} shards: not polling them anymore')
+                        self._owned_shards = set()
+
+    def __execute_in_transaction(self, function):
+        # no database_manager.semaphore here: waiting for the file lock of the other nodes while holding it would stop
+        # every poller of this process. The DBHandlers of this process using the same file wait on the file lock too
+        connection = sqlite3.connect(self._db_url, timeout=self.lease_ttl, isolation_level=None)
+        try:
+            cursor = connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')  # one heartbeat at a time among all the nodes
+            try:
+                result = function(cursor)
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+
+            return result
+
+        finally:
+            connection.close()
+
+    def __create_tables(self, cursor):
+        cursor.execute('CREATE TABLE IF NOT EXISTS cluster_node (nodeID text PRIMARY KEY, last_seen real)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS shard_lease (shard INTEGER PRIMARY KEY, nodeID text, expires real)')
+        cursor.executemany('INSERT OR IGNORE INTO shard_lease (shard, nodeID, expires) VALUES (?, NULL, 0)',
+                           [(shard,) for shard in range(self.shards)])
+
+    def __heartbeat(self, cursor) -> Set:
+        now = self._clock()
+        expires = now + self.lease_ttl
+
+        cursor.execute('INSERT OR REPLACE INTO cluster_node (nodeID, last_seen) VALUES (?, ?)', (self.node_id, now))
+        cursor.execute('DELETE FROM cluster_node WHERE last_seen < ?', (now - self.lease_ttl,))  # dead nodes
+
+        cursor.execute('SELECT count(*) FROM cluster_node')
+        fair_share = math.ceil(self.shards / cursor.fetchone()[0])
+
+        cursor.execute('UPDATE shard_lease SET expires = ? WHERE nodeID = ?', (expires, self.node_id))
+        cursor.execute('SELECT shard FROM shard_lease WHERE nodeID = ? ORDER BY shard', (self.node_id,))
+        owned = [row[0] for row in cursor.fetchall()]
+
+        if len(owned) > fair_share:  # a node joined: give back the extra shards, it will claim them
+            extra = owned[fair_share:]
+            cursor.executemany('UPDATE shard_lease SET nodeID = NULL, expires = 0 WHERE shard = ? AND nodeID = ?',
+                               [(shard, self.node_id) for shard in extra])
+            owned = owned[:fair_share]
+
+        elif len(owned) < fair_share:  # claim the free shards and the ones of the dead nodes
+            cursor.execute('SELECT shard FROM shard_lease WHERE nodeID IS NULL OR expires < ? ORDER BY shard LIMIT ?',
+                           (now, fair_share - len(owned)))
+            claimed = [row[0] for row in cursor.fetchall()]
+            cursor.executemany('UPDATE shard_lease SET nodeID = ?, expires = ? WHERE shard = ?',
+                               [(self.node_id, expires, shard) for shard in claimed])
+            owned += claimed
+
+        return set(owned)
+
+    def __release_all(self, cursor):
+        cursor.execute('UPDATE shard_lease SET nodeID = NULL, expires = 0 WHERE nodeID = ?', (self.node_id,))
+        cursor.execute('DELETE FROM cluster_node WHERE nodeID = ?', (self.node_id,))
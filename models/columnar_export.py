@@ -0,0 +1,354 @@
+"""
+Columnar export of the alarm table, for the offline analytics (e.g. capacity planning) that would otherwise scan the
+local.db row by row. The table is read in ID order, chunk_size alarms at a time (the pollers only wait for a chunk,
+never for the whole export), and written column by column:
+
+    ID           int64
+    deviceIP     int32, code in deviceIP_dictionary (str)
+    severity     int8
+    description  int32, code in description_dictionary (str)
+    time         int64, ms since the epoch (UTC, set by the device), MISSING_TIME if it cannot be parsed
+    notified     bool
+    ceased       bool
+    ingested     int64, ms since the epoch, MISSING_TIME for the rows saved before it was recorded
+
+Formats:
+    npy      a directory with one <column>.npy per column. load_columns() memory-maps them: nothing is read up front
+    npz      the same arrays in a single compressed file (smaller, but loaded in memory)
+    parquet  only if pyarrow is installed. deviceIP and description are Arrow dictionaries, the times timestamp[ms]
+
+    python -m models.columnar_export alarms/
+    python -m models.columnar_export alarms.parquet --chunk-size 50000
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from models import storage
+
+COLUMNS = (('ID', np.int64),
+           ('deviceIP', np.int32),
+           ('severity', np.int8),
+           ('description', np.int32),
+           ('time', np.int64),
+           ('notified', np.bool_),
+           ('ceased', np.bool_),
+           ('ingested', np.int64))
+
+DICTIONARY_COLUMNS = ('deviceIP', 'description')
+
+MISSING_TIME = np.iinfo(np.int64).min  # same value of numpy's NaT: sorts before every real time
+
+FORMATS = ('npy', 'npz', 'parquet')
+
+
+class _Dictionary(object):
+    """assigns a code to every distinct string, in order of appearance, across all the chunks"""
+
+    def __init__(self):
+        self._codes = {}
+
+    def encode(self, values) -> np.ndarray:
+        codes = self._codes
+        return np.fromiter((codes.setdefault('' if value is None else str(value), len(codes)) for value in values),
+                           dtype=np.int32, count=len(values))
+
+    def values(self) -> np.ndarray:
+        """@return: array of the strings, the code of each is its index"""
+        return np.array(list(self._codes), dtype=str)
+
+
+class _NpyDirectoryWriter(object):
+    """
+    one .npy per column. The header of a .npy holds the length of the array, unknown until the last chunk:
+    the chunks are appended to a raw file and copied behind the header at the end, so the memory stays bounded
+    """
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self._path = path
+        self._count = 0
+        self._raw = {name: open(self.__raw_path(name), 'wb') for name, _ in COLUMNS}
+
+    def write(self, arrays, dictionaries):
+        for name, dtype in COLUMNS:
+            arrays[name].astype(dtype, copy=False).tofile(self._raw[name])
+
+        self._count += len(arrays['ID'])
+
+    def close(self, dictionaries):
+        for name, dtype in COLUMNS:
+            self._raw[name].close()
+            header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False,
+                      'shape': (self._count,)}
+
+            with open(os.path.join(self._path, f'{name}.npy'), 'wb') as _file, \
+                    open(self.__raw_path(name), 'rb') as raw:
+                np.lib.format.write_array_header_1_0(_file, header)
+                shutil.copyfileobj(raw, _file, 1 << 20)
+
+            os.remove(self.__raw_path(name))
+
+        for name in DICTIONARY_COLUMNS:
+            np.save(os.path.join(self._path, f'{name}_dictionary.npy'), dictionaries[name].values())
+
+    def abort(self):
+        for name, _ in COLUMNS:
+            self._raw[name].close()
+            os.remove(self.__raw_path(name))
+
+    def __raw_path(self, name) -> str:
+        return os.path.join(self._path, f'.{name}.raw')
+
+
+class _NpzWriter(object):
+    """the npy columns in a temporary directory, zipped at the end (np.savez streams the memory-mapped arrays)"""
+
+    def __init__(self, path):
+        self._path = path
+        self._tmp = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+        self._npy = _NpyDirectoryWriter(self._tmp)
+
+    def write(self, arrays, dictionaries):
+        self._npy.write(arrays, dictionaries)
+
+    def close(self, dictionaries):
+        try:
+            self._npy.close(dictionaries)
+            np.savez_compressed(self._path, **load_columns(self._tmp))
+        finally:
+            shutil.rmtree(self._tmp)
+
+    def abort(self):
+        shutil.rmtree(self._tmp)
+
+
+class _ParquetWriter(object):
+    """one row group per chunk"""
+
+    def __init__(self, path):
+        import pyarrow  # optional: only this format needs it
+        import pyarrow.parquet
+
+        self._pa = pyarrow
+        self._path = path
+        dictionary = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        timestamp = pyarrow.timestamp('ms', tz='UTC')
+        self._schema = pyarrow.schema([('ID', pyarrow.int64()), ('deviceIP', dictionary),
+                                       ('severity', pyarrow.int8()), ('description', dictionary),
+                                       ('time', timestamp), ('notified', pyarrow.bool_()),
+                                       ('ceased', pyarrow.bool_()), ('ingested', timestamp)])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def write(self, arrays, dictionaries):
+        pa = self._pa
+        columns = []
+
+        for field in self._schema:
+            values = arrays[field.name]
+
+            if field.name in DICTIONARY_COLUMNS:
+                columns.append(pa.DictionaryArray.from_arrays(values, dictionaries[field.name].values()))
+            elif pa.types.is_timestamp(field.type):
+                columns.append(pa.array(values, type=field.type, mask=values == MISSING_TIME))
+            else:
+                columns.append(pa.array(values, type=field.type))
+
+        self._writer.write_table(pa.Table.from_arrays(columns, schema=self._schema))
+
+    def close(self, dictionaries):
+        self._writer.close()
+
+    def abort(self):
+        self._writer.close()
+        os.remove(self._path)
+
+
+_WRITERS = {'npy': _NpyDirectoryWriter, 'npz': _NpzWriter, 'parquet': _ParquetWriter}
+
+
+def export_alarms(path, _format=None, db_url=None, chunk_size=10000) -> int:
+    """
+    exports the alarm table as it is when the export starts (the alarms inserted meanwhile are left out)
+
+    @param path: directory (npy) or file (npz, parquet) to write
+    @param _format: one of FORMATS, None to guess it from the extension of path (npy if none)
+    @param db_url: file of the storage backend (its default, e.g. the local.db, if None)
+    @param chunk_size: alarms read from the DB and written at a time
+    @return: number of alarms exported
+    """
+    if _format is None:
+        _format = os.path.splitext(path)[1][1:] or 'npy'
+    if _format not in FORMATS:
+        raise ValueError(f'unknown export format {_format}, expected one of {FORMATS}')
+
+    start = time.perf_counter()
+
+    db = storage.handler(db_url).open_connection()
+    upto_ID = db.select_last_alarm_ID()
+    db.close_connection()
+
+    dictionaries = {name: _Dictionary() for name in DICTIONARY_COLUMNS}
+    writer = _WRITERS[_format](path)
+    exported, after_ID = 0, 0
+
+    try:
+        while True:
+            db = storage.handler(db_url).open_connection()
+            try:
+                columns, rows = db.select_alarms_after_ID(after_ID, chunk_size, upto_ID)
+            finally:
+                db.close_connection()
+
+            if len(rows) == 0:
+                break
+
+            arrays = _to_arrays(columns, rows, dictionaries)
+            writer.write(arrays, dictionaries)
+            exported += len(rows)
+            after_ID = int(arrays['ID'][-1])
+
+    except BaseException:
+        writer.abort()
+        raise
+
+    writer.close(dictionaries)
+
+    logging.log(logging.INFO, f'exported {exported} alarms to {path} in {time.perf_counter() - start:.1f}s')
+
+    return exported
+
+
+def load_columns(path, mmap=True) -> Dict[str, np.ndarray]:
+    """
+    @param path: directory (npy), .npz or .parquet file written by export_alarms()
+    @param mmap: memory-map the .npy files instead of reading them (npy only)
+    @return: dict column name -> array, including deviceIP_dictionary and description_dictionary (see decode())
+    """
+    if os.path.isdir(path):
+        return {name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode='r' if mmap else None)
+                for name in sorted(os.listdir(path)) if name.endswith('.npy')}
+
+    if path.endswith('.parquet'):
+        return _load_parquet(path)
+
+    with np.load(path) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+def decode(columns, name) -> np.ndarray:
+    """@return: the strings of a dictionary encoded column (deviceIP or description)"""
+    return columns[f'{name}_dictionary'][columns[name]]
+
+
+def count_alarms_per_time_bucket(columns, since, bucket_in_sec) -> List:
+    """
+    same result of DBHandler.count_alarms_per_time_bucket, computed on exported columns
+
+    @param since: only the alarms with time >= since, in ms since the epoch
+    @return: list of tuples (bucket start as unix time, severity, count) ordered by bucket
+    """
+    times = columns['time']
+    keep = times >= since  # MISSING_TIME is never kept
+
+    buckets = times[keep] // 1000 // bucket_in_sec * bucket_in_sec
+    keys = np.stack([buckets, columns['severity'][keep].astype(np.int64)], axis=1)
+    keys, counts = np.unique(keys, axis=0, return_counts=True)
+
+    return [(int(bucket), str(severity), int(count)) for (bucket, severity), count in zip(keys, counts)]
+
+
+def _to_arrays(columns, rows, dictionaries) -> Dict[str, np.ndarray]:
+    index = {name: columns.index(name) for name, _ in COLUMNS}
+
+    def column(name):
+        return [row[index[name]] for row in rows]
+
+    return {'ID': np.array(column('ID'), dtype=np.int64),
+            'deviceIP': dictionaries['deviceIP'].encode(column('deviceIP')),
+            'severity': _to_int8(column('severity')),
+            'description': dictionaries['description'].encode(column('description')),
+            'time': _parse_times(column('time')),
+            'notified': np.array(column('notified'), dtype=np.bool_),
+            'ceased': np.array(column('ceased'), dtype=np.bool_),
+            'ingested': _epoch_to_ms(column('ingested'))}
+
+
+def _parse_times(values) -> np.ndarray:
+    """'2018-03-28 21:41:35.2749' -> ms since the epoch"""
+    try:
+        return np.array([str(value) for value in values], dtype='datetime64[ms]').astype(np.int64)
+
+    except ValueError:  # at least one unparsable: value by value
+        result = np.full(len(values), MISSING_TIME, dtype=np.int64)
+
+        for i, value in enumerate(values):
+            try:
+                result[i] = np.datetime64(str(value), 'ms').astype(np.int64)
+            except ValueError:
+                pass
+
+        return result
+
+
+def _to_int8(values) -> np.ndarray:
+    try:
+        return np.array(values, dtype=np.int8)
+
+    except (ValueError, TypeError):
+        return np.array([int(value) if str(value).lstrip('-').isdigit() else -1 for value in values], dtype=np.int8)
+
+
+def _epoch_to_ms(values) -> np.ndarray:
+    """epoch in seconds (None if unknown) -> ms since the epoch"""
+    seconds = np.array(values, dtype=np.float64)
+    known = ~np.isnan(seconds)
+
+    result = np.full(len(values), MISSING_TIME, dtype=np.int64)
+    result[known] = np.rint(seconds[known] * 1000)
+
+    return result
+
+
+def _load_parquet(path) -> Dict[str, np.ndarray]:
+    import pyarrow  # optional: only this format needs it
+    import pyarrow.parquet
+
+    table = pyarrow.parquet.read_table(path).unify_dictionaries()
+    result = {}
+
+    for name, dtype in COLUMNS:
+        column = table.column(name)
+
+        if name in DICTIONARY_COLUMNS:
+            column = column.combine_chunks()
+            result[name] = column.indices.to_numpy(zero_copy_only=False).astype(dtype)
+            result[f'{name}_dictionary'] = column.dictionary.to_numpy(zero_copy_only=False).astype(str)
+        elif pyarrow.types.is_timestamp(column.type):
+            result[name] = column.cast(pyarrow.int64()).fill_null(MISSING_TIME).to_numpy()
+        else:
+            result[name] = column.to_numpy().astype(dtype)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m models.columnar_export',
+                                     description='exports the alarm table in a columnar format')
+    parser.add_argument('path', help='directory (npy) or file (.npz, .parquet) to write')
+    parser.add_argument('--format', choices=FORMATS, help='guessed from the extension of path by default')
+    parser.add_argument('--db', help='file of the storage backend to export (the local.db by default)')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    print(export_alarms(args.path, args.format, args.db, args.chunk_size), 'alarms exported')
+
+
+if __name__ == '__main__':
+    main()
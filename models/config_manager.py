@@ -14,9 +14,6 @@ from typing import Dict, List
 
 dirname = os.path.dirname(__file__)
 
-logfile = os.path.join(dirname, '../log.log')
-logging.basicConfig(filename=logfile, level=logging.ERROR)
-
 
 def _read_config_file() -> Dict:  # creating static method to read config file
     filename = os.path.join(dirname, '../config/config.json')
@@ -42,6 +39,10 @@ class ConfigManager(object):
     def get_notification_config(self) -> Dict:
         return self.data['Notification_config']
 
+    def get_smtp_starttls(self) -> bool:
+        """False only for local SMTP servers without TLS (e.g. debugging servers, benchmarks)"""
+        return self.get_notification_config().get('SMTP_STARTTLS', True)
+
     def get_email_notification_flag(self) -> bool:
         return self.get_notification_config()['Send_email']
 
@@ -63,6 +64,224 @@ class ConfigManager(object):
     def get_version(self) -> str:
         return self.data['Version']
 
+    def get_collector_config(self) -> Dict:
+        return self.data.get('Collector_config', {})
+
+    def get_collector_mode(self) -> str:
+        """
+        'threads' (one thread per device, single process), 'sharded' (devices split among processes)
+        or 'cluster' (devices split among the nodes sharing the coordination DB)
+        """
+        return self.get_collector_config().get('Mode', 'threads')
+
+    def get_shard_processes(self) -> int:
+        """number of processes of the sharded mode, 0 means one for each core"""
+        return self.get_collector_config().get('Shard_processes', 0)
+
+    def get_poll_workers(self) -> int:
+        """size of the thread pool running the polls dispatched by the scheduler (per process)"""
+        return self.get_collector_config().get('Poll_workers', 8)
+
+    def get_poll_jitter(self) -> float:
+        """
+        every poll is moved randomly by up to +-jitter * fetch rate.
+        A device can override it with 'netconf_fetch_jitter' under 'Network'
+        """
+        return self.get_collector_config().get('Poll_jitter', 0.1)
+
+    def get_adaptive_polling(self) -> bool:
+        """if True the polling rate of each device adapts to its alarm churn and health (see models/adaptive_rate.py)"""
+        return self.get_collector_config().get('Adaptive_polling', False)
+
+    def get_adaptive_min_rate(self) -> float:
+        return self.get_collector_config().get('Adaptive_min_rate_in_sec', 1)
+
+    def get_adaptive_max_rate(self) -> float:
+        return self.get_collector_config().get('Adaptive_max_rate_in_sec', 300)
+
+    def get_adaptive_backoff_factor(self) -> float:
+        return self.get_collector_config().get('Adaptive_backoff_factor', 2)
+
+    def get_simulation_mode(self) -> bool:
+        """if True the unreachable devices return the alarms of dummy_data.xml (testing only)"""
+        return self.get_collector_config().get('Simulation_mode', False)
+
+    def get_connect_timeout(self) -> float:
+        return self.get_collector_config().get('Connect_timeout_in_sec', 10)
+
+    def get_probe_connect_timeout(self) -> float:
+        """connect timeout of the probes of the devices whose circuit breaker is open"""
+        return self.get_collector_config().get('Probe_connect_timeout_in_sec', 3)
+
+    def get_breaker_failure_threshold(self) -> int:
+        """consecutive failed polls after which a device is not contacted anymore, apart from the probes"""
+        return self.get_collector_config().get('Breaker_failure_threshold', 3)
+
+    def get_breaker_reset_timeout(self) -> float:
+        return self.get_collector_config().get('Breaker_reset_timeout_in_sec', 30)
+
+    def get_breaker_max_reset_timeout(self) -> float:
+        return self.get_collector_config().get('Breaker_max_reset_timeout_in_sec', 600)
+
+    def get_cluster_node_id(self) -> str:
+        """name of this node in cluster mode, empty means hostname-pid"""
+        return self.get_collector_config().get('Cluster_node_id', '')
+
+    def get_cluster_shards(self) -> int:
+        """number of shards the devices are split in, in cluster mode. It must be the same on every node"""
+        return self.get_collector_config().get('Cluster_shards', 64)
+
+    def get_cluster_lease_ttl(self) -> float:
+        return self.get_collector_config().get('Cluster_lease_ttl_in_sec', 15)
+
+    def get_cluster_db_url(self) -> str:
+        """sqlite file shared by the nodes to coordinate, empty means the local.db"""
+        return self.get_collector_config().get('Cluster_db_url', '')
+
+    def get_logging_config(self) -> Dict:
+        return self.data.get('Logging_config', {})
+
+    def get_log_file(self) -> str:
+        """file of the log, relative to the project root if not absolute (see models/log_manager.py)"""
+        return self.get_logging_config().get('File', 'log.log')
+
+    def get_log_level(self) -> str:
+        return self.get_logging_config().get('Level', 'WARNING')
+
+    def get_log_json(self) -> bool:
+        """whether every line of the log is a JSON object instead of text"""
+        return self.get_logging_config().get('Json', False)
+
+    def get_log_rate_limit(self) -> float:
+        """seconds during which the repetitions of the same message are not written (0 writes them all)"""
+        return self.get_logging_config().get('Rate_limit_in_sec', 60)
+
+    def get_metrics_config(self) -> Dict:
+        return self.data.get('Metrics_config', {})
+
+    def get_metrics_enabled(self) -> bool:
+        """whether the service exposes its metrics on http://Host:Port/metrics (see models/metrics.py)"""
+        return self.get_metrics_config().get('Enabled', False)
+
+    def get_debug_endpoints_enabled(self) -> bool:
+        """whether the metrics endpoint also serves /debug/locks and /debug/profile (lock holders, profiler control)"""
+        return self.get_metrics_config().get('Debug_endpoints', False)
+
+    def get_metrics_host(self) -> str:
+        return self.get_metrics_config().get('Host', '127.0.0.1')
+
+    def get_metrics_port(self) -> int:
+        return self.get_metrics_config().get('Port', 9108)
+
+    def get_lock_long_hold(self) -> float:
+        """seconds after which holding the DB or alarm_library lock is logged (see models/instrumented_lock.py)"""
+        return self.get_metrics_config().get('Lock_long_hold_in_sec', 1)
+
+    def get_profile_dir(self) -> str:
+        """directory of the profiles written by the sampling profiler (see models/profiler.py)"""
+        return self.get_metrics_config().get('Profile_dir', 'profiles')
+
+    def get_profile_interval(self) -> float:
+        """milliseconds between two samples of the threads' stacks"""
+        return self.get_metrics_config().get('Profile_interval_in_ms', 10)
+
+    def get_profile_default_duration(self) -> float:
+        return self.get_metrics_config().get('Profile_default_duration_in_sec', 30)
+
+    def get_profile_max_duration(self) -> float:
+        return self.get_metrics_config().get('Profile_max_duration_in_sec', 300)
+
+    def get_trace_sample_rate(self) -> float:
+        """fraction [0, 1] of the polls and notifier checks traced stage by stage (see models/tracing.py)"""
+        return self.get_metrics_config().get('Trace_sample_rate', 0.01)
+
+    def get_trace_kept(self) -> int:
+        """number of the most recent sampled traces served on /traces"""
+        return self.get_metrics_config().get('Trace_kept', 100)
+
+    def get_retention_config(self) -> Dict:
+        return self.data.get('Retention_config', {})
+
+    def get_retention_enabled(self) -> bool:
+        """whether the service moves the old alarms out of the local.db (see models/retention.py)"""
+        return self.get_retention_config().get('Enabled', False)
+
+    def get_retention_interval(self) -> float:
+        return self.get_retention_config().get('Interval_in_sec', 3600)
+
+    def get_retention_max_age(self) -> Dict:
+        """dict severity name -> days after which its alarms are archived (severities not listed are kept)"""
+        return self.get_retention_config().get('Max_age_in_days', {})
+
+    def get_retention_max_changes(self) -> int:
+        """changes kept in the change feed, the oldest beyond it are trimmed (the GUI live mode then reloads)"""
+        return self.get_retention_config().get('Max_changes', 100000)
+
+    def get_retention_max_rows(self) -> Dict:
+        """dict severity name -> alarms kept in the local.db, the oldest beyond it are archived"""
+        return self.get_retention_config().get('Max_rows', {})
+
+    def get_retention_archive_dir(self) -> str:
+        """directory of the archives, relative to the project root if not absolute"""
+        return self.get_retention_config().get('Archive_dir', 'archive')
+
+    def get_retention_batch_size(self) -> int:
+        """alarms archived and deleted per transaction"""
+        return self.get_retention_config().get('Batch_size', 500)
+
+    def get_retention_batch_pause(self) -> float:
+        """seconds between two batches, to let the pollers write"""
+        return self.get_retention_config().get('Batch_pause_in_sec', 0.05)
+
+    def get_retention_vacuum_pages(self) -> int:
+        """free pages given back to the file system per step of incremental vacuum"""
+        return self.get_retention_config().get('Vacuum_pages', 1000)
+
+    def get_storage_backend(self) -> str:
+        """'sqlite' (local.db) or 'log' (append-only alarms.log, single process only), see models/storage.py"""
+        return self.data.get('Storage_config', {}).get('Backend', 'sqlite')
+
+    def get_gui_config(self) -> Dict:
+        return self.data.get('GUI_config', {})
+
+    def get_live_refresh_rate(self) -> int:
+        """seconds between two checks of the DB change feed when the GUI live mode is on"""
+        return self.get_gui_config().get('Live_refresh_rate_in_sec', 5)
+
+    def get_bot_config(self) -> Dict:
+        return self.data.get('Bot_config', {})
+
+    def get_bot_enabled(self) -> bool:
+        """whether the service starts the telegram bot commands (broadcasting alarms depends on Send_message)"""
+        return self.get_bot_config().get('Enabled', True)
+
+    def get_bot_admin_chat_ids(self) -> List:
+        """chat ids allowed to use the admin commands of the bot (e.g. /profile)"""
+        return self.get_bot_config().get('Admin_chat_ids', [])
+
+    def get_bot_api_url(self) -> str:
+        """base url of the telegram bot API, it can point to a local stand-in (benchmarks)"""
+        return self.get_bot_config().get('Api_url', 'https://api.telegram.org')
+
+    def get_bot_cache_ttl(self) -> float:
+        """seconds a bot answer can be reused, as long as no alarm has been inserted or ceased in the meantime"""
+        return self.get_bot_config().get('Cache_ttl_in_sec', 10)
+
+    def get_bot_page_size(self) -> int:
+        """alarms shown in each page of /host, /active and /since"""
+        return self.get_bot_config().get('Page_size', 10)
+
+    def get_bot_worker_threads(self) -> int:
+        """number of threads answering the commands that read the DB"""
+        return self.get_bot_config().get('Worker_threads', 4)
+
+    def get_bot_command_timeout(self) -> float:
+        return self.get_bot_config().get('Command_timeout_in_sec', 15)
+
+    def get_bot_max_pending_commands(self) -> int:
+        """commands waiting for the worker pool after which the bot answers 'busy'"""
+        return self.get_bot_config().get('Max_pending_commands', 50)
+
     def getSeveritiesNumber(self) -> int:
         return len(self.data['Severity_levels'])
 
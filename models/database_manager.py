@@ -10,25 +10,32 @@ To avoid SQLInjections, NEVER append the parameters directly inside the SQL stat
 Issue #2: Performances.
 Sqlite is known for its poor performances but it's simple to implement and for the purpose of this project
 is more than enough. You want to change this with another DB as soon as you can. trust me.
+DBHandler is the sqlite implementation of models/storage.py: the other backends go behind the same interface.
 
 """
 import sqlite3
 import threading
 import logging
 import os
+import time
 from datetime import datetime
 
+from models.instrumented_lock import InstrumentedLock
+from models.storage import StorageBackend
+
 MAX_NUM_OF_THREADS_PER_OPERATION = 1
-semaphore = threading.Semaphore(MAX_NUM_OF_THREADS_PER_OPERATION)  # creating a global lock mechanism
+
+# creating a global lock mechanism. Take it with 'with semaphore:', it is released even if the statement raises.
+# Wait and hold times per caller: see models/instrumented_lock.py
+semaphore = InstrumentedLock('db', threading.Semaphore(MAX_NUM_OF_THREADS_PER_OPERATION), wrappers=(__file__,))
 
 dirname = os.path.dirname(__file__)
 default_url = os.path.join(dirname, '../local.db')
 
+class DBHandler(StorageBackend):
 
-class DBHandler(object):
-
-    def __init__(self, db_url=default_url):
-        self._db_url = db_url
+    def __init__(self, db_url=None):
+        self._db_url = db_url if db_url else default_url  # read at every call: it can be redirected (e.g. replays)
         self._connection = None
         self._cursor = None
 
@@ -41,175 +48,513 @@ class DBHandler(object):
         return self
 
     def close_connection(self):
-        semaphore.acquire()
+        with semaphore:
+            if self._connection is not None:
+                self._connection.commit()  # save all changes
+                self._connection.close()
 
-        if self._connection is not None:
-            self._connection.commit()  # save all changes
-            self._connection.close()
-
-        del self  # prevent memory leak
-
-        semaphore.release()
+            del self  # prevent memory leak
 
     def create_alarm_table(self):
-        semaphore.acquire()
-        # from here on, thread-safe environment!
-        try:
-            self._cursor.execute('''CREATE TABLE IF NOT EXISTS alarm
-                         (ID INTEGER PRIMARY KEY ,deviceIP text , severity text,
-                          description text, time timestamp, notified integer, ceased integer)''')
+        with semaphore:
+            # from here on, thread-safe environment!
+            try:
+                # freed pages can be given back to the file system in small steps (see incremental_vacuum).
+                # Only effective on a new local.db: an existing one keeps its mode until a full VACUUM
+                self._cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+                # AUTOINCREMENT: the ID of a deleted alarm is never given to a new one (the change feed refers to IDs)
+                self._cursor.execute('''CREATE TABLE IF NOT EXISTS alarm
+                             (ID INTEGER PRIMARY KEY AUTOINCREMENT, deviceIP text , severity text,
+                              description text, time timestamp, notified integer, ceased integer, ingested real)''')
+
+                # local.db created before the ingest time was recorded: its old rows keep NULL
+                self._cursor.execute('PRAGMA table_info(alarm)')
+                if 'ingested' not in [column[1] for column in self._cursor.fetchall()]:
+                    self._cursor.execute('ALTER TABLE alarm ADD COLUMN ingested real')
+
+                self._cursor.execute('CREATE INDEX IF NOT EXISTS alarm_time_idx ON alarm (time)')
+                # indexes used by select_alarms_page: they already return the rows in ID order, no sorting needed
+                self._cursor.execute('CREATE INDEX IF NOT EXISTS alarm_device_idx ON alarm (deviceIP, ID)')
+                self._cursor.execute('CREATE INDEX IF NOT EXISTS alarm_ceased_idx ON alarm (ceased, ID)')
+                self._cursor.execute('CREATE INDEX IF NOT EXISTS alarm_ceased_severity_idx '
+                                     'ON alarm (ceased, severity, ID)')
+
+                # rollup of the alarm table, kept up to date by insert_row_alarm and update_ceased_alarms.
+                # Graphs and bot read this instead of counting the whole history every time
+                self._cursor.execute('''CREATE TABLE IF NOT EXISTS alarm_counter
+                             (deviceIP text, severity text, ceased integer, counter integer,
+                              PRIMARY KEY (deviceIP, severity, ceased))''')
+
+                # change feed: one row for every inserted or ceased alarm. Readers remember the last seq they saw
+                # and fetch only what happened after it (see select_changes_since)
+                self._cursor.execute('''CREATE TABLE IF NOT EXISTS alarm_change
+                             (seq INTEGER PRIMARY KEY AUTOINCREMENT, alarmID integer, kind text)''')
+                self._cursor.execute('CREATE INDEX IF NOT EXISTS alarm_change_alarm_idx ON alarm_change (alarmID)')
+                # the retention trims the oldest changes (see trim_changes): the readers that did not see them reload
+                self._cursor.execute('CREATE TABLE IF NOT EXISTS alarm_change_horizon (horizon integer)')
+                self._cursor.execute('INSERT INTO alarm_change_horizon (horizon) '
+                                     'SELECT 0 WHERE NOT EXISTS (SELECT * FROM alarm_change_horizon)')
+
+                # keys of the active alarms deleted by the retention: the devices still report them, filter_new_alarms
+                # must not see them as new (they would be inserted and notified again at every poll).
+                # deleted: when, in seconds since the epoch. Expired by the retention (see expire_tombstones)
+                self._cursor.execute('''CREATE TABLE IF NOT EXISTS alarm_tombstone
+                             (deviceIP text, time timestamp, severity text, deleted real,
+                              PRIMARY KEY (deviceIP, time, severity))''')
+                self._cursor.execute('CREATE INDEX IF NOT EXISTS alarm_tombstone_deleted_idx '
+                                     'ON alarm_tombstone (severity, deleted)')
+
+                self._cursor.execute('SELECT count(*) FROM alarm_counter')
+                if self._cursor.fetchone()[0] == 0:  # first start on an existing local.db: build the rollup once
+                    self.__rebuild_alarm_counters()
+
+            except Exception as e:
+                print("something wrong creating alarm table" + str(e))
 
-        except Exception as e:
-            print("something wrong creating alarm table" + str(e))
+    def select_alarm_by_ID(self, ID='0'):
+        with semaphore:
+            result = ''
 
-        finally:
-            semaphore.release()  # avoiding deadlock
+            try:
+                t = (ID,)
+                self._cursor.execute('SELECT * FROM alarm WHERE ID=?', t)
+                result = self._cursor.fetchone()
 
-    def select_alarm_by_ID(self, ID='0'):
-        semaphore.acquire()
+            except Exception as e:
+                logging.log(logging.ERROR, "something wrong selecting alarm by ID" + str(e))
 
-        result = ''
+        return result
 
-        try:
-            t = (ID,)
-            self._cursor.execute('SELECT * FROM alarm WHERE ID=?', t)
-            result = self._cursor.fetchone()
+    def select_alarm_by_severity_unnotified(self, severity):
+        with semaphore:
+            if severity is None:
+                severity = '0'
 
-        except Exception as e:
-            logging.log(logging.ERROR, "something wrong selecting alarm by ID" + str(e))
+            notified = 0
+            t = (severity, notified)
 
-        finally:
-            semaphore.release()
+            self._cursor.execute('SELECT * FROM alarm WHERE (severity>=?) AND (notified=?) ORDER BY severity desc', t)
+            result = self._cursor.fetchall()
 
         return result
 
-    def select_alarm_by_severity_unnotified(self, severity):
-        semaphore.acquire()
+    def select_count_by_device_ip(self, description, host):
+        with semaphore:
+            if description is None or host is None:
+                description=''
+                host=''
 
-        if severity is None:
-            severity = '0'
+            t =(description, host)
 
-        notified = 0
-        t = (severity, notified)
+            self._cursor.execute('SELECT COUNT() FROM alarm WHERE DESCRIPTION=? AND deviceIP=?', t)
+            result = self._cursor.fetchall()
 
-        self._cursor.execute('SELECT * FROM alarm WHERE (severity>=?) AND (notified=?) ORDER BY severity desc', t)
-        result = self._cursor.fetchall()
+        return result
 
-        semaphore.release()
+    def select_alarm_by_host_time_severity(self, host, timestamp, severity):
+        with semaphore:
+            t = (host, timestamp, severity)
+
+            self._cursor.execute('SELECT * FROM alarm WHERE (deviceIP=?) AND (time =?) AND (severity=?)', t)
+            result = self._cursor.fetchall()
 
         return result
 
-    def select_count_by_device_ip(self, description, host):
-        semaphore.acquire()
+    def select_alarm_by_device_ip(self, host):
+        with semaphore:
+            t = (host,)
 
-        if description is None or host is None:
-            description=''
-            host=''
+            self._cursor.execute('SELECT * FROM alarm WHERE (deviceIP=?)', t)
+            result = self._cursor.fetchall()
 
-        t =(description, host)
+        return result
 
-        self._cursor.execute('SELECT COUNT() FROM alarm WHERE DESCRIPTION=? AND deviceIP=?', t)
-        result = self._cursor.fetchall()
+    def select_alarms_page(self, device_ip=None, severity=None, active_only=False, since=None, before_ID=None,
+                           limit=10):
+        """
+        keyset pagination of the alarm table, newest alarms first. Only the rows of the page are read.
+
+        @param device_ip: only the alarms of this host
+        @param severity: only the alarms with this severity
+        @param active_only: only the alarms that are not ceased
+        @param since: only the alarms with time >= since ('YYYY-MM-DD HH:MM:SS')
+        @param before_ID: ID of the last alarm of the previous page (None for the first page)
+        @param limit: size of the page
+        @return: list of tuples (same as select_all), at most limit + 1: the extra row tells that there is a next page
+        """
+        with semaphore:
+            conditions, t = [], []
+
+            if device_ip is not None:
+                conditions.append('deviceIP = ?')
+                t.append(device_ip)
+            if active_only:
+                conditions.append('ceased = 0')
+            if severity is not None:
+                conditions.append('severity = ?')
+                t.append(str(severity))
+            if since is not None:
+                conditions.append('time >= ?')
+                t.append(str(since))
+            if before_ID is not None:
+                conditions.append('ID < ?')
+                t.append(before_ID)
+
+            where = ' WHERE ' + ' AND '.join(conditions) if len(conditions) > 0 else ''
+            t.append(limit + 1)
+
+            # only fixed strings are appended to the statement, the values are always passed as parameters
+            self._cursor.execute('SELECT * FROM alarm' + where + ' ORDER BY ID DESC LIMIT ?', t)
+            result = self._cursor.fetchall()
 
-        semaphore.release()
+        return result
+
+    def select_alarms_after_ID(self, after_ID=0, limit=10000, upto_ID=None):
+        """
+        keyset pagination of the alarm table, oldest alarms first, to stream it chunk by chunk (e.g. exports)
+
+        @param after_ID: ID of the last alarm of the previous chunk (0 for the first chunk)
+        @param upto_ID: only the alarms with ID <= upto_ID, None for all
+        @return: (column names, list of tuples as select_all) of at most limit alarms
+        """
+        with semaphore:
+            t = [after_ID]
+            condition = ''
+            if upto_ID is not None:
+                condition = ' AND ID <= ?'
+                t.append(upto_ID)
+            t.append(limit)
+
+            self._cursor.execute('SELECT * FROM alarm WHERE ID > ?' + condition + ' ORDER BY ID LIMIT ?', t)
+            result = self._cursor.fetchall()
+            columns = [column[0] for column in self._cursor.description]
+
+        return columns, result
+
+    def select_last_alarm_ID(self):
+        """@return: the highest alarm ID (0 if the table is empty)"""
+        with semaphore:
+            self._cursor.execute('SELECT coalesce(max(ID), 0) FROM alarm')
+            result = self._cursor.fetchone()[0]
 
         return result
 
-    def select_alarm_by_host_time_severity(self, host, timestamp, severity):
-        semaphore.acquire()
+    def select_ceased_alarms(self):
+        with semaphore:
+            ceased = 1
+            t = (ceased,)
 
-        t = (host, timestamp, severity)
+            self._cursor.execute('SELECT * FROM alarm WHERE (ceased=?)', t)
+            result = self._cursor.fetchall()
 
-        self._cursor.execute('SELECT * FROM alarm WHERE (deviceIP=?) AND (time =?) AND (severity=?)', t)
-        result = self._cursor.fetchall()
+        return result
 
-        semaphore.release()
+
+    def select_all(self):
+        with semaphore:
+            self._cursor.execute('SELECT * FROM alarm')
+            result = self._cursor.fetchall()
 
         return result
 
-    def select_alarm_by_device_ip(self, host):
-        semaphore.acquire()
+    def insert_row_alarm(self, device_ip='0.0.0.0', severity='0', description='debug', _time=None, notified=0, ceased=0,
+                         ingested=None):
+        """@param ingested: epoch when the collector received the alarm (now if None)"""
+        with semaphore:
+            if _time is None:
+                _time = datetime.now()
+
+            if ingested is None:
+                ingested = time.time()
+
+            t = (device_ip, severity, description, _time, notified, ceased, ingested)
+
+            self._cursor.execute('''INSERT INTO alarm 
+                (deviceIP, severity, description, time, notified, ceased, ingested) VALUES (?, ?, ?, ?, ?, ?, ?)''', t)
+            alarm_id = self._cursor.lastrowid
+
+            # same transaction of the insert: all are committed (or lost) together in close_connection()
+            self.__add_to_alarm_counter(device_ip, severity, ceased, 1)
+            self.__add_to_alarm_change(alarm_id, 'insert')
+
+    def insert_alarms(self, alarms):
+        """@param alarms: list of tuples (device_ip, severity, description, time, ingested), all in one transaction"""
+        with semaphore:
+            for device_ip, severity, description, _time, ingested in alarms:
+                if ingested is None:
+                    ingested = time.time()
+
+                self._cursor.execute('INSERT INTO alarm (deviceIP, severity, description, time, notified, ceased, '
+                                     'ingested) VALUES (?, ?, ?, ?, 0, 0, ?)',
+                                     (device_ip, severity, description, _time, ingested))
+                alarm_id = self._cursor.lastrowid
+
+                self.__add_to_alarm_counter(device_ip, severity, 0, 1)
+                self.__add_to_alarm_change(alarm_id, 'insert')
+
+    def filter_new_alarms(self, host, keys):
+        """
+        @param keys: list of tuples (time, severity) of the alarms of host
+        @return: the keys that are not in the alarm table yet, nor deleted by the retention, in the same order
+        """
+        with semaphore:
+            saved = set()
+
+            times = list({str(_time) for _time, _ in keys})
+            for i in range(0, len(times), 500):  # chunked to stay below sqlite's limit of host parameters
+                chunk = times[i:i + 500]
+                for table in ('alarm', 'alarm_tombstone'):
+                    self._cursor.execute('SELECT time, severity FROM %s WHERE deviceIP = ? AND time IN (%s)'
+                                         % (table, ','.join('?' * len(chunk))), [host] + chunk)
+                    saved.update((str(_time), str(severity)) for _time, severity in self._cursor.fetchall())
+
+        return [key for key in keys if (str(key[0]), str(key[1])) not in saved]
 
-        t = (host,)
+    def count_alarms(self):
+        with semaphore:
+            self._cursor.execute('''SELECT count(ID), severity FROM alarm GROUP BY severity''')
+            _result = self._cursor.fetchall()
 
-        self._cursor.execute('SELECT * FROM alarm WHERE (deviceIP=?)', t)
-        result = self._cursor.fetchall()
+        return _result
 
-        semaphore.release()
+    def count_alarms_by_description_and_device(self):
+        with semaphore:
+            self._cursor.execute('''SELECT description, deviceIP, count(ID) FROM alarm
+                GROUP BY description, deviceIP''')
+            _result = self._cursor.fetchall()
 
-        return result
+        return _result
 
-    def select_ceased_alarms(self):
-        semaphore.acquire()
+    def count_alarms_per_time_bucket(self, since, bucket_in_sec):
+        """
+        groups the alarms newer than 'since' in buckets of bucket_in_sec seconds (aligned to the unix epoch)
+        @param since: timestamp in the same format of the time column ('YYYY-MM-DD HH:MM:SS')
+        @return: list of tuples (bucket start as unix time, severity, count) ordered by bucket
+        """
+        with semaphore:
+            t = (bucket_in_sec, bucket_in_sec, str(since))
 
-        ceased = 1
-        t = (ceased,)
+            self._cursor.execute('''SELECT CAST(strftime('%s', time) AS INTEGER) / ? * ? AS bucket, severity, count(ID)
+                FROM alarm WHERE time >= ? GROUP BY bucket, severity ORDER BY bucket''', t)
+            _result = self._cursor.fetchall()
 
-        self._cursor.execute('SELECT * FROM alarm WHERE (ceased=?)', t)
-        result = self._cursor.fetchall()
+        return _result
 
-        semaphore.release()
+    def update_ceased_alarms(self, ID):
+        with semaphore:
+            ceased = 1
+            t = (ceased, ID)
 
-        return result
+            self._cursor.execute('UPDATE alarm SET ceased = ? WHERE ID = ? AND ceased = 0', t)
 
+            if self._cursor.rowcount == 1:  # the alarm was active: move it from the active to the ceased counter
+                self._cursor.execute('SELECT deviceIP, severity FROM alarm WHERE ID = ?', (ID,))
+                device_ip, severity = self._cursor.fetchone()
 
-    def select_all(self):
-        semaphore.acquire()
+                self.__add_to_alarm_counter(device_ip, severity, 0, -1)
+                self.__add_to_alarm_counter(device_ip, severity, ceased, 1)
+                self.__add_to_alarm_change(ID, 'cease')
 
-        self._cursor.execute('SELECT * FROM alarm')
-        result = self._cursor.fetchall()
+    def select_alarm_counters(self):
+        """
+        reads the rollup of the alarm table
+        @return: list of tuples (deviceIP, severity, ceased, counter)
+        """
+        with semaphore:
+            self._cursor.execute('SELECT deviceIP, severity, ceased, counter FROM alarm_counter WHERE counter > 0')
+            result = self._cursor.fetchall()
 
-        semaphore.release()
+        return result
+
+    def select_last_change_seq(self):
+        """@return: the seq of the most recent change (0 if nothing happened yet)"""
+        with semaphore:
+            self._cursor.execute('SELECT coalesce(max(seq), 0) FROM alarm_change')
+            result = self._cursor.fetchone()[0]
 
         return result
 
-    def insert_row_alarm(self, device_ip='0.0.0.0', severity='0', description='debug', _time=None, notified=0, ceased=0):
-        semaphore.acquire()
+    def select_change_horizon(self):
+        """@return: the changes up to this seq may have been trimmed: a reader that saw less must reload everything"""
+        with semaphore:
+            self._cursor.execute('SELECT horizon FROM alarm_change_horizon')
+            result = self._cursor.fetchone()[0]
 
-        if _time is None:
-            _time = datetime.now()
+        return result
 
-        t = (device_ip, severity, description, _time, notified, ceased)
+    def select_changes_since(self, seq):
+        """
+        @param seq: last change seq already seen by the caller
+        @return: list of tuples (seq, alarmID, kind) newer than seq, kind is 'insert', 'cease' or 'delete'
+        """
+        with semaphore:
+            self._cursor.execute('SELECT seq, alarmID, kind FROM alarm_change WHERE seq > ? ORDER BY seq', (seq,))
+            result = self._cursor.fetchall()
 
-        self._cursor.execute('''INSERT INTO alarm 
-            (deviceIP, severity, description, time, notified, ceased) VALUES (?, ?, ?, ?, ?, ?)''', t)
+        return result
 
-        semaphore.release()
+    def select_alarms_by_IDs(self, IDs):
+        with semaphore:
+            result = []
 
-    def count_alarms(self):
-        semaphore.acquire()
+            # chunked to stay below sqlite's limit of host parameters
+            IDs = list(IDs)
+            for i in range(0, len(IDs), 500):
+                chunk = IDs[i:i + 500]
+                self._cursor.execute('SELECT * FROM alarm WHERE ID IN (%s) ORDER BY ID' % ','.join('?' * len(chunk)),
+                                     chunk)
+                result += self._cursor.fetchall()
 
-        self._cursor.execute('''SELECT count(ID), severity FROM alarm GROUP BY severity''')
-        _result = self._cursor.fetchall()
+        return result
 
-        semaphore.release()
+    def select_expired_alarms(self, severity, before, notification_threshold, limit):
+        """
+        the oldest alarms of a severity that nobody needs anymore: ceased, notified or below the notification threshold
+
+        @param before: only the alarms ingested before it (seconds since the epoch), None for any time. The rows
+                       without an ingest time use their time
+        @param notification_threshold: the alarms below it are never notified
+        @return: (column names, list of tuples as select_all) of at most limit alarms, first ingested first
+        """
+        with semaphore:
+            t = [str(severity), notification_threshold]
+            condition = ''
+            if before is not None:
+                condition = " AND coalesce(ingested, CAST(strftime('%s', time) AS REAL)) < ?"
+                t.append(before)
+            t.append(limit)
+
+            self._cursor.execute('SELECT * FROM alarm WHERE severity = ? '
+                                 'AND (ceased = 1 OR notified = 1 OR CAST(severity AS INTEGER) < ?)' + condition +
+                                 ' ORDER BY ID LIMIT ?', t)
+            result = self._cursor.fetchall()
+            columns = [column[0] for column in self._cursor.description]
+
+        return columns, result
+
+    def delete_alarms(self, IDs, deleted_at=None):
+        """
+        deletes the alarms and keeps the rollup and the change feed consistent: the changes of the deleted alarms
+        are replaced by a single 'delete' each. The keys of the ones not ceased are kept in the alarm_tombstone
+        @param deleted_at: seconds since the epoch recorded in the tombstones (now if None)
+        @return: number of alarms deleted
+        """
+        with semaphore:
+            deleted = 0
+            deleted_at = deleted_at if deleted_at is not None else time.time()
+
+            IDs = list(IDs)
+            for i in range(0, len(IDs), 500):  # chunked to stay below sqlite's limit of host parameters
+                chunk = IDs[i:i + 500]
+                marks = ','.join('?' * len(chunk))
+
+                self._cursor.execute('SELECT ID, deviceIP, severity, ceased FROM alarm WHERE ID IN (%s)' % marks,
+                                     chunk)
+                rows = self._cursor.fetchall()
+
+                self._cursor.execute('INSERT OR REPLACE INTO alarm_tombstone (deviceIP, time, severity, deleted) '
+                                     'SELECT deviceIP, time, severity, ? FROM alarm WHERE ceased = 0 AND ID IN (%s)'
+                                     % marks, [deleted_at] + chunk)
+
+                self._cursor.execute('DELETE FROM alarm WHERE ID IN (%s)' % marks, chunk)
+                self._cursor.execute('DELETE FROM alarm_change WHERE alarmID IN (%s)' % marks, chunk)
+
+                for alarm_id, device_ip, severity, ceased in rows:
+                    self.__add_to_alarm_counter(device_ip, severity, ceased, -1)
+                    self.__add_to_alarm_change(alarm_id, 'delete')
+
+                deleted += len(rows)
+
+        return deleted
+
+    def expire_tombstones(self, severity, before, limit):
+        """
+        forgets the tombstones of a severity deleted before before (seconds since the epoch), at most limit
+        @return: number of tombstones expired
+        """
+        with semaphore:
+            self._cursor.execute('DELETE FROM alarm_tombstone WHERE rowid IN (SELECT rowid FROM alarm_tombstone '
+                                 'WHERE severity = ? AND deleted < ? LIMIT ?)', (str(severity), before, limit))
+            expired = self._cursor.rowcount
+
+        return expired
+
+    def trim_changes(self, keep, limit):
+        """
+        deletes the oldest changes of the feed, at most limit, so that only the last keep (at least 1) are left,
+        and moves the horizon (see select_change_horizon) after them
+        @return: number of changes deleted
+        """
+        with semaphore:
+            # the newest change to trim: the one after the last keep
+            self._cursor.execute('SELECT seq FROM alarm_change ORDER BY seq DESC LIMIT 1 OFFSET ?', (max(1, keep),))
+            boundary = self._cursor.fetchone()
+            seqs = []
+
+            if boundary is not None:
+                self._cursor.execute('SELECT seq FROM alarm_change WHERE seq <= ? ORDER BY seq LIMIT ?',
+                                     (boundary[0], limit))
+                seqs = [row[0] for row in self._cursor.fetchall()]
+
+            if len(seqs) > 0:
+                self._cursor.execute('DELETE FROM alarm_change WHERE seq <= ?', (seqs[-1],))
+                self._cursor.execute('UPDATE alarm_change_horizon SET horizon = max(horizon, ?)', (seqs[-1],))
+
+        return len(seqs)
+
+    def incremental_vacuum(self, pages):
+        """
+        gives back to the file system at most pages free pages (only if the local.db is in incremental auto_vacuum)
+        @return: free pages left
+        """
+        with semaphore:
+            # the pragma frees one page per step: executescript steps it to the end, a cursor would stop after one
+            self._connection.executescript('PRAGMA incremental_vacuum(%d)' % int(pages))
+            self._cursor.execute('PRAGMA freelist_count')
+            result = self._cursor.fetchone()[0]
 
-        return _result
+        return result
 
-    def update_ceased_alarms(self, ID):
-        semaphore.acquire()
+    def compact(self, limit):
+        """see incremental_vacuum, limit is in pages"""
+        return self.incremental_vacuum(limit)
 
-        ceased = 1
-        t = (ID, ceased)
+    def rebuild_alarm_counters(self):
+        """recomputes the rollup from scratch, e.g. after the alarm table has been edited by hand"""
+        with semaphore:
+            self.__rebuild_alarm_counters()
 
-        self._cursor.execute('UPDATE alarm SET ceased = ? WHERE ID = ?', t)
+    def __add_to_alarm_counter(self, device_ip, severity, ceased, delta):
+        # the caller must already hold the semaphore
+        t = (device_ip, str(severity), int(bool(ceased)))
 
-        semaphore.release()
+        self._cursor.execute('INSERT OR IGNORE INTO alarm_counter (deviceIP, severity, ceased, counter) '
+                             'VALUES (?, ?, ?, 0)', t)
+        self._cursor.execute('UPDATE alarm_counter SET counter = counter + ? '
+                             'WHERE deviceIP = ? AND severity = ? AND ceased = ?', (delta,) + t)
 
-    def update_notified_by_ID(self, ID):
-        semaphore.acquire()
+    def __add_to_alarm_change(self, alarm_id, kind):
+        # the caller must already hold the semaphore
+        self._cursor.execute('INSERT INTO alarm_change (alarmID, kind) VALUES (?, ?)', (alarm_id, kind))
 
-        notified = 1
+    def __rebuild_alarm_counters(self):
+        # the caller must already hold the semaphore
+        self._cursor.execute('DELETE FROM alarm_counter')
+        self._cursor.execute('''INSERT INTO alarm_counter (deviceIP, severity, ceased, counter)
+            SELECT deviceIP, severity, (coalesce(ceased, 0) = 1), count(*) FROM alarm
+            GROUP BY deviceIP, severity, (coalesce(ceased, 0) = 1)''')
 
-        if len(ID) == 0:
-            semaphore.release()
-            return
+    def update_notified_by_ID(self, ID):
+        with semaphore:
+            notified = 1
 
-        t = [(notified, _id) for _id in ID]
+            if len(ID) == 0:
+                return
 
-        self._cursor.executemany('UPDATE alarm SET notified = ? WHERE ID = ?;', t)
+            t = [(notified, _id) for _id in ID]
 
-        semaphore.release()
+            self._cursor.executemany('UPDATE alarm SET notified = ? WHERE ID = ?;', t)
 
 
 if __name__ == '__main__':
@@ -6,9 +6,10 @@ Definition of device model.
 
 
 class Device(object):
-    def __init__(self, ip, netconf_rate, netconf_port, user, password):
+    def __init__(self, ip, netconf_rate, netconf_port, user, password, jitter=0.0):
         self.ip = ip
         self.netconf_rate = netconf_rate
         self.netconf_port = netconf_port
         self.user = user
         self.password = password
+        self.jitter = jitter  # fraction of netconf_rate the polls are randomly moved by
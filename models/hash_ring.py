@@ -0,0 +1,67 @@
+"""
+Consistent hashing ring used to split the devices among collector processes (or nodes).
+Adding or removing a node only moves the keys of that node: all the other devices keep their owner.
+"""
+import bisect
+import hashlib
+from typing import Dict, List
+
+
+def _hash(key) -> int:
+    # md5 is used only to spread the keys: it is stable across processes and python runs (hash() is not)
+    return int(hashlib.md5(str(key).encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+
+    def __init__(self, nodes, replicas=100):
+        """
+        @param nodes: list of node names (anything with a stable str(), e.g. shard indexes)
+        @param replicas: virtual points of each node on the ring. More points, more even split
+        """
+        self.replicas = replicas
+        self._ring = []  # sorted list of (point, node)
+
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        for i in range(self.replicas):
+            bisect.insort(self._ring, (_hash(f'{node}#{i}'), node))
+
+    def remove_node(self, node):
+        self._ring = [(point, _node) for point, _node in self._ring if _node != node]
+
+    def get_node(self, key):
+        """@return: the node owning key (the first point of the ring after the hash of key)"""
+        if len(self._ring) == 0:
+            raise ValueError('the hash ring has no nodes')
+
+        index = bisect.bisect(self._ring, (_hash(key),))
+        return self._ring[index % len(self._ring)][1]
+
+    def partition(self, keys) -> Dict:
+        """@return: dict node -> list of the keys it owns (every node is present, even if it owns nothing)"""
+        result = {node: [] for _, node in self._ring}
+
+        for key in keys:
+            result[self.get_node(key)].append(key)
+
+        return result
+
+
+def partition_devices(devices, shards) -> List:
+    """
+    splits the devices in shards using consistent hashing on the device ip
+
+    @param devices: list of Device objects
+    @param shards: number of shards
+    @return: list of shards lists of Device objects (some of them can be empty)
+    """
+    ring = HashRing(range(shards))
+    result = [[] for _ in range(shards)]
+
+    for device in devices:
+        result[ring.get_node(device.ip)].append(device)
+
+    return result
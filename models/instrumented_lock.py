@@ -0,0 +1,189 @@
+"""
+Lock wrapper recording, for every call site (file:function) that takes it, how many times it was taken,
+how long the callers waited for it and how long they held it. Holds longer than a threshold are logged and counted.
+
+It is a drop-in replacement for the global DB semaphore and the lock of alarm_library: use it as a
+context manager, so that it is released even if the statement raises.
+
+    lock = InstrumentedLock('db', threading.Semaphore(1))
+
+    with lock:
+        ...
+
+The modules taking the lock inside their own functions (the DB handlers) pass their file as a wrapper: the call site
+recorded is the caller of the handler (e.g. alarm_library.py:save_to_db), not the handler method.
+
+locks_report() (served on /debug/locks by the service) shows the current holders of every lock and
+the call sites sorted by the time spent waiting: the callers starving the others are at the top.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, List
+
+from models import metrics
+
+LOCK_WAIT_SECONDS = metrics.histogram('lock_wait_seconds', 'time waited to take a lock', ['lock'])
+LOCK_HOLD_SECONDS = metrics.histogram('lock_hold_seconds', 'time a lock was held', ['lock'])
+LONG_HOLDS = metrics.counter('lock_long_holds_total', 'holds longer than the long hold threshold',
+                             ['lock', 'site'])
+
+_LOCKS = []  # every InstrumentedLock created, for locks_report()
+
+
+class _SiteStats(object):
+    __slots__ = ('acquisitions', 'wait_total', 'wait_max', 'hold_total', 'hold_max', 'long_holds')
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+        self.long_holds = 0
+
+    def to_dict(self) -> Dict:
+        return {'acquisitions': self.acquisitions,
+                'wait_total_ms': self.wait_total * 1000,
+                'wait_max_ms': self.wait_max * 1000,
+                'hold_total_ms': self.hold_total * 1000,
+                'hold_max_ms': self.hold_max * 1000,
+                'long_holds': self.long_holds}
+
+
+class InstrumentedLock(object):
+
+    def __init__(self, name, primitive=None, long_hold=1.0, wrappers=()):
+        """
+        @param name: name of the lock in the metrics and in the report
+        @param primitive: the lock or semaphore wrapped (a new threading.Lock if None). It must not be reentrant
+        @param long_hold: seconds after which a hold is logged as a long hold
+        @param wrappers: files (their __file__) of the modules taking the lock on behalf of their callers:
+                         their frames are skipped when looking for the call site
+        """
+        self.name = name
+        self.long_hold = long_hold
+        self._primitive = primitive if primitive is not None else threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._sites = {}  # key: call site, item: _SiteStats
+        self._site_names = {}  # key: code object of the caller, item: its call site (formatted once)
+        self._wrappers = frozenset(os.path.abspath(path) for path in wrappers)
+        self._wrapper_codes = {}  # key: code object, item: True if it belongs to one of the wrappers
+        self._holders = {}  # key: thread ident, item: (call site, perf_counter when taken)
+        self._wait_seconds = LOCK_WAIT_SECONDS.labels(name)
+        self._hold_seconds = LOCK_HOLD_SECONDS.labels(name)
+
+        _LOCKS.append(self)
+
+    def acquire(self, blocking=True, timeout=None) -> bool:
+        return self._acquire(self._caller_code(sys._getframe(1)), blocking, timeout)
+
+    def release(self):
+        holder = self._holders.pop(threading.get_ident(), None)
+        self._primitive.release()
+
+        if holder is None:  # released by another thread than the one that took it: hold time unknown
+            return
+
+        site, taken = holder
+        hold = time.perf_counter() - taken
+        self._hold_seconds.observe(hold)
+
+        with self._stats_lock:
+            stats = self._sites[site]
+            stats.hold_total += hold
+            stats.hold_max = max(stats.hold_max, hold)
+            if hold > self.long_hold:
+                stats.long_holds += 1
+
+        if hold > self.long_hold:
+            LONG_HOLDS.labels(self.name, site).inc()
+            logging.log(logging.WARNING, f'lock {self.name} held for {hold:.3f}s by {site}')
+
+    def __enter__(self):
+        self._acquire(self._caller_code(sys._getframe(1)), True, None)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def holders(self) -> List:
+        """@return: list of dicts (thread, site, held_for_ms) of the threads holding the lock right now"""
+        now = time.perf_counter()
+        threads = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        return [{'thread': threads.get(ident, str(ident)), 'site': site, 'held_for_ms': (now - taken) * 1000}
+                for ident, (site, taken) in list(self._holders.items())]
+
+    def stats(self) -> Dict:
+        """@return: dict call site -> acquisitions, wait and hold times (total and max, in ms), long holds"""
+        with self._stats_lock:
+            return {site: stats.to_dict() for site, stats in self._sites.items()}
+
+    def _caller_code(self, frame):
+        """@return: code object of the first frame, from frame outwards, that is not in a wrapper"""
+        code = frame.f_code
+        if not self._wrappers:
+            return code
+
+        while frame.f_back is not None:
+            is_wrapper = self._wrapper_codes.get(code)
+            if is_wrapper is None:
+                is_wrapper = self._wrapper_codes.setdefault(code, os.path.abspath(code.co_filename) in self._wrappers)
+            if not is_wrapper:
+                break
+
+            frame = frame.f_back
+            code = frame.f_code
+
+        return code
+
+    def _acquire(self, code, blocking, timeout) -> bool:
+        site = self._site_names.get(code)
+        if site is None:
+            site = self._site_names.setdefault(code, f'{os.path.basename(code.co_filename)}:{code.co_name}')
+
+        start = time.perf_counter()
+        acquired = self._primitive.acquire(blocking) if timeout is None else self._primitive.acquire(blocking, timeout)
+        taken = time.perf_counter()
+        wait = taken - start
+
+        self._wait_seconds.observe(wait)
+
+        with self._stats_lock:
+            stats = self._sites.get(site)
+            if stats is None:
+                stats = self._sites[site] = _SiteStats()
+
+            stats.wait_total += wait
+            stats.wait_max = max(stats.wait_max, wait)
+            if acquired:
+                stats.acquisitions += 1
+
+        if acquired:
+            self._holders[threading.get_ident()] = (site, taken)
+
+        return acquired
+
+
+def configure(config_manager):
+    """applies the Lock_long_hold_in_sec of the config.json to every lock"""
+    for lock in list(_LOCKS):
+        lock.long_hold = config_manager.get_lock_long_hold()
+
+
+def locks_report() -> str:
+    """@return: JSON of every lock: its current holders and its call sites, the ones that waited most first"""
+    report = []
+
+    for lock in list(_LOCKS):
+        sites = sorted(lock.stats().items(), key=lambda item: item[1]['wait_total_ms'], reverse=True)
+        report.append({'lock': lock.name,
+                       'long_hold_sec': lock.long_hold,
+                       'holders': lock.holders(),
+                       'sites': [dict(site=site, **stats) for site, stats in sites]})
+
+    return json.dumps(report, indent=1)
@@ -0,0 +1,53 @@
+"""
+Helpers to import the heavy, optional modules (GUI, telegram bot, ...) only when the feature that needs them is enabled.
+Every import made through timed_import() is timed, so that cold-start regressions can be tracked
+(see import_report(), printed by 'python main.py --headless --import-timing').
+"""
+import importlib
+import logging
+import sys
+import threading
+import time
+from typing import Dict
+
+# key: module name, item: seconds spent importing it (including its own dependencies not imported yet)
+import_times = {}
+_lock = threading.Lock()
+
+
+def timed_import(module_name):
+    """
+    imports module_name (if it wasn't already) recording how long it took
+
+    @param module_name: absolute module name, e.g. 'services.telegram_bot_service'
+    @return: the module
+    """
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    elapsed = time.perf_counter() - start
+
+    with _lock:
+        import_times.setdefault(module_name, elapsed)
+
+    logging.log(logging.INFO, f'imported {module_name} in {elapsed * 1000:.1f} ms')
+
+    return module
+
+
+def get_import_times() -> Dict:
+    with _lock:
+        return dict(import_times)
+
+
+def import_report() -> str:
+    """@return: one line per module imported through timed_import, slowest first"""
+    times = get_import_times()
+
+    lines = [f'{seconds * 1000:9.1f} ms  {name}' for name, seconds in sorted(times.items(), key=lambda i: -i[1])]
+    lines.append(f'{sum(times.values()) * 1000:9.1f} ms  total')
+
+    return '\n'.join(lines)
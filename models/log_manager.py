@@ -0,0 +1,134 @@
+"""
+Logging of the whole process, set up once by the entry points (main.py, services/main_service.py,
+simulator/__main__.py) with setup_logging().
+The modules only call logging.log(...) / logging.exception(...), they never configure anything.
+
+The records are put in a queue by the calling thread and written by a single listener thread (QueueHandler ->
+QueueListener -> file), so the pollers never wait for the disk. The same message repeated by the same line of code is
+written once per Rate_limit_in_sec: the next one says how many were suppressed in the meantime.
+With Json set to true every line is a JSON object (time, level, logger, thread, message, exception).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from models.config_manager import ConfigManager
+
+dirname = os.path.dirname(__file__)
+
+TEXT_FORMAT = '%(asctime)s - %(threadName)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class RateLimitFilter(logging.Filter):
+    """lets through the first of the identical records (same line of code, same message) of every period"""
+
+    def __init__(self, period=60.0, clock=time.monotonic, max_keys=10000):
+        """
+        @param period: seconds during which the repetitions of a record are suppressed (0: nothing is suppressed)
+        @param clock: function returning the current time in seconds (for testing)
+        @param max_keys: distinct records remembered; beyond it the ones older than period are forgotten
+        """
+        super().__init__()
+        self.period = period
+        self._clock = clock
+        self._max_keys = max_keys
+        self._lock = threading.Lock()
+        self._seen = {}  # key: (file, line, level, message), item: [start of its period, repetitions suppressed]
+
+    def filter(self, record) -> bool:
+        if self.period <= 0:
+            return True
+
+        key = (record.pathname, record.lineno, record.levelno, record.getMessage())
+        now = self._clock()
+
+        with self._lock:
+            seen = self._seen.get(key)
+
+            if seen is not None and now - seen[0] < self.period:
+                seen[1] += 1
+                return False
+
+            suppressed = seen[1] if seen is not None else 0
+            self._seen[key] = [now, 0]
+
+            if len(self._seen) > self._max_keys:
+                self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.period}
+
+        if suppressed > 0:
+            record.msg = f'{record.getMessage()} (repeated {suppressed} more times in the last {self.period:.0f}s)'
+            record.args = None
+
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """one JSON object per line"""
+
+    def format(self, record) -> str:
+        line = {'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                'level': record.levelname,
+                'logger': record.name,
+                'thread': record.threadName,
+                'message': record.getMessage()}
+
+        if record.exc_info:
+            line['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(line)
+
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    """
+    the default prepare() formats the record (traceback included) in the calling thread, to make it picklable.
+    The queue never leaves the process: only the message is resolved here, the formatting is left to the listener
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(config_manager=None) -> logging.handlers.QueueListener:
+    """
+    routes the records of the whole process to the Logging_config sink. Only the first call does something
+
+    @param config_manager: ConfigManager to read the Logging_config from (a new one if None)
+    @return: the listener thread writing the records
+    """
+    global _listener
+
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        if config_manager is None:
+            config_manager = ConfigManager()
+
+        sink = logging.FileHandler(os.path.join(dirname, '..', config_manager.get_log_file()))
+        sink.setFormatter(JsonFormatter() if config_manager.get_log_json() else logging.Formatter(TEXT_FORMAT))
+
+        handler = _LocalQueueHandler(queue.SimpleQueue())
+        handler.addFilter(RateLimitFilter(config_manager.get_log_rate_limit()))
+
+        root = logging.getLogger()
+        for old in list(root.handlers):  # e.g. added by a library calling logging.basicConfig()
+            root.removeHandler(old)
+        root.addHandler(handler)
+        root.setLevel(config_manager.get_log_level())
+
+        _listener = logging.handlers.QueueListener(handler.queue, sink)
+        _listener.start()
+        atexit.register(_listener.stop)  # writes what is still in the queue
+
+        return _listener
@@ -0,0 +1,632 @@
+"""
+Append-only, log-structured alarm storage (Storage_config.Backend "log", see models/storage.py).
+
+Every change is a JSON line appended to a single file (alarms.log in the project root by default):
+
+    ["i", seq, [ID, deviceIP, severity, description, time, notified, ceased, ingested]]   insert
+    ["n", [ID, ...]]                                                                     notified
+    ["c", seq, ID]                                                                       ceased
+    ["d", seq, ID, deleted at]                                                           deleted
+    ["e", [[deviceIP, time, severity], ...]]                                             tombstones expired
+    ["h", horizon]                                                                       changes trimmed
+    ["b", [record, ...]]                                                                 the records of one call
+
+The first handler of a file replays it in memory, the following ones share that state: the inserts cost an append,
+the queries never touch the disk. The changes are visible to the other handlers at once and written to the file at
+close_connection() (the commit). A line cut by a crash is dropped at the next replay: the calls that change several
+alarms (insert_alarms, delete_alarms) write a single "b" line, so they are either replayed whole or lost whole.
+compact() rewrites the file with only the live alarms, the change feed and the tombstones (keys of the active alarms
+deleted by the retention, see DBHandler.delete_alarms), without stopping the writers meanwhile:
+
+    ["m", next ID, next seq]    ["r", row]    ["s", seq, ID, kind]    ["t", deviceIP, time, severity, deleted at]
+    ["h", horizon]
+
+The state lives in this process: the sharded and cluster collector modes need the sqlite backend.
+"""
+import bisect
+import functools
+import heapq
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from models.instrumented_lock import InstrumentedLock
+from models.storage import ALARM_COLUMNS, StorageBackend
+
+dirname = os.path.dirname(__file__)
+default_url = os.path.join(dirname, '../alarms.log')
+
+# the same role of database_manager.semaphore: a single writer or reader at a time, for every file
+lock = InstrumentedLock('log_store', wrappers=(__file__,))
+
+_states = {}  # key: absolute path of the file, item: _LogState
+
+ID, DEVICE_IP, SEVERITY, DESCRIPTION, TIME, NOTIFIED, CEASED, INGESTED = range(len(ALARM_COLUMNS))
+
+
+def _epoch_second(timestamp):
+    """'2018-03-28 21:41:35.2749' (UTC) -> whole seconds since the epoch, as sqlite's strftime('%s'). None if invalid"""
+    try:
+        return _epoch_hour(timestamp[:13]) + int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+    except (TypeError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=65536)
+def _epoch_hour(prefix) -> int:
+    """'2018-03-28 21' -> seconds since the epoch. Cached: the alarms of the same hour share it"""
+    return int(datetime.fromisoformat(prefix + ':00:00').replace(tzinfo=timezone.utc).timestamp())
+
+
+def _ingested(row):
+    """ingest time of a row, its time for the rows without one (as DBHandler.select_expired_alarms)"""
+    if row[INGESTED] is not None:
+        return row[INGESTED]
+
+    epoch = _epoch_second(row[TIME])
+    return epoch if epoch is not None else float('inf')
+
+
+def _index_add(index, item):
+    """adds the item to a sorted list: usually an append, the items mostly arrive in order"""
+    if len(index) == 0 or index[-1] < item:
+        index.append(item)
+    else:
+        bisect.insort(index, item)
+
+
+def _index_remove(index, item):
+    i = bisect.bisect_left(index, item)
+    if i < len(index) and index[i] == item:
+        del index[i]
+
+
+def _severity_value(severity) -> int:
+    try:
+        return int(severity)
+    except (TypeError, ValueError):
+        return -1
+
+
+class _LogState(object):
+    """the alarm table of a file, in memory. Only used with the lock held"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = {}  # key: ID, item: list in the column order of the alarm table. IDs are increasing
+        self.keys = {}  # dedup index, key: (deviceIP, time, severity), item: list of IDs
+        self.ingested = {}  # key: severity, item: sorted list of (ingest time, ID), see select_expired_alarms
+        self.times = []  # sorted list of (time, ID)
+        self.tombstones = {}  # keys of the deleted alarms that were not ceased, item: when they were deleted
+        self.unnotified = set()  # IDs
+        self.counters = {}  # rollup, key: (deviceIP, severity, ceased), item: number of alarms
+        self.descriptions = {}  # rollup, key: (description, deviceIP), item: number of alarms
+        self.changes = []  # change feed, tuples (seq, ID, kind) by seq
+        self.change_horizon = 0  # the changes up to this seq have been trimmed
+        self.next_ID = 1
+        self.next_seq = 1
+        self.lines = 0  # in the file: compact() when there are more than the live state needs
+        self.compacting = False
+
+        self.__replay()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def append(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.lines += 1
+
+    def append_batch(self, records):
+        """a single line for all the records: a crash while writing it loses the whole batch, never a part of it"""
+        if len(records) == 1:
+            self.append(records[0])
+        elif len(records) > 1:
+            self.append(['b', records])
+
+    def insert(self, seq, row):
+        _id = row[ID]
+        self.rows[_id] = row
+        key = (row[DEVICE_IP], row[TIME], row[SEVERITY])
+        self.keys.setdefault(key, []).append(_id)
+        _index_add(self.ingested.setdefault(row[SEVERITY], []), (_ingested(row), _id))
+        _index_add(self.times, (row[TIME], _id))
+        if not row[NOTIFIED]:
+            self.unnotified.add(_id)
+        self.__add_to_counter(row[DEVICE_IP], row[SEVERITY], row[CEASED], 1)
+        self.__add_to_descriptions(row, 1)
+
+        self.next_ID = max(self.next_ID, _id + 1)
+        if seq is not None:
+            self.__add_change(seq, _id, 'insert')
+
+    def notify(self, IDs):
+        for _id in IDs:
+            row = self.rows.get(_id)
+            if row is not None and not row[NOTIFIED]:
+                row[NOTIFIED] = 1
+                self.unnotified.discard(_id)
+
+    def cease(self, seq, _id) -> bool:
+        row = self.rows.get(_id)
+        if row is None or row[CEASED]:
+            return False
+
+        row[CEASED] = 1
+        self.__add_to_counter(row[DEVICE_IP], row[SEVERITY], 0, -1)
+        self.__add_to_counter(row[DEVICE_IP], row[SEVERITY], 1, 1)
+        self.__add_change(seq, _id, 'cease')
+
+        return True
+
+    def delete(self, seq, _id, deleted_at) -> bool:
+        """the changes of the alarm must be dropped by the caller (see drop_changes)"""
+        row = self.rows.pop(_id, None)
+        if row is None:
+            return False
+
+        key = (row[DEVICE_IP], row[TIME], row[SEVERITY])
+        self.keys[key].remove(_id)
+        if len(self.keys[key]) == 0:
+            del self.keys[key]
+        _index_remove(self.ingested[row[SEVERITY]], (_ingested(row), _id))
+        _index_remove(self.times, (row[TIME], _id))
+        if not row[CEASED]:
+            self.tombstones[key] = deleted_at
+        self.unnotified.discard(_id)
+        self.__add_to_counter(row[DEVICE_IP], row[SEVERITY], row[CEASED], -1)
+        self.__add_to_descriptions(row, -1)
+        self.__add_change(seq, _id, 'delete')
+
+        return True
+
+    def drop_changes(self, IDs):
+        """the changes of the deleted alarms are replaced by their 'delete', as in the sqlite backend"""
+        self.changes = [change for change in self.changes if change[1] not in IDs or change[2] == 'delete']
+
+    def trim_changes(self, horizon):
+        self.changes = self.changes[bisect.bisect_right(self.changes, (horizon, float('inf'))):]
+        self.change_horizon = max(self.change_horizon, horizon)
+
+    def new_seq(self) -> int:
+        seq = self.next_seq
+        self.next_seq += 1
+        return seq
+
+    def rebuild_counters(self):
+        self.counters = {}
+        self.descriptions = {}
+        for row in self.rows.values():
+            self.__add_to_counter(row[DEVICE_IP], row[SEVERITY], row[CEASED], 1)
+            self.__add_to_descriptions(row, 1)
+
+    def snapshot(self):
+        """
+        the lines of the compacted file. Taken with the lock held, written without it (see LogStore.compact)
+        @return: (lines, size of the file and number of lines when they were taken)
+        """
+        self.file.flush()
+
+        lines = [['m', self.next_ID, self.next_seq]]
+        lines += [['r', list(row)] for row in self.rows.values()]  # copies: notify and cease change the rows
+        lines += [['s', seq, _id, kind] for seq, _id, kind in self.changes]
+        lines += [['t', *key, deleted_at] for key, deleted_at in self.tombstones.items()]
+        lines.append(['h', self.change_horizon])
+
+        return lines, self.file.tell(), self.lines
+
+    def swap(self, tmp, lines, offset, appended):
+        """
+        replaces the file with the compacted one, after copying in it the records appended since the snapshot
+        (the bytes from offset on). With the lock held
+        """
+        self.file.flush()
+
+        with open(self.path, 'rb') as old, open(tmp, 'ab') as new:
+            old.seek(offset)
+            new.write(old.read())
+            new.flush()
+            os.fsync(new.fileno())
+
+        self.file.close()
+        os.replace(tmp, self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.lines = lines + appended
+
+    def __add_to_descriptions(self, row, delta):
+        key = (row[DESCRIPTION], row[DEVICE_IP])
+        self.descriptions[key] = self.descriptions.get(key, 0) + delta
+        if self.descriptions[key] == 0:
+            del self.descriptions[key]
+
+    def __add_to_counter(self, device_ip, severity, ceased, delta):
+        key = (device_ip, severity, int(bool(ceased)))
+        self.counters[key] = self.counters.get(key, 0) + delta
+
+    def __add_change(self, seq, _id, kind):
+        self.changes.append((seq, _id, kind))
+        self.next_seq = max(self.next_seq, seq + 1)
+
+    def __replay(self):
+        if not os.path.exists(self.path):
+            return
+
+        deleted = set()
+        offset = good_end = 0
+
+        with open(self.path, 'rb') as _file:
+            for line in _file:
+                offset += len(line)
+                self.lines += 1
+
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('line cut')
+                    self.__replay_record(json.loads(line), deleted)
+                    good_end = offset
+
+                except (ValueError, IndexError, KeyError, TypeError) as e:
+                    logging.log(logging.ERROR, f'{self.path}: skipping a corrupted record at byte {good_end}: {e}')
+
+        if good_end < os.path.getsize(self.path):  # cut by a crash while appending: the next appends go after it
+            with open(self.path, 'r+b') as _file:
+                _file.truncate(good_end)
+
+        if len(deleted) > 0:
+            self.drop_changes(deleted)
+
+    def __replay_record(self, record, deleted):
+        op = record[0]
+
+        if op == 'b':
+            for batched in record[1]:
+                self.__replay_record(batched, deleted)
+        elif op == 'i':
+            self.insert(record[1], record[2])
+        elif op == 'n':
+            self.notify(record[1])
+        elif op == 'c':
+            self.cease(record[1], record[2])
+        elif op == 'd':
+            if self.delete(record[1], record[2], record[3]):
+                deleted.add(record[2])
+        elif op == 'e':
+            for key in record[1]:
+                self.tombstones.pop(tuple(key), None)
+        elif op == 'h':
+            self.trim_changes(record[1])
+        elif op == 'm':
+            self.next_ID, self.next_seq = max(self.next_ID, record[1]), max(self.next_seq, record[2])
+        elif op == 'r':
+            self.insert(None, record[1])
+        elif op == 's':
+            self.__add_change(record[1], record[2], record[3])
+        elif op == 't':
+            self.tombstones[(record[1], record[2], record[3])] = record[4]
+        else:
+            raise ValueError(f'unknown record {op}')
+
+
+def _state_of(path) -> _LogState:
+    # the caller must already hold the lock
+    path = os.path.abspath(path)
+    state = _states.get(path)
+
+    if state is None:
+        state = _states[path] = _LogState(path)
+
+    return state
+
+
+def release(path=None):
+    """closes the file (every file if None): the next handler replays it"""
+    with lock:
+        for _path in [os.path.abspath(path)] if path is not None else list(_states):
+            state = _states.pop(_path, None)
+            if state is not None:
+                state.file.close()
+
+
+class LogStore(StorageBackend):
+
+    def __init__(self, db_url=None):
+        """@param db_url: path of the log file (alarms.log in the project root if None)"""
+        self._path = db_url if db_url else default_url
+        self._state = None
+
+    def open_connection(self):
+        with lock:
+            self._state = _state_of(self._path)
+
+        return self
+
+    def close_connection(self):
+        with lock:
+            if self._state is not None:
+                self._state.file.flush()
+                self._state = None
+
+    def create_alarm_table(self):
+        with lock:
+            self._state.file.flush()  # an empty file from now on, even if nothing is inserted
+
+    def insert_row_alarm(self, device_ip='0.0.0.0', severity='0', description='debug', _time=None, notified=0, ceased=0,
+                         ingested=None):
+        with lock:
+            self._state.append(self.__insert(device_ip, severity, description, _time, notified, ceased, ingested))
+
+    def insert_alarms(self, alarms):
+        with lock:
+            records = []
+            try:
+                for device_ip, severity, description, _time, ingested in alarms:
+                    records.append(self.__insert(device_ip, severity, description, _time, 0, 0, ingested))
+            finally:
+                self._state.append_batch(records)  # what is in memory, also if an alarm was malformed
+
+    def filter_new_alarms(self, host, keys):
+        with lock:
+            state = self._state
+            new = []
+            for key in keys:
+                saved = (host, str(key[0]), str(key[1]))
+                if saved not in state.keys and saved not in state.tombstones:
+                    new.append(key)
+
+            return new
+
+    def select_all(self):
+        with lock:
+            return [tuple(row) for row in self._state.rows.values()]
+
+    def select_alarm_by_ID(self, ID='0'):
+        with lock:
+            row = self._state.rows.get(int(ID))
+            return tuple(row) if row is not None else None
+
+    def select_alarm_by_severity_unnotified(self, severity):
+        if severity is None:
+            severity = 0
+
+        with lock:
+            rows = self._state.rows
+            result = [rows[_id] for _id in self._state.unnotified
+                      if _severity_value(rows[_id][SEVERITY]) >= _severity_value(severity)]
+
+        return [tuple(row) for row in sorted(result, key=lambda row: (-_severity_value(row[SEVERITY]), row[ID]))]
+
+    def select_alarm_by_host_time_severity(self, host, timestamp, severity):
+        key = (host, str(timestamp), str(severity))
+
+        with lock:
+            rows = self._state.rows
+            return [tuple(rows[_id]) for _id in self._state.keys.get(key, ())]
+
+    def select_alarm_by_device_ip(self, host):
+        return self.__select(lambda row: row[DEVICE_IP] == host)
+
+    def select_ceased_alarms(self):
+        return self.__select(lambda row: row[CEASED] == 1)
+
+    def select_count_by_device_ip(self, description, host):
+        with lock:
+            return [(self._state.descriptions.get((description, host), 0),)]
+
+    def select_alarms_page(self, device_ip=None, severity=None, active_only=False, since=None, before_ID=None,
+                           limit=10):
+        result = []
+
+        with lock:
+            for row in reversed(self._state.rows.values()):
+                if before_ID is not None and row[ID] >= before_ID:
+                    continue
+                if (device_ip is not None and row[DEVICE_IP] != device_ip) or (active_only and row[CEASED]) or \
+                        (severity is not None and row[SEVERITY] != str(severity)) or \
+                        (since is not None and row[TIME] < str(since)):
+                    continue
+
+                result.append(tuple(row))
+                if len(result) > limit:
+                    break
+
+        return result
+
+    def select_alarms_by_IDs(self, IDs):
+        with lock:
+            rows = self._state.rows
+            return [tuple(rows[_id]) for _id in sorted(set(IDs)) if _id in rows]
+
+    def select_alarms_after_ID(self, after_ID=0, limit=10000, upto_ID=None):
+        with lock:
+            IDs = list(self._state.rows)
+            start = bisect.bisect_right(IDs, after_ID)
+            rows = [tuple(self._state.rows[_id]) for _id in IDs[start:start + limit]
+                    if upto_ID is None or _id <= upto_ID]
+
+        return list(ALARM_COLUMNS), rows
+
+    def select_last_alarm_ID(self):
+        with lock:
+            return next(reversed(self._state.rows), 0)
+
+    def select_expired_alarms(self, severity, before, notification_threshold, limit):
+        severity = str(severity)
+        never_notified = _severity_value(severity) < notification_threshold
+
+        with lock:
+            rows = self._state.rows
+            index = self._state.ingested.get(severity, [])
+            # only the alarms of the severity ingested before the limit, not the whole table
+            end = bisect.bisect_left(index, (before,)) if before is not None else len(index)
+            IDs = heapq.nsmallest(limit, (_id for _, _id in index[:end]
+                                          if never_notified or rows[_id][CEASED] == 1 or rows[_id][NOTIFIED] == 1))
+
+            return list(ALARM_COLUMNS), [tuple(rows[_id]) for _id in IDs]
+
+    def count_alarms(self):
+        counts = {}
+        with lock:
+            for (_, severity, _), counter in self._state.counters.items():
+                counts[severity] = counts.get(severity, 0) + counter
+
+        return [(counter, severity) for severity, counter in sorted(counts.items()) if counter > 0]
+
+    def count_alarms_by_description_and_device(self):
+        with lock:
+            return [key + (counter,) for key, counter in sorted(self._state.descriptions.items())]
+
+    def count_alarms_per_time_bucket(self, since, bucket_in_sec):
+        counts = {}
+        since = str(since)
+
+        with lock:
+            rows = self._state.rows
+            times = self._state.times
+            for _, _id in times[bisect.bisect_left(times, (since,)):]:
+                row = rows[_id]
+                epoch = _epoch_second(row[TIME])
+                bucket = epoch // bucket_in_sec * bucket_in_sec if epoch is not None else None
+                counts[(bucket, row[SEVERITY])] = counts.get((bucket, row[SEVERITY]), 0) + 1
+
+        # as sqlite: the times it cannot parse (bucket None) first
+        return [key + (counter,) for key, counter in
+                sorted(counts.items(), key=lambda item: (item[0][0] is not None, item[0][0] or 0, item[0][1]))]
+
+    def select_alarm_counters(self):
+        with lock:
+            return [key + (counter,) for key, counter in self._state.counters.items() if counter > 0]
+
+    def rebuild_alarm_counters(self):
+        with lock:
+            self._state.rebuild_counters()
+
+    def select_last_change_seq(self):
+        with lock:
+            changes = self._state.changes
+            return changes[-1][0] if len(changes) > 0 else 0
+
+    def select_changes_since(self, seq):
+        with lock:
+            changes = self._state.changes
+            return changes[bisect.bisect_right(changes, (seq, float('inf'))):]
+
+    def select_change_horizon(self):
+        with lock:
+            return self._state.change_horizon
+
+    def trim_changes(self, keep, limit):
+        with lock:
+            state = self._state
+            trimmed = state.changes[:max(0, min(limit, len(state.changes) - max(1, keep)))]
+
+            if len(trimmed) > 0:
+                state.trim_changes(trimmed[-1][0])
+                state.append(['h', trimmed[-1][0]])
+
+        return len(trimmed)
+
+    def update_notified_by_ID(self, ID):
+        if len(ID) == 0:
+            return
+
+        with lock:
+            IDs = [int(_id) for _id in ID]
+            self._state.notify(IDs)
+            self._state.append(['n', IDs])
+
+    def update_ceased_alarms(self, ID):
+        with lock:
+            state = self._state
+            seq = state.next_seq
+
+            if state.cease(seq, int(ID)):
+                state.append(['c', seq, int(ID)])
+
+    def delete_alarms(self, IDs, deleted_at=None):
+        deleted = set()
+        deleted_at = deleted_at if deleted_at is not None else time.time()
+
+        with lock:
+            state = self._state
+            records = []
+
+            for _id in IDs:
+                seq = state.next_seq
+                if state.delete(seq, int(_id), deleted_at):
+                    records.append(['d', seq, int(_id), deleted_at])
+                    deleted.add(int(_id))
+
+            if len(deleted) > 0:
+                state.drop_changes(deleted)
+            state.append_batch(records)
+
+        return len(deleted)
+
+    def expire_tombstones(self, severity, before, limit):
+        severity = str(severity)
+
+        with lock:
+            state = self._state
+            expired = [key for key, deleted_at in state.tombstones.items()
+                       if key[2] == severity and deleted_at < before][:limit]
+
+            if len(expired) > 0:
+                for key in expired:
+                    del state.tombstones[key]
+                state.append(['e', [list(key) for key in expired]])
+
+        return len(expired)
+
+    def compact(self, limit):
+        """
+        rewrites the whole file if it holds more than the live alarms and changes (limit is ignored).
+        The lock is held to take a snapshot of the state and to swap the files, not while the snapshot is written:
+        the alarms appended meanwhile are copied after it
+        """
+        with lock:
+            state = self._state
+            if state.compacting or state.lines <= 2 + len(state.rows) + len(state.changes) + len(state.tombstones):
+                return 0
+
+            state.compacting = True
+            lines, offset, appended_from = state.snapshot()
+
+        tmp = state.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as _file:
+                for line in lines:
+                    _file.write(json.dumps(line, separators=(',', ':')) + '\n')
+                _file.flush()
+                os.fsync(_file.fileno())
+
+            with lock:
+                if _states.get(state.path) is state:  # else released meanwhile: the next handler replays the file
+                    state.swap(tmp, len(lines), offset, state.lines - appended_from)
+
+        finally:
+            with lock:
+                state.compacting = False
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        return 0
+
+    def __insert(self, device_ip, severity, description, _time, notified, ceased, ingested):
+        """@return: the record to append. The caller must already hold the lock"""
+        state = self._state
+
+        if _time is None:
+            _time = datetime.now()
+        if ingested is None:
+            ingested = time.time()
+
+        # the same values sqlite would give back: severity and time as text
+        row = [state.next_ID, device_ip, str(severity), description, str(_time), int(notified), int(ceased), ingested]
+        seq = state.new_seq()
+
+        state.insert(seq, row)
+        return ['i', seq, row]
+
+    def __select(self, condition):
+        with lock:
+            return [tuple(row) for row in self._state.rows.values() if condition(row)]
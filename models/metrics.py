@@ -0,0 +1,344 @@
+"""
+In-process metrics: counters, gauges and histograms, optionally with labels, exposed in the Prometheus text format
+by a small local HTTP endpoint (see MetricsServer, started by the service when Metrics_config.Enabled is true).
+
+The metrics are created once, at import time of the module using them, and updated on the hot path:
+an update is a dict lookup (only with labels) and a few arithmetic operations under a lock, nothing is formatted
+until the endpoint is scraped.
+
+    POLLS = metrics.counter('alarm_polls_total', 'polls of the devices', ['device', 'outcome'])
+    POLLS.labels(device.ip, 'ok').inc()
+
+    with POLL_SECONDS.time():
+        ...
+"""
+import bisect
+import logging
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs
+
+# seconds: from a fast SQL statement to a connect timeout
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra='') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return '{' + ','.join(pairs) + '}' if len(pairs) > 0 else ''
+
+
+class _Timer(object):
+    """context manager observing the seconds spent inside it"""
+
+    __slots__ = ('_metric', '_start')
+
+    def __init__(self, metric):
+        self._metric = metric
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._metric.observe(time.perf_counter() - self._start)
+
+
+class _CounterChild(object):
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, label_names, label_values) -> List:
+        return [(name, _format_labels(label_names, label_values), self.value)]
+
+
+class _GaugeChild(object):
+    __slots__ = ('_lock', 'value', '_function')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+        self._function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """the value is read from function() when the metrics are scraped (e.g. the size of a queue)"""
+        self._function = function
+
+    def samples(self, name, label_names, label_values) -> List:
+        value = self.value
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception as e:
+                logging.log(logging.ERROR, f'could not read the gauge {name}: {e}')
+
+        return [(name, _format_labels(label_names, label_values), value)]
+
+
+class _HistogramChild(object):
+    __slots__ = ('_lock', '_bounds', '_counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._bounds, value)
+
+        with self._lock:
+            self._counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def samples(self, name, label_names, label_values) -> List:
+        with self._lock:
+            counts, total, count = list(self._counts), self.sum, self.count
+
+        result = []
+        cumulative = 0
+        for bound, bucket_count in zip(list(self._bounds) + [math.inf], counts):
+            cumulative += bucket_count
+            labels = _format_labels(label_names, label_values, f'le="{_format_value(float(bound))}"')
+            result.append((name + '_bucket', labels, cumulative))
+
+        result.append((name + '_sum', _format_labels(label_names, label_values), total))
+        result.append((name + '_count', _format_labels(label_names, label_values), count))
+
+        return result
+
+
+class _Metric(object):
+    """a metric family: one child per combination of label values (a single child if it has no labels)"""
+
+    def __init__(self, kind, name, documentation, label_names, child_factory):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._child_factory = child_factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+        # the only child of a metric without labels. None if it has labels: call labels() first
+        self._unlabelled = self.labels() if len(self.label_names) == 0 else None
+
+    def labels(self, *values):
+        """@return: the child of these label values (created the first time)"""
+        child = self._children.get(values)  # no lock on the hot path: dict reads are atomic
+
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f'{self.name} expects the labels {self.label_names}, got {values}')
+
+            with self._lock:
+                child = self._children.setdefault(values, self._child_factory())
+
+        return child
+
+    # shortcuts for the metrics without labels, e.g. PARSE_SECONDS.observe(0.1)
+
+    def inc(self, amount=1):
+        self._unlabelled.inc(amount)
+
+    def dec(self, amount=1):
+        self._unlabelled.dec(amount)
+
+    def set(self, value):
+        self._unlabelled.set(value)
+
+    def set_function(self, function):
+        self._unlabelled.set_function(function)
+
+    def observe(self, value):
+        self._unlabelled.observe(value)
+
+    def time(self) -> _Timer:
+        return self._unlabelled.time()
+
+    def exposition(self) -> List:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+        with self._lock:
+            children = list(self._children.items())
+
+        for values, child in sorted(children, key=lambda item: item[0]):
+            for name, labels, value in child.samples(self.name, self.label_names, values):
+                lines.append(f'{name}{labels} {_format_value(value)}')
+
+        return lines
+
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labels=()) -> _Metric:
+        return self.__get_or_create('counter', name, documentation, labels, _CounterChild)
+
+    def gauge(self, name, documentation, labels=()) -> _Metric:
+        return self.__get_or_create('gauge', name, documentation, labels, _GaugeChild)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS) -> _Metric:
+        bounds = tuple(sorted(buckets))
+        return self.__get_or_create('histogram', name, documentation, labels, lambda: _HistogramChild(bounds))
+
+    def get(self, name) -> _Metric:
+        return self._metrics[name]
+
+    def exposition(self) -> str:
+        """@return: all the metrics in the Prometheus text format (version 0.0.4)"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+        return '\n'.join(line for metric in metrics for line in metric.exposition()) + '\n'
+
+    def __get_or_create(self, kind, name, documentation, labels, child_factory) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+
+            if metric is None:
+                metric = _Metric(kind, name, documentation, labels, child_factory)
+                self._metrics[name] = metric
+
+            elif metric.kind != kind or metric.label_names != tuple(labels):
+                raise ValueError(f'metric {name} already registered as a {metric.kind} with labels '
+                                 f'{metric.label_names}')
+
+            return metric
+
+
+# the registry of the process. The module level functions below register in it
+REGISTRY = MetricsRegistry()
+
+
+def counter(name, documentation, labels=()) -> _Metric:
+    return REGISTRY.counter(name, documentation, labels)
+
+
+def gauge(name, documentation, labels=()) -> _Metric:
+    return REGISTRY.gauge(name, documentation, labels)
+
+
+def histogram(name, documentation, labels=(), buckets=DEFAULT_BUCKETS) -> _Metric:
+    return REGISTRY.histogram(name, documentation, labels, buckets)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        handler = self.server.routes.get(path)
+
+        if handler is None:
+            self.send_error(404)
+            return
+
+        if path in self.server.routes_with_params:
+            try:
+                body = handler(parse_qs(query, keep_blank_values=True)).encode('utf-8')
+            except ValueError as e:  # invalid parameters
+                self.send_error(400, str(e))
+                return
+        else:
+            body = handler().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes are not worth a log line
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """serves GET /metrics (and the other routes added with add_route()) on a local port"""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=9108, registry=REGISTRY):
+        super().__init__((host, port), _MetricsHandler)
+        self.routes = {'/metrics': registry.exposition}
+        self.routes_with_params = set()
+
+    @classmethod
+    def from_config(cls, config_manager):
+        """@return: a MetricsServer if the endpoint is enabled in the config.json, else None"""
+        if not config_manager.get_metrics_enabled():
+            return None
+
+        return cls(config_manager.get_metrics_host(), config_manager.get_metrics_port())
+
+    def add_route(self, path, handler, with_params=False):
+        """
+        @param handler: function returning the text served at path
+        @param with_params: if True handler gets the query string, as a dict parameter -> list of values,
+                            and raises ValueError if they are invalid (answered with a 400)
+        """
+        self.routes[path] = handler
+        if with_params:
+            self.routes_with_params.add(path)
+
+    def start(self) -> threading.Thread:
+        _t = threading.Thread(target=self.serve_forever, name='metrics-server', daemon=True)
+        _t.start()
+
+        logging.log(logging.INFO, f'metrics served on http://{self.server_address[0]}:{self.server_address[1]}/metrics')
+
+        return _t
+
+
+def metrics_snapshot(registry=REGISTRY) -> Dict:
+    """@return: dict 'name{labels}' -> value of every sample (handy for tests and benchmarks)"""
+    result = {}
+
+    for line in registry.exposition().splitlines():
+        if line.startswith('#') or not line:
+            continue
+
+        key, value = line.rsplit(' ', 1)
+        result[key] = float(value)
+
+    return result
@@ -9,21 +9,19 @@ and call it inside the notify() method.
 import logging
 import threading
 import time
-import traceback
-import os
+from typing import List
 
-from models.database_manager import DBHandler
+from models import storage
 from models.config_manager import ConfigManager
-from services import mail_sender_service
+from models.lazy_import import timed_import
+from models import metrics, tracing
 
 
-logfile = os.path.join(os.path.dirname(__file__), '../log.log')
-logging.basicConfig(filename=logfile, level=logging.WARNING)
-
-try:
-    from services import telegram_bot_service
-except ImportError as e:
-    logging.log(logging.WARNING, 'Could not find the telegram bot' + str(e))
+PENDING_ALARMS = metrics.gauge('notification_pending_alarms', 'alarms found to notify at the last check')
+SEND_SECONDS = metrics.histogram('notification_send_seconds', 'time to send a notification', ['channel'])
+SENT = metrics.counter('notifications_sent_total', 'notifications sent', ['channel'])
+SEND_FAILURES = metrics.counter('notification_send_failures_total', 'notifications that could not be sent',
+                                ['channel'])
 
 
 class Singleton(type):
@@ -37,8 +35,9 @@ class Singleton(type):
 
 class NotificationManager(object, metaclass=Singleton):
 
-    def __init__(self):
-        self._config_manager = ConfigManager()
+    def __init__(self, config_manager=None):
+        """@param config_manager: ConfigManager with the notification settings (a new one if None)"""
+        self._config_manager = config_manager if config_manager is not None else ConfigManager()
         self.msg = ''
         self._worker = None
 
@@ -52,7 +51,15 @@ class NotificationManager(object, metaclass=Singleton):
         send_email_flag = self._config_manager.get_email_notification_flag()
 
         if send_email_flag:
-            mail_sender_service.send_mail(msg)
+            mail_sender_service = timed_import('services.mail_sender_service')  # imported only if enabled
+
+            try:
+                with SEND_SECONDS.labels('email').time(), tracing.span('send', channel='email'):
+                    mail_sender_service.send_mail(msg, config_manager=self._config_manager)
+                SENT.labels('email').inc()
+            except Exception:
+                SEND_FAILURES.labels('email').inc()
+                raise
 
     def _broadcast_alarm(self, msg):
         """ broadcast the alarm using the bot"""
@@ -60,9 +67,17 @@ class NotificationManager(object, metaclass=Singleton):
 
         try:
             if send_message_flag:
-                telegram_bot_service.send_to_bot_group(msg)
+                telegram_bot_service = timed_import('services.telegram_bot_service')  # imported only if enabled
+
+                with SEND_SECONDS.labels('telegram').time(), tracing.span('send', channel='telegram'):
+                    status_code, reason = telegram_bot_service.send_to_bot_group(msg, self._config_manager)
+
+                if status_code >= 400:
+                    raise Exception(f'{status_code} {reason}')
+                SENT.labels('telegram').inc()
 
         except Exception as e:
+            SEND_FAILURES.labels('telegram').inc()
             logging.log(logging.ERROR, 'Failed to send a broadcast message' + str(e))
 
     def start(self):
@@ -108,10 +123,46 @@ class NotificationManager(object, metaclass=Singleton):
         for alarm in _list:
             ids.append(alarm[0])
 
-        db = DBHandler().open_connection()
+        db = storage.handler().open_connection()
         db.update_notified_by_ID(ids)
         db.close_connection()
 
+    def check_new_alarms(self, severity_threshold=None) -> List:
+        """
+        notifies the alarms not notified yet with severity >= severity_threshold and marks them as notified
+
+        @param severity_threshold: the Severity_notification_threshold of the config.json if None
+        @return: list of the alarms (DB rows) that have been notified
+        """
+        if severity_threshold is None:
+            severity_threshold = self._config_manager.get_severity_notification_threshold()
+
+        with tracing.trace('notify_check'):  # sampled: see models/tracing.py
+            db = storage.handler()
+
+            try:
+                with tracing.span('notifier_query'):
+                    db.open_connection()
+
+                    result = db.select_alarm_by_severity_unnotified(severity_threshold)
+
+            finally:
+                db.close_connection()
+
+            PENDING_ALARMS.set(len(result))
+
+            if len(result) != 0:  # it means that there are some alarms that need to be notified!
+                self.notify(self.__build_new_alarm_msg(result))
+                sent = time.time()
+
+                with tracing.span('mark_notified', alarms=len(result)):
+                    self.__update_alarms_table_notified(result)
+
+                for alarm in result:  # time (NE timestamp), ingested (missing if the table was not migrated yet)
+                    tracing.observe_alarm_latency(alarm[4], alarm[7] if len(alarm) > 7 else None, sent)
+
+        return result
+
     def __notificationThread(self, _delay):
 
         """
@@ -126,24 +177,13 @@ class NotificationManager(object, metaclass=Singleton):
 
         while True:
             time.sleep(max(0, next_time - time.time()))  # making the thread not wasting CPU cycles
-            db = DBHandler()
 
             try:
-                db.open_connection()
-
-                result = db.select_alarm_by_severity_unnotified(severity_threshold)
-
-                if len(result) != 0:  # it means that there are some alarms that need to be notified!
-                    self.notify(self.__build_new_alarm_msg(result))
-                    self.__update_alarms_table_notified(result)
+                self.check_new_alarms(severity_threshold)
 
             except Exception as e:
-                traceback.print_exc()
                 logging.exception("Problem while trying notify alarms' data." + str(e))
 
-            finally:
-                db.close_connection()
-
             next_time += (time.time() - next_time) // _delay * _delay + _delay  # next scheduling
 
 
@@ -0,0 +1,199 @@
+"""
+Central scheduler of the periodic polls: one thread and a priority queue (heap) ordered by due time,
+instead of one sleeping thread per device. The due tasks are dispatched to a bounded thread pool.
+
+- phase spreading: each job starts at a stable offset inside its interval (hash of its key),
+  so devices with the same rate don't all fire together
+- jitter: every run is moved by a random amount (a fraction of the interval), around a fixed grid
+- drift correction: the next run is computed from the grid, not from when the previous run actually happened
+- miss/skip accounting: if the scheduler is late by whole intervals the missed runs are skipped (and counted),
+  if the previous run of a job is still going the new one is skipped (and counted) instead of piling up
+"""
+import hashlib
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from models import metrics
+
+RUNS_MISSED = metrics.counter('poll_runs_missed_total', 'scheduled runs skipped because the scheduler was late')
+RUNS_OVERLAPPED = metrics.counter('poll_runs_overlapped_total', 'scheduled runs skipped because the previous '
+                                                                'run of the same job was still going')
+
+
+def _phase(key) -> float:
+    """@return: stable number in [0, 1) for key"""
+    return int(hashlib.md5(str(key).encode('utf-8')).hexdigest()[:8], 16) / 0x100000000
+
+
+class _Job(object):
+    def __init__(self, key, interval, jitter, task, args):
+        self.key = key
+        self.interval = interval
+        self.jitter = jitter
+        self.task = task
+        self.args = args
+        self.grid_time = 0.0  # next run without jitter
+        self.running = False
+        self.removed = False
+        # accounting
+        self.runs = 0
+        self.missed = 0
+        self.skipped_overlaps = 0
+        self.failures = 0
+        self.last_duration = 0.0
+        self.last_lateness = 0.0
+
+
+class PollScheduler(object):
+
+    def __init__(self, workers=8, clock=time.monotonic):
+        """
+        @param workers: size of the thread pool running the tasks
+        @param clock: monotonic clock in seconds (for testing)
+        """
+        self._clock = clock
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='poll-worker')
+        self._heap = []
+        self._jobs = {}
+        self._counter = itertools.count()  # tie breaker of the heap: jobs are never compared
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def add(self, key, interval, task, *args, jitter=0.0):
+        """
+        schedules task(*args) every interval seconds
+
+        @param key: unique name of the job (e.g. the device ip)
+        @param interval: seconds between two runs
+        @param jitter: every run is moved randomly by up to +-jitter * interval
+        """
+        job = _Job(key, interval, jitter, task, args)
+        job.grid_time = self._clock() + _phase(key) * interval
+
+        with self._condition:
+            self._jobs[key] = job
+            self.__push(job)
+            self._condition.notify()
+
+    def remove(self, key):
+        with self._condition:
+            job = self._jobs.pop(key, None)
+            if job is not None:
+                job.removed = True  # lazily dropped when it gets to the top of the heap
+
+    def set_interval(self, key, interval):
+        """changes the interval of a job. The next run is moved accordingly if it would happen later than that"""
+        with self._condition:
+            job = self._jobs.get(key)
+            if job is None or job.interval == interval:
+                return
+
+            job.interval = interval
+            now = self._clock()
+            if job.grid_time > now + interval:
+                # re-push it: the old heap entry becomes stale and is discarded when popped
+                job.grid_time = now + interval
+                self.__push(job)
+                self._condition.notify()
+
+    def get_interval(self, key) -> float:
+        with self._condition:
+            return self._jobs[key].interval
+
+    def stats(self) -> Dict:
+        """@return: dict key -> dict of counters of the job"""
+        with self._condition:
+            return {key: {'interval': job.interval,
+                          'runs': job.runs,
+                          'missed': job.missed,
+                          'skipped_overlaps': job.skipped_overlaps,
+                          'failures': job.failures,
+                          'last_duration': job.last_duration,
+                          'last_lateness': job.last_lateness}
+                    for key, job in self._jobs.items()}
+
+    def start(self) -> threading.Thread:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.__loop, name='poll-scheduler')
+            self._thread.start()
+
+        return self._thread
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+        self._pool.shutdown(wait=False)
+
+    def run_pending(self):
+        """dispatches all the jobs due now, without waiting. Used by the scheduler thread (and by tests)"""
+        with self._condition:
+            self.__dispatch_due(self._clock())
+
+    def __push(self, job):
+        run_at = job.grid_time + random.uniform(-job.jitter, job.jitter) * job.interval
+        heapq.heappush(self._heap, (run_at, next(self._counter), job, job.grid_time))
+
+    def __loop(self):
+        with self._condition:
+            while not self._stopped:
+                now = self._clock()
+                self.__dispatch_due(now)
+
+                timeout = self._heap[0][0] - now if len(self._heap) > 0 else None
+                self._condition.wait(timeout)
+
+    def __dispatch_due(self, now):
+        # the caller holds self._condition
+        while len(self._heap) > 0 and self._heap[0][0] <= now:
+            run_at, _, job, grid_time = heapq.heappop(self._heap)
+
+            if job.removed or grid_time != job.grid_time:
+                continue  # stale entry (removed job, or rescheduled by set_interval)
+
+            lateness = now - run_at
+            job.last_lateness = lateness
+
+            # drift correction: next slot on the grid. If we are late by whole intervals those runs are lost
+            missed = int(max(0.0, now - grid_time) // job.interval)
+            job.missed += missed
+            job.grid_time = grid_time + (missed + 1) * job.interval
+            self.__push(job)
+
+            if missed > 0:
+                RUNS_MISSED.inc(missed)
+                logging.log(logging.WARNING, f'poll of {job.key} is {lateness:.1f}s late, {missed} run(s) skipped')
+
+            if job.running:
+                job.skipped_overlaps += 1
+                RUNS_OVERLAPPED.inc()
+                continue
+
+            job.running = True
+            try:
+                self._pool.submit(self.__run, job)
+            except RuntimeError:  # the pool has been shut down by stop()
+                job.running = False
+
+    def __run(self, job):
+        start = self._clock()
+
+        try:
+            job.task(*job.args)
+        except Exception:
+            logging.exception("Problem while running the scheduled task of " + str(job.key))
+            with self._condition:
+                job.failures += 1
+
+        with self._condition:
+            job.running = False
+            job.runs += 1
+            job.last_duration = self._clock() - start
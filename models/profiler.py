@@ -0,0 +1,245 @@
+"""
+On-demand sampling profiler of the running service: while active, a thread takes the stacks of all the other threads
+(sys._current_frames()) every few milliseconds, for a bounded time. It then writes in Profile_dir:
+
+    profile-<time>.txt     per thread: samples, hottest functions (self and cumulative) and hottest stacks
+    profile-<time>.folded  one line per thread;stack with its count (flamegraph.pl, speedscope)
+
+It is a wall clock profile: a thread waiting on a lock or a socket is sampled as well, in the waiting function.
+Nothing is sampled until it is started, by SIGUSR1 (see install_signal_handler()), by the /profile bot command of
+an admin or by the /debug/profile endpoint of the metrics server.
+"""
+import collections
+import json
+import logging
+import math
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict
+
+dirname = os.path.dirname(__file__)
+
+
+class SamplingProfiler(object):
+
+    def __init__(self, output_dir='profiles', interval=0.01, default_duration=30, max_duration=300):
+        """
+        @param output_dir: directory of the profiles (relative to the project root if not absolute)
+        @param interval: seconds between two samples
+        @param default_duration: seconds profiled if start() is not told otherwise
+        @param max_duration: upper bound of the seconds profiled, whatever start() is told
+        """
+        self.output_dir = os.path.join(dirname, '..', output_dir)  # unchanged if output_dir is absolute
+        self.interval = interval
+        self.default_duration = default_duration
+        self.max_duration = max_duration
+        self.last_output = None  # path of the last report written
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._until = None
+        self._frame_names = {}  # key: code object, item: 'function (file:line)' (formatted once)
+
+    def configure(self, config_manager):
+        """applies the Profile_* settings of the config.json"""
+        self.output_dir = os.path.join(dirname, '..', config_manager.get_profile_dir())
+        self.interval = config_manager.get_profile_interval() / 1000
+        self.default_duration = config_manager.get_profile_default_duration()
+        self.max_duration = config_manager.get_profile_max_duration()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration=None, on_done=None) -> bool:
+        """
+        starts sampling in background for duration seconds (default_duration if None, at most max_duration)
+
+        @param on_done: function(path of the report) called by the profiler thread when the report is written
+        @return: False if a profile is already running
+        """
+        duration = min(float(duration if duration is not None else self.default_duration), self.max_duration)
+
+        with self._lock:
+            if self.is_running():
+                return False
+
+            self._stop.clear()
+            self._until = time.time() + duration
+            self._thread = threading.Thread(target=self.__run, args=(duration, on_done), name='profiler',
+                                            daemon=True)
+            self._thread.start()
+
+        logging.log(logging.WARNING, f'profiling all the threads for {duration:.0f}s')
+
+        return True
+
+    def stop(self):
+        """ends the running profile now: the report of what has been sampled is written anyway"""
+        self._stop.set()
+
+    def toggle(self, duration=None):
+        """starts a profile, or stops the running one"""
+        if not self.start(duration):
+            self.stop()
+
+    def status(self) -> Dict:
+        running = self.is_running()
+
+        return {'running': running,
+                'remaining_sec': max(0.0, self._until - time.time()) if running else 0.0,
+                'last_output': self.last_output}
+
+    def sample(self, stacks, threads_by_ident):
+        """
+        adds a sample of every thread (except the calling one) to stacks
+
+        @param stacks: dict thread name -> Counter of stacks (tuples of frame names, outermost first)
+        @param threads_by_ident: dict thread ident -> thread name
+        """
+        me = threading.get_ident()
+
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(self.__frame_name(frame.f_code))
+                frame = frame.f_back
+
+            stacks[threads_by_ident.get(ident, str(ident))][tuple(reversed(stack))] += 1
+
+    def __frame_name(self, code) -> str:
+        name = self._frame_names.get(code)
+        if name is None:
+            name = self._frame_names.setdefault(
+                code, f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+
+        return name
+
+    def __run(self, duration, on_done):
+        stacks = collections.defaultdict(collections.Counter)
+        started = datetime.now()
+        deadline = time.perf_counter() + duration
+        samples = 0
+
+        try:
+            while not self._stop.is_set() and time.perf_counter() < deadline:
+                threads = {thread.ident: thread.name for thread in threading.enumerate()}
+                self.sample(stacks, threads)
+                samples += 1
+                self._stop.wait(self.interval)
+
+            self.last_output = write_report(stacks, self.output_dir, started, samples, self.interval)
+            logging.log(logging.WARNING, f'profile written in {self.last_output}')
+
+        except Exception:
+            logging.exception('Problem while profiling')
+            return
+
+        if on_done is not None:
+            on_done(self.last_output)
+
+
+def write_report(stacks, output_dir, started, samples, interval) -> str:
+    """
+    writes the .txt report and the .folded stacks of a profile
+    @return: path of the .txt report
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # milliseconds: a profile stopped right after it started must not overwrite the previous one
+    base = path = os.path.join(output_dir, 'profile-' + started.strftime('%Y%m%d-%H%M%S-%f')[:-3])
+    suffix = 1
+    while os.path.exists(path + '.txt'):
+        path = f'{base}-{suffix}'
+        suffix += 1
+
+    with open(path + '.folded', 'w') as _file:
+        for thread, counter in sorted(stacks.items()):
+            for stack, count in counter.most_common():
+                _file.write(';'.join((thread,) + stack) + f' {count}\n')
+
+    with open(path + '.txt', 'w') as _file:
+        _file.write(f'profile started {started:%Y-%m-%d %H:%M:%S}, {samples} samples every {interval * 1000:.0f} ms\n')
+
+        for thread, counter in sorted(stacks.items(), key=lambda item: -sum(item[1].values())):
+            _file.write(f'\n=== thread {thread}: {sum(counter.values())} samples\n')
+            _file.write(format_hot_spots(counter))
+
+    return path + '.txt'
+
+
+def format_hot_spots(counter, top=10) -> str:
+    """@param counter: Counter of the stacks of a thread. @return: its hottest functions and stacks, as text"""
+    total = sum(counter.values())
+    own, cumulative = collections.Counter(), collections.Counter()
+
+    for stack, count in counter.items():
+        if len(stack) > 0:
+            own[stack[-1]] += count
+        for name in set(stack):  # recursive functions are counted once per sample
+            cumulative[name] += count
+
+    lines = ['  self:']
+    lines += [f'    {count / total:6.1%}  {name}' for name, count in own.most_common(top)]
+    lines.append('  cumulative:')
+    lines += [f'    {count / total:6.1%}  {name}' for name, count in cumulative.most_common(top)]
+
+    for stack, count in counter.most_common(3):
+        lines.append(f'  stack ({count / total:.1%}):')
+        lines += [f'    {name}' for name in stack]
+
+    return '\n'.join(lines) + '\n'
+
+
+# the profiler of the process, configured by the service (see services/main_service.py)
+PROFILER = SamplingProfiler()
+
+
+def install_signal_handler(signum=getattr(signal, 'SIGUSR1', None)) -> bool:
+    """
+    every signum (kill -USR1 <pid>) starts a profile of default duration, or stops the running one
+    @return: False if it cannot be installed (no SIGUSR1 on Windows, or not called by the main thread)
+    """
+    if signum is None:
+        return False
+
+    try:
+        signal.signal(signum, lambda _signum, _frame: PROFILER.toggle())
+    except ValueError:  # signal handlers can only be installed by the main thread (e.g. service started by the GUI)
+        return False
+
+    return True
+
+
+def _positive_seconds(text) -> float:
+    try:
+        seconds = float(text)
+    except ValueError:
+        seconds = math.nan
+
+    if not 0 < seconds < math.inf:
+        raise ValueError(f'seconds must be a positive number, not {text!r}')
+
+    return seconds
+
+
+def profile_endpoint(params) -> str:
+    """
+    handler of /debug/profile: ?start[&seconds=N] starts a profile, ?stop stops it, no parameter only reads the status
+    @param params: dict parameter -> list of values, as returned by urllib.parse.parse_qs()
+    @return: the status of the profiler as JSON
+    @raise ValueError: if seconds is not a positive number (the metrics server answers 400)
+    """
+    if 'start' in params:
+        seconds = params.get('seconds')
+        duration = _positive_seconds(seconds[0]) if seconds else None
+        PROFILER.start(duration)
+    elif 'stop' in params:
+        PROFILER.stop()
+
+    return json.dumps(PROFILER.status())
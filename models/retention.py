@@ -0,0 +1,250 @@
+"""
+Retention of the alarm table: the alarms nobody needs anymore (ceased, notified or below the notification threshold)
+are moved out of the local.db when they were collected more than Max_age_in_days of their severity ago, or when their
+severity has more than Max_rows alarms (the first collected first). The alarms waiting for a notification are never
+touched. The age is counted from the ingest time, not from the time reported by the device: a device can report an
+alarm that is years old, it is not expired as soon as it is collected.
+
+The devices keep reporting the active alarms: the keys of the deleted ones that were not ceased stay in the storage as
+tombstones, so the next polls do not insert and notify them again. A tombstone is forgotten once it is older than the
+Max_age_in_days of its severity (the longest one of the config for the severities without it, a year if none).
+The change feed is trimmed to its last Max_changes changes: the side tables do not grow forever either.
+
+The alarms are first appended to compressed, date-partitioned archives (one JSON object per line)
+
+    <Archive_dir>/2020/05/alarms-2020-05-01.jsonl.gz
+
+and then deleted, Batch_size at a time, each batch in its own short transaction: the pollers only wait for a batch,
+never for the whole run. The archive is written before the delete: if the process dies in between, the next run
+archives the same alarms again (duplicates in the archive, never a lost alarm).
+Finally the freed pages are given back to the file system, Vacuum_pages at a time.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator
+
+from models.config_manager import ConfigManager
+from models import storage
+from models import metrics
+
+dirname = os.path.dirname(__file__)
+
+DEFAULT_TOMBSTONE_DAYS = 365  # tombstone window when no Max_age_in_days is configured at all
+
+ALARMS_ARCHIVED = metrics.counter('alarms_archived_total', 'alarms archived and deleted by the retention',
+                                  ['severity'])
+RETENTION_SECONDS = metrics.histogram('retention_run_seconds', 'time of a retention run',
+                                      buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0))
+
+
+class RetentionManager(object):
+
+    def __init__(self, config_manager=None, db_url=None, clock=datetime.utcnow):
+        """
+        @param config_manager: ConfigManager with the Retention_config (a new one if None)
+        @param db_url: file of the storage backend (its default, e.g. the local.db, if None)
+        @param clock: function returning the current UTC datetime, the time of the alarms is UTC (for testing)
+        """
+        self._config_manager = config_manager if config_manager is not None else ConfigManager()
+        self._db_url = db_url
+        self._clock = clock
+        self.archive_dir = os.path.join(dirname, '..', self._config_manager.get_retention_archive_dir())
+        self.batch_size = self._config_manager.get_retention_batch_size()
+        self.batch_pause = self._config_manager.get_retention_batch_pause()
+        self.vacuum_pages = self._config_manager.get_retention_vacuum_pages()
+        self.max_changes = self._config_manager.get_retention_max_changes()
+        self._worker = None
+
+    @classmethod
+    def from_config(cls, config_manager=None):
+        """@return: a RetentionManager if the retention is enabled in the config.json, else None"""
+        if config_manager is None:
+            config_manager = ConfigManager()
+
+        if not config_manager.get_retention_enabled():
+            return None
+
+        return cls(config_manager)
+
+    def start(self) -> threading.Thread:
+        """runs the retention every Interval_in_sec, in its own thread"""
+        if self._worker is None:
+            self._worker = threading.Thread(target=self.__retention_thread, name='retention',
+                                            args=(self._config_manager.get_retention_interval(),))
+            self._worker.start()
+
+        return self._worker
+
+    def run_once(self) -> Dict:
+        """
+        @return: dict with the alarms archived per severity, the tombstones expired, the changes trimmed and the
+                 free pages left in the local.db
+        """
+        start = time.perf_counter()
+        severity_levels = self._config_manager.get_severity_levels()
+        threshold = self._config_manager.get_severity_notification_threshold()
+        max_age = self._config_manager.get_retention_max_age()
+        max_rows = self._config_manager.get_retention_max_rows()
+        archived = {}
+        tombstones = 0
+        tombstone_days = max(max_age.values(), default=DEFAULT_TOMBSTONE_DAYS)
+
+        for name, severity in severity_levels.items():
+            count = 0
+
+            if name in max_age:
+                before = self.__epoch(days=max_age[name])
+                count += self.__expire(severity, before, threshold, None)
+
+            if name in max_rows:
+                excess = self.__count_alarms(severity) - max_rows[name]
+                if excess > 0:
+                    count += self.__expire(severity, None, threshold, excess)
+
+            archived[name] = count
+
+            tombstones += self.__batched(lambda db, size: db.expire_tombstones(
+                severity, self.__epoch(days=max_age.get(name, tombstone_days)), size))
+
+        changes = self.__batched(lambda db, size: db.trim_changes(self.max_changes, size))
+        free_pages = self.__vacuum()
+        RETENTION_SECONDS.observe(time.perf_counter() - start)
+
+        if sum(archived.values()) > 0 or tombstones > 0 or changes > 0:
+            logging.log(logging.INFO, f'retention: archived {archived}, {tombstones} tombstones expired, '
+                                      f'{changes} changes trimmed, {free_pages} free pages left')
+
+        return {'archived': archived, 'tombstones_expired': tombstones, 'changes_trimmed': changes,
+                'free_pages': free_pages}
+
+    def archive(self, columns, rows):
+        """appends the rows to the archive of the day of their time column"""
+        by_day = {}
+        time_index = columns.index('time')
+
+        for row in rows:
+            by_day.setdefault(str(row[time_index])[:10], []).append(row)
+
+        for day, day_rows in by_day.items():
+            path = self.archive_path(day)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # every call appends a gzip member: a file made of several members is still a valid gzip file
+            with gzip.open(path, 'at', encoding='utf-8') as _file:
+                for row in day_rows:
+                    _file.write(json.dumps(dict(zip(columns, row))) + '\n')
+
+    def archive_path(self, day) -> str:
+        """@param day: 'YYYY-MM-DD'. @return: path of the archive of that day"""
+        return os.path.join(self.archive_dir, day[:4], day[5:7], f'alarms-{day}.jsonl.gz')
+
+    def __expire(self, severity, before, threshold, limit) -> int:
+        """archives and deletes the expired alarms of a severity, at most limit (all if None), batch by batch"""
+        done = 0
+
+        while limit is None or done < limit:
+            size = self.batch_size if limit is None else min(self.batch_size, limit - done)
+
+            db = storage.handler(self._db_url).open_connection()
+            try:
+                columns, rows = db.select_expired_alarms(severity, before, threshold, size)
+            finally:
+                db.close_connection()
+
+            if len(rows) == 0:
+                break
+
+            self.archive(columns, rows)  # outside the DB semaphore: the pollers can write meanwhile
+
+            db = storage.handler(self._db_url).open_connection()
+            try:
+                deleted = db.delete_alarms([row[0] for row in rows], self.__epoch())
+            finally:
+                db.close_connection()
+
+            done += deleted
+            ALARMS_ARCHIVED.labels(str(severity)).inc(deleted)
+
+            if len(rows) < size:
+                break
+
+            time.sleep(self.batch_pause)  # let the pollers and the notifier in
+
+        return done
+
+    def __batched(self, function) -> int:
+        """calls function(db handler, Batch_size) in its own transaction until it does less than Batch_size"""
+        done = 0
+
+        while True:
+            db = storage.handler(self._db_url).open_connection()
+            try:
+                count = function(db, self.batch_size)
+            finally:
+                db.close_connection()
+
+            done += count
+            if count < self.batch_size:
+                return done
+
+            time.sleep(self.batch_pause)
+
+    def __epoch(self, days=0) -> float:
+        """@return: seconds since the epoch of the clock days ago"""
+        return (self._clock() - timedelta(days=days)).replace(tzinfo=timezone.utc).timestamp()
+
+    def __count_alarms(self, severity) -> int:
+        db = storage.handler(self._db_url).open_connection()
+        try:
+            counters = db.select_alarm_counters()
+        finally:
+            db.close_connection()
+
+        return sum(counter for _, _severity, _, counter in counters if _severity == str(severity))
+
+    def __vacuum(self) -> int:
+        free_pages = 0
+
+        while True:
+            db = storage.handler(self._db_url).open_connection()
+            try:
+                previous, free_pages = free_pages, db.compact(self.vacuum_pages)
+            finally:
+                db.close_connection()
+
+            # nothing left, or the local.db is not in incremental auto_vacuum (the free pages are reused by the inserts)
+            if free_pages == 0 or free_pages == previous:
+                return free_pages
+
+            time.sleep(self.batch_pause)
+
+    def __retention_thread(self, _interval):
+        next_time = time.time() + _interval
+
+        while True:
+            time.sleep(max(0, next_time - time.time()))
+
+            try:
+                self.run_once()
+
+            except Exception as e:
+                logging.exception("Problem while applying the retention." + str(e))
+
+            next_time += (time.time() - next_time) // _interval * _interval + _interval  # next scheduling
+
+
+def read_archive(path) -> Iterator:
+    """@return: iterator of the alarms (dicts column -> value) of an archive file"""
+    with gzip.open(path, 'rt', encoding='utf-8') as _file:
+        for line in _file:
+            yield json.loads(line)
+
+
+if __name__ == '__main__':
+    # applies the retention of the config.json once
+    print(RetentionManager().run_once())
@@ -0,0 +1,228 @@
+"""
+Storage of the alarms, behind a single interface: pollers, notifier, GUI, bot, retention and export get their handler
+from handler() and never know which backend is behind it.
+
+Backends (Storage_config.Backend in the config.json):
+    sqlite  models/database_manager.py, the local.db. The only one that can be shared by several processes
+            (sharded and cluster collector modes)
+    log     models/log_store.py, append-only log replayed in memory at the first use: much faster inserts and
+            queries, for a single process
+
+Every handler is used the same way
+    db = storage.handler().open_connection()
+    db.insert_alarms([...])
+    db.close_connection()  # commit
+
+and returns the alarms as tuples in the column order of the alarm table:
+    (ID, deviceIP, severity, description, time, notified, ceased, ingested)
+"""
+import threading
+from typing import List, Optional
+
+from models.config_manager import ConfigManager
+from models.lazy_import import timed_import
+
+ALARM_COLUMNS = ('ID', 'deviceIP', 'severity', 'description', 'time', 'notified', 'ceased', 'ingested')
+
+# key: name in the config.json, item: (module, class). Imported only when chosen
+BACKENDS = {'sqlite': ('models.database_manager', 'DBHandler'),
+            'log': ('models.log_store', 'LogStore')}
+
+_backend = None  # name of the backend in use, read from the config.json at the first handler() if not configured
+_lock = threading.Lock()
+
+
+class StorageBackend(object):
+    """
+    interface of the alarm storage. The severities are saved as text, the time as given by the device
+    ('2018-03-28 21:41:35.2749', UTC), ingested as epoch
+    """
+
+    def open_connection(self):
+        """@return: self"""
+        raise NotImplementedError
+
+    def close_connection(self):
+        """commits everything done since open_connection"""
+        raise NotImplementedError
+
+    def create_alarm_table(self):
+        """creates the storage if it does not exist yet"""
+        raise NotImplementedError
+
+    # insert and dedup
+
+    def insert_row_alarm(self, device_ip='0.0.0.0', severity='0', description='debug', _time=None, notified=0, ceased=0,
+                         ingested=None):
+        raise NotImplementedError
+
+    def insert_alarms(self, alarms):
+        """@param alarms: list of tuples (device_ip, severity, description, time, ingested), all in one commit"""
+        raise NotImplementedError
+
+    def filter_new_alarms(self, host, keys) -> List:
+        """
+        @param keys: list of tuples (time, severity) of the alarms of host
+        @return: the keys that are not saved yet, nor deleted while still active (see delete_alarms), in the same order
+        """
+        raise NotImplementedError
+
+    # single alarms and pages
+
+    def select_all(self):
+        raise NotImplementedError
+
+    def select_alarm_by_ID(self, ID='0'):
+        raise NotImplementedError
+
+    def select_alarm_by_severity_unnotified(self, severity):
+        """@return: the alarms not notified yet with severity >= severity, the most severe first"""
+        raise NotImplementedError
+
+    def select_alarm_by_host_time_severity(self, host, timestamp, severity):
+        raise NotImplementedError
+
+    def select_alarm_by_device_ip(self, host):
+        raise NotImplementedError
+
+    def select_ceased_alarms(self):
+        raise NotImplementedError
+
+    def select_count_by_device_ip(self, description, host):
+        """@return: [(count,)] of the alarms of host with that description"""
+        raise NotImplementedError
+
+    def select_alarms_page(self, device_ip=None, severity=None, active_only=False, since=None, before_ID=None,
+                           limit=10):
+        """newest alarms first, at most limit + 1: the extra row tells that there is a next page"""
+        raise NotImplementedError
+
+    def select_alarms_by_IDs(self, IDs):
+        raise NotImplementedError
+
+    def select_alarms_after_ID(self, after_ID=0, limit=10000, upto_ID=None):
+        """@return: (column names, alarms) oldest first, to stream the whole storage"""
+        raise NotImplementedError
+
+    def select_last_alarm_ID(self):
+        raise NotImplementedError
+
+    def select_expired_alarms(self, severity, before, notification_threshold, limit):
+        """
+        @param before: seconds since the epoch, the alarms ingested before it (None for any time)
+        @return: (column names, alarms) ceased, notified or below the threshold, first ingested first
+        """
+        raise NotImplementedError
+
+    # aggregates
+
+    def count_alarms(self):
+        """@return: list of tuples (count, severity)"""
+        raise NotImplementedError
+
+    def count_alarms_by_description_and_device(self):
+        """@return: list of tuples (description, deviceIP, count)"""
+        raise NotImplementedError
+
+    def count_alarms_per_time_bucket(self, since, bucket_in_sec):
+        """@return: list of tuples (bucket start as unix time, severity, count) ordered by bucket"""
+        raise NotImplementedError
+
+    def select_alarm_counters(self):
+        """@return: list of tuples (deviceIP, severity, ceased, counter) with counter > 0"""
+        raise NotImplementedError
+
+    def rebuild_alarm_counters(self):
+        raise NotImplementedError
+
+    # change feed
+
+    def select_last_change_seq(self):
+        raise NotImplementedError
+
+    def select_changes_since(self, seq):
+        """@return: list of tuples (seq, alarmID, kind), kind is 'insert', 'cease' or 'delete'"""
+        raise NotImplementedError
+
+    def select_change_horizon(self):
+        """@return: the changes up to this seq may have been trimmed: a reader that saw less must reload everything"""
+        raise NotImplementedError
+
+    def trim_changes(self, keep, limit):
+        """
+        deletes the oldest changes, at most limit, so that only the last keep (at least 1) are left
+        @return: number of changes deleted
+        """
+        raise NotImplementedError
+
+    # updates
+
+    def update_notified_by_ID(self, ID):
+        """@param ID: list of alarm IDs"""
+        raise NotImplementedError
+
+    def update_ceased_alarms(self, ID):
+        raise NotImplementedError
+
+    def delete_alarms(self, IDs, deleted_at=None):
+        """
+        the keys of the alarms not ceased are remembered as tombstones: filter_new_alarms does not return them anymore
+        @param deleted_at: seconds since the epoch recorded in the tombstones (now if None)
+        @return: number of alarms deleted
+        """
+        raise NotImplementedError
+
+    def expire_tombstones(self, severity, before, limit):
+        """
+        forgets the tombstones of a severity deleted before before (seconds since the epoch), at most limit
+        @return: number of tombstones expired
+        """
+        raise NotImplementedError
+
+    def compact(self, limit):
+        """
+        gives back to the file system the space of the deleted alarms, a bounded amount of work per call
+        @return: what is left to give back (0 when done)
+        """
+        raise NotImplementedError
+
+
+def configure(config_manager=None):
+    """uses the Storage_config.Backend of the config.json"""
+    if config_manager is None:
+        config_manager = ConfigManager()
+
+    set_backend(config_manager.get_storage_backend())
+
+
+def set_backend(name) -> Optional[str]:
+    """
+    @param name: one of BACKENDS, None to read the config.json again at the next handler()
+    @return: the name of the backend used until now (None if not chosen yet)
+    """
+    global _backend
+
+    if name is not None and name not in BACKENDS:
+        raise ValueError(f'unknown storage backend {name}, expected one of {list(BACKENDS)}')
+
+    with _lock:
+        previous, _backend = _backend, name
+
+    return previous
+
+
+def get_backend() -> str:
+    if _backend is None:
+        configure()
+
+    return _backend
+
+
+def handler(db_url=None) -> StorageBackend:
+    """
+    @param db_url: where the backend saves the alarms (its default if None)
+    @return: a new handler of the configured backend, not opened yet
+    """
+    module_name, class_name = BACKENDS[get_backend()]
+
+    return getattr(timed_import(module_name), class_name)(db_url)
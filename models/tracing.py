@@ -0,0 +1,206 @@
+"""
+Lightweight tracing of the alarm pipeline: a sampled poll (or notifier check) is recorded as a tree of timed spans,
+e.g. poll -> netconf_get, parse, save_to_db, so that a late alarm can be blamed on the right stage.
+
+Only a fraction of the traces is sampled (Metrics_config.Trace_sample_rate): the others cost a random() call
+at the root and an attribute lookup per span. The durations of the sampled spans are observed in the
+trace_span_seconds histogram and the most recent traces are kept in memory, served as JSON on /traces.
+
+    with tracing.trace('poll', device=device.ip):
+        with tracing.span('netconf_get'):
+            ...
+
+The end to end latency of every notified alarm (NE timestamp -> ingested -> notification sent) is not sampled:
+see observe_alarm_latency().
+"""
+import collections
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from models import metrics
+
+SPAN_SECONDS = metrics.histogram('trace_span_seconds', 'duration of the sampled spans of the pipeline', ['span'])
+
+# seconds: from an alarm notified at the first check to one stuck behind an unreachable mail server
+LATENCY_BUCKETS = (0.5, 1.0, 2.5, 5.0, 7.5, 10.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+ALARM_LATENCY = metrics.histogram('alarm_latency_seconds',
+                                  'latency of the notified alarms: ne_to_ingest, ingest_to_sent, ne_to_sent',
+                                  ['stage'], buckets=LATENCY_BUCKETS)
+
+
+class Span(object):
+    __slots__ = ('name', 'attributes', 'start', 'duration', 'children')
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None  # seconds, set when the span ends
+        self.children = []
+
+    def to_dict(self):
+        return {'name': self.name,
+                'start': self.start,
+                'duration_ms': self.duration * 1000 if self.duration is not None else None,
+                'attributes': self.attributes,
+                'children': [child.to_dict() for child in self.children]}
+
+
+class _ActiveSpan(object):
+    """context manager timing a sampled span and pushing it on the stack of the thread"""
+
+    __slots__ = ('_tracer', '_span', '_start')
+
+    def __init__(self, tracer, span):
+        self._tracer = tracer
+        self._span = span
+
+    def __enter__(self) -> Span:
+        self._tracer._stack().append(self._span)
+        self._start = time.perf_counter()
+        return self._span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._span.duration = time.perf_counter() - self._start
+        if exc_type is not None:
+            self._span.attributes['error'] = exc_type.__name__
+
+        SPAN_SECONDS.labels(self._span.name).observe(self._span.duration)
+        self._tracer._end(self._span)
+
+
+class _NoopSpan(object):
+    """what the spans of the traces not sampled return: does nothing, as fast as possible"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Tracer(object):
+
+    def __init__(self, sample_rate=0.01, kept=100, sampler=random.random):
+        """
+        @param sample_rate: fraction [0, 1] of the traces recorded
+        @param kept: number of the most recent traces kept for recent()
+        @param sampler: function returning a random float in [0, 1) (for testing)
+        """
+        self.sample_rate = sample_rate
+        self._sampler = sampler
+        self._local = threading.local()
+        self._recent = collections.deque(maxlen=kept)
+
+    def configure(self, config_manager):
+        """applies the Trace_sample_rate and Trace_kept of the config.json"""
+        self.sample_rate = config_manager.get_trace_sample_rate()
+        self._recent = collections.deque(self._recent, maxlen=config_manager.get_trace_kept())
+
+    def trace(self, name, **attributes):
+        """
+        starts a trace (a root span) if this call is sampled. Inside an active trace it is a plain span
+        @return: context manager returning the Span, or None if not sampled
+        """
+        if len(self._stack()) > 0:
+            return self.span(name, **attributes)
+
+        if self.sample_rate <= 0 or self._sampler() >= self.sample_rate:
+            return _NOOP
+
+        return _ActiveSpan(self, Span(name, attributes))
+
+    def span(self, name, **attributes):
+        """
+        @return: context manager timing a child of the current span of the thread.
+                 It does nothing if the thread is not inside a sampled trace
+        """
+        stack = self._stack()
+        if len(stack) == 0:
+            return _NOOP
+
+        span = Span(name, attributes)
+        stack[-1].children.append(span)
+
+        return _ActiveSpan(self, span)
+
+    def current(self) -> Optional[Span]:
+        """@return: the innermost span of the thread (e.g. to add attributes), None if not in a sampled trace"""
+        stack = self._stack()
+        return stack[-1] if len(stack) > 0 else None
+
+    def recent(self) -> List:
+        """@return: the most recent traces, as dicts, the latest first"""
+        return [span.to_dict() for span in reversed(list(self._recent))]
+
+    def recent_json(self) -> str:
+        return json.dumps(self.recent(), indent=1)
+
+    def _stack(self) -> List:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        return stack
+
+    def _end(self, span):
+        stack = self._stack()
+        stack.pop()
+
+        if len(stack) == 0:  # the root: the trace is complete
+            self._recent.append(span)
+
+
+# the tracer of the process, configured by the service (see services/main_service.py)
+TRACER = Tracer()
+
+
+def trace(name, **attributes):
+    return TRACER.trace(name, **attributes)
+
+
+def span(name, **attributes):
+    return TRACER.span(name, **attributes)
+
+
+def ne_timestamp_to_epoch(timestamp) -> Optional[float]:
+    """
+    @param timestamp: time of an alarm as saved in DB, e.g. '2018-03-28 21:41:35.2749' (UTC, set by the device)
+    @return: seconds since the epoch, None if it cannot be parsed
+    """
+    for _format in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.strptime(str(timestamp), _format).replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            continue
+
+    return None
+
+
+def observe_alarm_latency(ne_timestamp, ingested, sent):
+    """
+    observes in alarm_latency_seconds how long an alarm took from the device to the notification
+
+    @param ne_timestamp: time of the alarm on the device (see ne_timestamp_to_epoch())
+    @param ingested: epoch when the collector received it, None if unknown (rows saved before it was recorded)
+    @param sent: epoch when the notification was sent
+    """
+    raised = ne_timestamp_to_epoch(ne_timestamp)
+
+    if raised is not None:
+        ALARM_LATENCY.labels('ne_to_sent').observe(max(0.0, sent - raised))
+
+    if ingested is not None:
+        ALARM_LATENCY.labels('ingest_to_sent').observe(max(0.0, sent - ingested))
+
+        if raised is not None:
+            ALARM_LATENCY.labels('ne_to_ingest').observe(max(0.0, ingested - raised))
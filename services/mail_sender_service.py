@@ -16,12 +16,10 @@ dirname = os.path.dirname(__file__)
 
 # todo: I know. it all needs a refactor.
 
-logfile = os.path.join(dirname, '../log.log')
-logging.basicConfig(filename=logfile, level=logging.ERROR)
 
-
-def send_mail(msg_body, msg_subject='SDN Alarm notification'):
-    config_manager = ConfigManager()
+def send_mail(msg_body, msg_subject='SDN Alarm notification', config_manager=None):
+    if config_manager is None:
+        config_manager = ConfigManager()
 
     if msg_body is None:
         raise Exception("you need to specify the the email body!")
@@ -59,10 +57,13 @@ def send_mail(msg_body, msg_subject='SDN Alarm notification'):
 
     with smtplib.SMTP(smtp_server, smtp_port) as smtp:
         smtp.ehlo()
-        smtp.starttls()
-        smtp.ehlo()
 
-        smtp.login(email_address_sender, email_password_sender)
+        if config_manager.get_smtp_starttls():
+            smtp.starttls()
+            smtp.ehlo()
+
+        if email_password_sender:
+            smtp.login(email_address_sender, email_password_sender)
 
         #  email message setup
         msg = EmailMessage()
@@ -1,22 +1,18 @@
 import alarm_library
 
 from models.notification_manager import NotificationManager
-from models.database_manager import DBHandler
+from models.config_manager import ConfigManager
+from models.cluster_coordinator import ClusterCoordinator
+from models.lazy_import import timed_import
+from models.metrics import MetricsServer
+from models.retention import RetentionManager
+from models import instrumented_lock, log_manager, profiler, storage, tracing
 
-import logging, os
-
-logfile = os.path.join(os.path.dirname(__file__), 'log.log')
-logging.basicConfig(filename=logfile, level=logging.WARNING)
-
-try:
-    from services import telegram_bot_service
-
-except ImportError as e:
-    logging.log(logging.WARNING, 'Could not find the telegram bot' + str(e))
+import logging
 
 
 def _create_db():
-    db = DBHandler().open_connection()
+    db = storage.handler().open_connection()
     db.create_alarm_table()
     db.close_connection()
 
@@ -26,16 +22,59 @@ def main():
     # create if does not exist the local.db
     _create_db()
 
+    config_manager = ConfigManager()
+    log_manager.setup_logging(config_manager)  # nothing if main.py already did it
+    tracing.TRACER.configure(config_manager)
+    instrumented_lock.configure(config_manager)
+    profiler.PROFILER.configure(config_manager)
+    profiler.install_signal_handler()  # kill -USR1 <pid> starts / stops a profile
+
+    try:
+        metrics_server = MetricsServer.from_config(config_manager)  # None if disabled
+        if metrics_server is not None:
+            metrics_server.add_route('/traces', tracing.TRACER.recent_json)
+            if config_manager.get_debug_endpoints_enabled():
+                metrics_server.add_route('/debug/locks', instrumented_lock.locks_report)
+                metrics_server.add_route('/debug/profile', profiler.profile_endpoint, with_params=True)
+            metrics_server.start()
+
+    except OSError as e:  # e.g. the port is already used: the service works anyway
+        logging.log(logging.ERROR, 'Could not start the metrics endpoint: ' + str(e))
+
     # starting thread to fetch netconf data from devices
-    threads = alarm_library.start_threads()
+    collector_mode = config_manager.get_collector_mode()
+
+    if collector_mode in ('sharded', 'cluster') and storage.get_backend() != 'sqlite':
+        raise ValueError(f'the {storage.get_backend()} storage backend works in a single process, '
+                         f'the {collector_mode} collector mode needs sqlite')
+
+    if collector_mode == 'sharded':
+        threads = alarm_library.ShardedAlarmCollector.from_config(config_manager).start()
+
+    elif collector_mode == 'cluster':
+        # poll only the devices of the shards leased to this node
+        coordinator = ClusterCoordinator.from_config(config_manager)
+        coordinator.start()
+        threads = alarm_library.AlarmCollector.from_config(config_manager, coordinator).start()
+
+    else:
+        threads = alarm_library.AlarmCollector.from_config(config_manager).start()
 
     # starting the notifier thread
     notifier = NotificationManager().start()
     threads.append(notifier)
 
+    retention = RetentionManager.from_config(config_manager)  # None if disabled
+    if retention is not None:
+        threads.append(retention.start())
+
     try:
-        # the bot needs to be inside the main thread for signalling purposes
-        telegram_bot_service.main()
+        if config_manager.get_bot_enabled():
+            # imported only here: python-telegram-bot is heavy and useless if the bot is disabled
+            telegram_bot_service = timed_import('services.telegram_bot_service')
+
+            # the bot needs to be inside the main thread for signalling purposes
+            telegram_bot_service.main()
 
     except Exception as e:
         logging.log(logging.INFO, 'Could not start the bot!' + str(e))
@@ -7,24 +7,30 @@ Simple bot that broadcast SDN alarm detected using NETCONF protocol
 built on top of python-telegram-bot's examples ( https://github.com/python-telegram-bot/python-telegram-bot )
 """
 
+import html
 import logging
 import json
 import requests
 import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
 
-from models.database_manager import DBHandler
+from models import storage
 from models.config_manager import ConfigManager
+from models import metrics
+from models.profiler import PROFILER
 from GUI.commonPlotFunctions import CommonFunctions
 
 # todo move the commonPlot functions outside of the gui. It's logically incorrect that a service
 # uses a method that is defined inside the gui
 
-from telegram.ext import Updater, CommandHandler
-
-# Enable logging
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    level=logging.INFO)
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Updater, CommandHandler, CallbackQueryHandler
 
+# logging is set up by the entry point (see models/log_manager.py)
 logger = logging.getLogger(__name__)
 
 
@@ -66,7 +72,7 @@ def send_single_message(chat_id, content):
     if chat_id is None:
         raise Exception("chat_id is None!")
 
-    url = f'https://api.telegram.org/bot{TOKEN}/sendMessage'
+    url = f'{ConfigManager().get_bot_api_url()}/bot{TOKEN}/sendMessage'
 
     data = {'chat_id': {chat_id}, 'text': content}
     requests.post(url, data).json()
@@ -83,10 +89,12 @@ From Official API FAQ:
 """
 
 
-def send_to_bot_group(msg_content='DEBUG ALARM'):
+def send_to_bot_group(msg_content='DEBUG ALARM', config_manager=None):
     """with this code you can broadcast to all sdn followers the alarm inside the private group"""
+    if config_manager is None:
+        config_manager = ConfigManager()
 
-    url = f'https://api.telegram.org/bot{TOKEN}/sendMessage'
+    url = f'{config_manager.get_bot_api_url()}/bot{TOKEN}/sendMessage'
 
     data = {'chat_id': {BOT_CHAT_GROUP_ID}, 'text': {msg_content}}
     r = requests.post(url, data)
@@ -104,6 +112,9 @@ def help(update, context):
                               '<b>/status</b> -> It prints the status of the bot\n'
                               '<b>/summary</b> -> It prints a summary of the overall alarms\n'
                               '<b>/alarms</b> -> It prints the severities for each host \n'
+                              '<b>/host</b> ip -> It prints the alarms of a single host\n'
+                              '<b>/active</b> [severity] -> It prints the alarms not ceased yet\n'
+                              '<b>/since</b> duration -> It prints the alarms of the last 30m, 12h, 7d...\n'
                               , parse_mode='HTML')
 
     #print(update.message.chat_id)
@@ -116,53 +127,384 @@ def status(update, context):
 
 
 
-def summary(update, context):
-    """gives the user the received severities with correspondent counters"""
-    msg = ''
+# key: command name, item: (last change seq, creation time, message).
+# an answer is reused until an alarm is inserted/ceased/deleted, by any process, or it gets older than the configured TTL
+_response_cache = {}
+# key: command name, item: (last change seq, Future of the message) of the answer being built:
+# the commands arriving meanwhile wait for it instead of building it again
+_response_builds = {}
+_response_cache_lock = threading.Lock()
+_response_cache_ttl = None
 
-    getNewData = CommonFunctions()
-    results = getNewData.fetchDataFromDB()
+
+def _last_change_seq() -> int:
+    """@return: the seq of the last change of the alarm table, stored in the DB: it moves with every writer"""
+    db = storage.handler().open_connection()
     try:
-        if (len(results) == 0):
-            raise Exception("No msg sent to the subscribers")
-        totalAlarmsPerSeverity = getNewData.organizeTotalAlarmsPerSeverity(results)
+        return db.select_last_change_seq()
+    finally:
+        db.close_connection()
+
+
+def _cached_response(key, build_msg):
+    """
+    returns the message built by build_msg(), reusing the last one if the alarm table did not change in the meantime
+
+    @param key: name of the cached answer (e.g. the command)
+    @param build_msg: function without parameters that builds the message, reading the DB
+    @return: the message
+    """
+    global _response_cache_ttl
+    if _response_cache_ttl is None:  # read once, not at every command
+        _response_cache_ttl = ConfigManager().get_bot_cache_ttl()
+
+    version = _last_change_seq()
+    now = time.monotonic()
 
-        for severity in sorted(totalAlarmsPerSeverity):
-            _config_manager = ConfigManager()
-            description=_config_manager.get_severity_mapping(int(severity))
-            msg += f'<i>{description}</i>: {(totalAlarmsPerSeverity[severity])}\n'
+    with _response_cache_lock:
+        cached = _response_cache.get(key)
+        if cached is not None and cached[0] == version and now - cached[1] < _response_cache_ttl:
+            return cached[2]
 
-        update.message.reply_text('<b>Alarms\' Summary</b>:\n' + msg, parse_mode='HTML')
+        building = _response_builds.get(key)
+        owner = building is None or building[0] != version
+        if owner:
+            building = _response_builds[key] = (version, Future())
+
+    if not owner:
+        return building[1].result()
+
+    try:
+        msg = build_msg()
+        building[1].set_result(msg)
+
+        with _response_cache_lock:
+            _response_cache[key] = (version, now, msg)
+
+        return msg
 
     except Exception as e:
-        logging.log(logging.ERROR, "Error loading data in the telegram bot: " + str(e))
-        msg += 'No Alarms in DB!'
-        update.message.reply_text(msg)
+        building[1].set_exception(e)
+        raise
+
+    finally:
+        with _response_cache_lock:
+            if _response_builds.get(key) is building:
+                del _response_builds[key]
+
+
+def _build_summary_msg():
+    """builds the answer of /summary: the received severities with correspondent counters"""
+    getNewData = CommonFunctions()
+    counters = getNewData.fetchCountersFromDB()
+
+    if (len(counters) == 0):
+        return 'No Alarms in DB!'
+
+    totalAlarmsPerSeverity = getNewData.organizeTotalAlarmsPerSeverityFromCounters(counters)
 
-def singleHostAlarms(update, context):
-    """gives the user the received severities for each host"""
     msg = ''
+    _config_manager = ConfigManager()
+    for severity in sorted(totalAlarmsPerSeverity):
+        description=_config_manager.get_severity_mapping(int(severity))
+        msg += f'<i>{description}</i>: {(totalAlarmsPerSeverity[severity])}\n'
+
+    return '<b>Alarms\' Summary</b>:\n' + msg
 
+
+def _build_single_host_alarms_msg():
+    """builds the answer of /alarms: the received severities for each host"""
     getNewData = CommonFunctions()
-    results = getNewData.fetchDataFromDB()
-    try:
-        if (len(results) == 0):
-            raise Exception("No msg sent to the subscribers")
-        alarmsPerHost = getNewData.organizeAlarmsPerHost(results)
-
-        for host in sorted(alarmsPerHost):
-            msg += f'<b>Ip Address</b>:{host}\n'
-            for severity in sorted(alarmsPerHost[host]):
-                _config_manager = ConfigManager()
-                description = _config_manager.get_severity_mapping(int(severity))
-                msg += f'{severity} - <i>{description}</i>:# {(alarmsPerHost[host][severity])}\n'
-            msg+='\n'
-        update.message.reply_text('<b>Alarms \' per Host </b>:\n\n' + msg, parse_mode='HTML')
+    counters = getNewData.fetchCountersFromDB()
 
-    except Exception as e:
-        logging.log(logging.ERROR, "Error loading data in the telegram bot: " + str(e))
-        msg += 'No Alarms in DB!'
-        update.message.reply_text(msg)
+    if (len(counters) == 0):
+        return 'No Alarms in DB!'
+
+    alarmsPerHost = getNewData.organizeAlarmsPerHostFromCounters(counters)
+
+    msg = ''
+    _config_manager = ConfigManager()
+    for host in sorted(alarmsPerHost):
+        msg += f'<b>Ip Address</b>:{host}\n'
+        for severity in sorted(alarmsPerHost[host]):
+            description = _config_manager.get_severity_mapping(int(severity))
+            msg += f'{severity} - <i>{description}</i>:# {(alarmsPerHost[host][severity])}\n'
+        msg+='\n'
+
+    return '<b>Alarms \' per Host </b>:\n\n' + msg
+
+
+# DB backed commands are answered by this pool, never by the dispatcher thread:
+# a slow query cannot delay the other commands (e.g. /status keeps answering)
+_db_pool = None
+_db_pool_lock = threading.Lock()
+_pending_commands = 0
+metrics.gauge('bot_pending_commands', 'bot commands waiting for (or running on) the worker pool')\
+    .set_function(lambda: _pending_commands)
+
+
+class _PendingCommand(object):
+    """a command submitted to the pool. It is answered once: either with its result or with the timeout message"""
+
+    def __init__(self, update, parse_mode):
+        self.update = update
+        self.parse_mode = parse_mode
+        self.future = None
+        self.timer = None
+        self._lock = threading.Lock()
+        self._answered = False
+
+    def _claim_answer(self) -> bool:
+        with self._lock:
+            if self._answered:
+                return False
+            self._answered = True
+            return True
+
+    def on_timeout(self):
+        if self._claim_answer():
+            self.future.cancel()  # if it did not start yet, it will never run
+            _reply(self.update, 'Sorry, it is taking too long. Try again later!')
+
+    def on_done(self, future):
+        global _pending_commands
+        with _db_pool_lock:
+            _pending_commands -= 1
+
+        if future.cancelled() or not self._claim_answer():
+            return
+
+        self.timer.cancel()
+
+        try:
+            _reply(self.update, future.result(), parse_mode=self.parse_mode)
+
+        except Exception as e:
+            logging.log(logging.ERROR, "Error loading data in the telegram bot: " + str(e))
+            _reply(self.update, 'No Alarms in DB!')
+
+
+def _reply(update, answer, parse_mode=None):
+    """
+    answers a command with a new message, or a 'next page' button click by editing the page message
+    @param answer: the text, or a tuple (text, reply_markup) to attach inline buttons
+    """
+    text, reply_markup = answer if isinstance(answer, tuple) else (answer, None)
+
+    if update.callback_query is not None:
+        update.callback_query.answer()
+        update.callback_query.edit_message_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+    else:
+        update.message.reply_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+
+
+def _get_db_pool():
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = ThreadPoolExecutor(max_workers=ConfigManager().get_bot_worker_threads(),
+                                          thread_name_prefix='bot-db-worker')
+        return _db_pool
+
+
+def _answer_in_pool(update, build_msg, parse_mode='HTML'):
+    """
+    builds the answer of a command on the worker pool and sends it when ready, without blocking the dispatcher.
+    If the answer is not ready within the configured timeout the user is told so and the late result is dropped.
+
+    @param update: the telegram update of the command
+    @param build_msg: function without parameters that builds the answer (it can read the DB)
+    """
+    global _pending_commands
+    pool = _get_db_pool()
+    _config_manager = ConfigManager()
+
+    with _db_pool_lock:
+        if _pending_commands >= _config_manager.get_bot_max_pending_commands():
+            _reply(update, 'I\'m busy right now, try again in a few seconds!')
+            return
+        _pending_commands += 1
+
+    command = _PendingCommand(update, parse_mode)
+    command.timer = threading.Timer(_config_manager.get_bot_command_timeout(), command.on_timeout)
+    command.timer.daemon = True
+    command.future = pool.submit(build_msg)
+    command.timer.start()
+    command.future.add_done_callback(command.on_done)
+
+
+def summary(update, context):
+    """gives the user the received severities with correspondent counters"""
+    _answer_in_pool(update, lambda: _cached_response('summary', _build_summary_msg))
+
+def singleHostAlarms(update, context):
+    """gives the user the received severities for each host"""
+    _answer_in_pool(update, lambda: _cached_response('alarms', _build_single_host_alarms_msg))
+
+
+def _parse_duration(text) -> timedelta:
+    """'45s', '30m', '12h', '7d' -> timedelta"""
+    units = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+
+    if len(text) < 2 or text[-1] not in units or not text[:-1].isdigit():
+        raise ValueError('duration must be a number followed by s, m, h or d (e.g. 30m)')
+
+    return timedelta(**{units[text[-1]]: int(text[:-1])})
+
+
+def _parse_severity(text) -> int:
+    """accepts both the severity level (e.g. 5) and its name (e.g. critical)"""
+    severity_levels = ConfigManager().get_severity_levels()
+
+    if text in severity_levels:
+        return severity_levels[text]
+    if text.isdigit() and int(text) in severity_levels.values():
+        return int(text)
+
+    raise ValueError('unknown severity, use one of: ' + ', '.join(severity_levels))
+
+
+# an IPv4 / IPv6 address or a hostname: no '|' (the separator of the callback data) and short enough to fit its 64 bytes
+_HOST_PATTERN = re.compile(r'[A-Za-z0-9.:_-]{1,40}')
+_CALLBACK_DATA_MAX_BYTES = 64
+
+
+def _validate_argument(command, argument):
+    """raises ValueError with the message for the user if the argument of /host, /active or /since is invalid"""
+    if command not in ('host', 'active', 'since'):
+        raise ValueError(f'unknown command {command}')
+    if command == 'host' and not _HOST_PATTERN.fullmatch(argument):
+        raise ValueError('host must be an IP address or a hostname (at most 40 characters)')
+    if command == 'active' and argument != '':
+        _parse_severity(argument)
+    if command == 'since':
+        _parse_duration(argument)
+
+
+def _build_alarms_page_msg(command, argument, before_ID=None):
+    """
+    builds one page of /host, /active or /since.
+
+    @param command: 'host', 'active' or 'since'
+    @param argument: the argument of the command as typed by the user ('' if missing)
+    @param before_ID: ID of the last alarm shown in the previous page
+    @return: (text, reply_markup) where reply_markup holds the 'next page' button, if there's a next page
+    """
+    _config_manager = ConfigManager()
+    page_size = _config_manager.get_bot_page_size()
+
+    filters = {}
+    if command == 'host':
+        filters['device_ip'] = argument
+        title = f'Alarms of {argument}'
+    elif command == 'active':
+        filters['active_only'] = True
+        title = 'Active alarms'
+        if argument != '':
+            filters['severity'] = _parse_severity(argument)
+            title += ' (' + _config_manager.get_severity_mapping(filters['severity']) + ')'
+    else:
+        # the NE timestamps saved in the DB are in UTC
+        filters['since'] = (datetime.utcnow() - _parse_duration(argument)).strftime('%Y-%m-%d %H:%M:%S')
+        title = f'Alarms of the last {argument}'
+
+    db = storage.handler().open_connection()
+    rows = db.select_alarms_page(before_ID=before_ID, limit=page_size, **filters)
+    db.close_connection()
+
+    if len(rows) == 0:
+        return 'No Alarms in DB!'
+
+    msg = f'<b>{html.escape(title)}</b>:\n\n'
+    for alarm in rows[:page_size]:
+        description = _config_manager.get_severity_mapping(int(alarm[2]))
+        ceased = ' (ceased)' if alarm[6] == 1 else ''
+        msg += f'#{alarm[0]} <b>{alarm[1]}</b> <i>{description}</i>{ceased}\n{html.escape(str(alarm[3]))}\n{alarm[4]}\n\n'
+
+    reply_markup = None
+    if len(rows) > page_size:  # the extra row means that there's a next page
+        # callback data must be at most 64 bytes: the arguments are validated to fit (see _validate_argument)
+        data = f'page|{command}|{argument}|{rows[page_size - 1][0]}'
+        if len(data.encode('utf-8')) <= _CALLBACK_DATA_MAX_BYTES:
+            reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton('Next page >>', callback_data=data)]])
+        else:
+            logger.warning(f'no next page button: callback data {data!r} longer than {_CALLBACK_DATA_MAX_BYTES} bytes')
+
+    return msg, reply_markup
+
+
+def _alarms_page_command(command, update, context, argument_required):
+    argument = ' '.join(context.args) if context.args else ''
+
+    if argument_required and argument == '':
+        update.message.reply_text(f'Usage: /{command} <argument>, type /help to know more')
+        return
+
+    try:  # validate the argument here, so that the user gets the error message instead of 'No Alarms in DB!'
+        _validate_argument(command, argument)
+    except ValueError as e:
+        update.message.reply_text(str(e))
+        return
+
+    _answer_in_pool(update, lambda: _build_alarms_page_msg(command, argument))
+
+
+def host(update, context):
+    """/host <ip>: the alarms of a single host, newest first"""
+    _alarms_page_command('host', update, context, True)
+
+
+def active(update, context):
+    """/active [severity]: the alarms not ceased yet, optionally of a single severity"""
+    _alarms_page_command('active', update, context, False)
+
+
+def since(update, context):
+    """/since <duration>: the alarms of the last 30m, 12h, 7d..."""
+    _alarms_page_command('since', update, context, True)
+
+
+def profile(update, context):
+    """/profile [duration] (admins only): samples the threads of the service for 30s, 2m... /profile stop ends it"""
+    if update.message.chat_id not in ConfigManager().get_bot_admin_chat_ids():
+        update.message.reply_text('Sorry, /profile is reserved to the admins.')
+        return
+
+    argument = context.args[0] if context.args else ''
+
+    if argument == 'stop':
+        PROFILER.stop()
+        update.message.reply_text('Stopping the profile...')
+        return
+
+    try:
+        duration = _parse_duration(argument).total_seconds() if argument != '' else None
+    except ValueError as e:
+        update.message.reply_text(str(e))
+        return
+
+    def on_done(path):
+        update.message.reply_text(f'Profile written in {path}')
+
+    if PROFILER.start(duration, on_done):
+        update.message.reply_text(f'Profiling for {PROFILER.status()["remaining_sec"]:.0f}s, '
+                                  'I\'ll tell you when the profile is written.')
+    else:
+        update.message.reply_text('A profile is already running: /profile stop to end it.')
+
+
+def next_page(update, context):
+    """the 'next page' button of /host, /active and /since has been clicked"""
+    try:  # the data of the buttons of an older version of the bot may not be valid anymore
+        _, command, argument, before_ID = update.callback_query.data.split('|')
+        _validate_argument(command, argument)
+        before_ID = int(before_ID)
+    except ValueError as e:
+        logger.warning(f'invalid next page callback data {update.callback_query.data!r}: {e}')
+        update.callback_query.answer('This page is not available anymore')
+        return
+
+    _answer_in_pool(update, lambda: _build_alarms_page_msg(command, argument, before_ID))
 
 def error(update, context):
     """Log Errors caused by Updates."""
@@ -185,6 +527,11 @@ def main():
     dp.add_handler(CommandHandler("status", status))
     dp.add_handler(CommandHandler("summary", summary))
     dp.add_handler(CommandHandler("alarms", singleHostAlarms))
+    dp.add_handler(CommandHandler("host", host))
+    dp.add_handler(CommandHandler("active", active))
+    dp.add_handler(CommandHandler("since", since))
+    dp.add_handler(CommandHandler("profile", profile))
+    dp.add_handler(CallbackQueryHandler(next_page, pattern='^page\\|'))
 
     # log all errors
     dp.add_error_handler(error)
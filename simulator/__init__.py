@@ -0,0 +1,4 @@
+"""
+Local NETCONF device simulator, to test and benchmark the alarm collection without lab hardware.
+usage: python -m simulator --help
+"""
@@ -0,0 +1,53 @@
+"""
+starts a NetconfSimulator until CTRL+C, e.g. 1000 devices with 50 alarms each, one change every 10 s:
+
+    python -m simulator --devices 1000 --alarms 50 --churn 0.1 --network network.json
+
+network.json is the 'Network' list to paste inside the config.json to poll the simulated devices.
+"""
+import argparse
+import json
+
+from models import log_manager
+from simulator.netconf_server import NetconfSimulator
+from simulator.virtual_device import VirtualDevice
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m simulator', description='local NETCONF device simulator')
+    parser.add_argument('--devices', type=int, default=10, help='number of simulated devices')
+    parser.add_argument('--host', default='127.0.0.1', help='address of the first device, the others follow')
+    parser.add_argument('--base-port', type=int, default=20830, help='port of the first device, the others follow')
+    parser.add_argument('--user', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--alarms', type=int, default=10, help='active alarms per device')
+    parser.add_argument('--churn', type=float, default=0.0, help='alarms replaced per second on each device')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds waited before each reply')
+    parser.add_argument('--connect-failure-rate', type=float, default=0.0, help='probability of a dropped connection')
+    parser.add_argument('--rpc-failure-rate', type=float, default=0.0, help='probability of an rpc-error reply')
+    parser.add_argument('--fetch-rate', type=int, default=5, help='netconf_fetch_rate_in_sec written in --network')
+    parser.add_argument('--network', help='file where to write the Network list for the config.json')
+    args = parser.parse_args()
+
+    log_manager.setup_logging()  # the same sink and level (Logging_config) as the service
+
+    devices = [VirtualDevice(f'sim-{i}', args.alarms, args.churn, args.latency,
+                             args.connect_failure_rate, args.rpc_failure_rate)
+               for i in range(args.devices)]
+    simulator = NetconfSimulator(devices, args.host, args.base_port, args.user, args.password)
+
+    if args.network:
+        with open(args.network, 'w') as _file:
+            json.dump(simulator.network_config(args.fetch_rate), _file, indent=4, sort_keys=True)
+
+    threads = simulator.start()
+
+    try:
+        for t in threads:
+            t.join()
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+NETCONF over SSH server simulating many network elements on localhost, one address and port per VirtualDevice.
+It speaks base:1.0 (messages delimited by ]]>]]>) and supports <get>/<get-config> of the alarms,
+<create-subscription> (RFC 5277 notification stream of raised / cleared alarms) and <close-session>.
+"""
+import ipaddress
+import logging
+import selectors
+import socket
+import threading
+import time
+from typing import Dict, List
+
+import lxml.etree as ET
+import paramiko
+
+from simulator.virtual_device import BASE_NAMESPACE, ME_NAMESPACE, alarm_xml, device_timestamp
+
+NOTIFICATION_NAMESPACE = 'urn:ietf:params:xml:ns:netconf:notification:1.0'
+DELIMITER = b']]>]]>'
+
+_SERVER_HELLO = f'<?xml version="1.0" encoding="UTF-8"?><hello xmlns="{BASE_NAMESPACE}"><capabilities>' \
+                '<capability>urn:ietf:params:netconf:base:1.0</capability>' \
+                '<capability>urn:ietf:params:netconf:capability:notification:1.0</capability>' \
+                '</capabilities><session-id>{session_id}</session-id></hello>'
+
+
+class _SSHServer(paramiko.ServerInterface):
+    """accepts a single user / password and the 'netconf' subsystem"""
+
+    def __init__(self, user, password):
+        self._user = user
+        self._password = password
+        self.subsystem_requested = threading.Event()
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if username == self._user and password == self._password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_subsystem_request(self, channel, name):
+        if name != 'netconf':
+            return False
+
+        self.subsystem_requested.set()
+        return True
+
+
+class _NetconfSession(object):
+
+    def __init__(self, channel, device, session_id):
+        self._channel = channel
+        self._device = device
+        self._session_id = session_id
+        self._send_lock = threading.Lock()  # replies and notifications are sent by different threads
+        self._listener = None
+
+    def run(self):
+        try:
+            self.__send(_SERVER_HELLO.format(session_id=self._session_id))
+
+            messages = self.__messages()
+            next(messages)  # the client <hello>: only base:1.0 is advertised, nothing to negotiate
+
+            for message in messages:
+                if not self.__handle(message):
+                    break
+
+        except (StopIteration, EOFError, OSError, paramiko.SSHException):
+            pass  # the client went away
+
+        finally:
+            if self._listener is not None:
+                self._device.remove_listener(self._listener)
+            self._channel.close()
+
+    def __messages(self):
+        buffer = b''
+
+        while True:
+            while DELIMITER not in buffer:
+                data = self._channel.recv(65536)
+                if not data:
+                    raise EOFError
+
+                buffer += data
+
+            message, buffer = buffer.split(DELIMITER, 1)
+            yield message
+
+    def __send(self, xml):
+        with self._send_lock:
+            self._channel.sendall(xml.encode('utf-8') + DELIMITER)
+
+    def __reply(self, message_id, body):
+        self.__send(f'<?xml version="1.0" encoding="UTF-8"?>'
+                    f'<rpc-reply xmlns="{BASE_NAMESPACE}" message-id="{message_id}">{body}</rpc-reply>')
+
+    def __handle(self, message) -> bool:
+        """@return: False if the session must be closed"""
+        rpc = ET.fromstring(message.strip())
+        message_id = rpc.get('message-id', '')
+        operation = ET.QName(rpc[0]).localname if len(rpc) > 0 else ''
+
+        if self._device.latency > 0:
+            time.sleep(self._device.latency)
+
+        if operation in ('get', 'get-config'):
+            if self._device.rpc_fails():
+                self.__reply(message_id, _rpc_error('operation-failed', 'simulated failure'))
+            else:
+                self.__reply(message_id, f'<data>{self._device.alarms_xml()}</data>')
+
+        elif operation == 'create-subscription':
+            if self._listener is None:
+                self._listener = self.__notify
+                self._device.add_listener(self._listener)
+            self.__reply(message_id, '<ok/>')
+
+        elif operation == 'close-session':
+            self.__reply(message_id, '<ok/>')
+            return False
+
+        else:
+            self.__reply(message_id, _rpc_error('operation-not-supported', operation))
+
+        return True
+
+    def __notify(self, event, alarm):
+        try:
+            self.__send(f'<notification xmlns="{NOTIFICATION_NAMESPACE}">'
+                        f'<eventTime>{device_timestamp(time.time())}</eventTime>'
+                        f'<alarm-notification xmlns="{ME_NAMESPACE}"><state>{event}</state>{alarm_xml(alarm)}'
+                        f'</alarm-notification></notification>')
+        except (OSError, EOFError, paramiko.SSHException):
+            pass  # the session is closing
+
+
+def _rpc_error(tag, message) -> str:
+    return f'<rpc-error><error-type>application</error-type><error-tag>{tag}</error-tag>' \
+           f'<error-severity>error</error-severity><error-message>{message}</error-message></rpc-error>'
+
+
+class NetconfSimulator(object):
+
+    def __init__(self, devices, host='127.0.0.1', base_port=20830, user='admin', password='admin',
+                 host_key=None, tick=1.0):
+        """
+        @param devices: list of VirtualDevice, the i-th one listens on host + i, port base_port + i
+        @param host: address of the first device. The collector tells the devices apart by their IP: each one gets
+                     its own (127.0.0.1, 127.0.0.2, ... are all loopback addresses on Linux)
+        @param user: username accepted by every device
+        @param password: password accepted by every device
+        @param host_key: paramiko key of the SSH server (a new RSA key if None)
+        @param tick: seconds between two churn updates of the devices with a notification subscriber
+        """
+        self.devices = list(devices)
+        self.host = host
+        self.base_port = base_port
+        self.user = user
+        self.password = password
+        self._host_key = host_key if host_key is not None else paramiko.RSAKey.generate(2048)
+        self._tick = tick
+        self._selector = selectors.DefaultSelector()
+        self._sockets = []
+        self._stop = threading.Event()
+        self._threads = []
+        self._session_ids = iter(range(1, 2 ** 31))
+
+    def host_of(self, index) -> str:
+        return str(ipaddress.ip_address(self.host) + index)
+
+    def port_of(self, index) -> int:
+        return self.base_port + index
+
+    def network_config(self, fetch_rate=5) -> List:
+        """@return: the 'Network' list of the config.json polling the simulated devices"""
+        return [{'device_ip': self.host_of(i),
+                 'netconf_fetch_rate_in_sec': fetch_rate,
+                 'netconf_password': self.password,
+                 'netconf_port': self.port_of(i),
+                 'netconf_user': self.user}
+                for i in range(len(self.devices))]
+
+    def start(self) -> List:
+        """
+        opens the listening sockets and starts the accept and churn threads
+        @return: List of threads that need to be joined outside
+        """
+        for index, device in enumerate(self.devices):
+            _socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            _socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            _socket.bind((self.host_of(index), self.port_of(index)))
+            _socket.listen(64)
+            _socket.setblocking(False)
+
+            self._selector.register(_socket, selectors.EVENT_READ, device)
+            self._sockets.append(_socket)
+
+        for target, name in ((self.__accept_loop, 'simulator-accept'), (self.__churn_loop, 'simulator-churn')):
+            _t = threading.Thread(target=target, name=name, daemon=True)
+            _t.start()
+            self._threads.append(_t)
+
+        last = len(self.devices) - 1
+        logging.log(logging.INFO, f'simulating {len(self.devices)} devices on {self.host}:{self.base_port}'
+                                  f'-{self.host_of(last)}:{self.port_of(last)}')
+
+        return list(self._threads)
+
+    def stop(self):
+        self._stop.set()
+
+        for _socket in self._sockets:
+            self._selector.unregister(_socket)
+            _socket.close()
+
+        self._sockets = []
+
+    def stats(self) -> Dict:
+        """@return: dict device name -> number of active alarms"""
+        return {device.name: len(device.alarms()) for device in self.devices}
+
+    def __accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                events = self._selector.select(timeout=0.5)
+            except (OSError, ValueError):  # the sockets have been closed by stop()
+                return
+
+            for key, _ in events:
+                try:
+                    connection, _ = key.fileobj.accept()
+                except (BlockingIOError, OSError):
+                    continue
+
+                threading.Thread(target=self.__serve, args=(connection, key.data), daemon=True).start()
+
+    def __serve(self, connection, device):
+        if device.connection_fails():
+            connection.close()  # simulated unreachable device
+            return
+
+        connection.setblocking(True)
+        transport = paramiko.Transport(connection)
+        transport.add_server_key(self._host_key)
+        server = _SSHServer(self.user, self.password)
+
+        try:
+            transport.start_server(server=server)
+            channel = transport.accept(timeout=20)
+
+            if channel is not None and server.subsystem_requested.wait(timeout=20):
+                _NetconfSession(channel, device, next(self._session_ids)).run()
+
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            logging.log(logging.WARNING, f'simulated device {device.name}: {e}')
+
+        finally:
+            transport.close()
+
+    def __churn_loop(self):
+        # the devices without subscribers are updated lazily, when their alarms are requested
+        while not self._stop.wait(self._tick):
+            for device in self.devices:
+                if device.has_listeners():
+                    device.update()
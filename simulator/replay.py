@@ -0,0 +1,173 @@
+"""
+Replay harness: feeds a synthetic workload (see simulator/workload.py) through the same path as the real polls,
+CustomXMLParser -> AlarmCollector.save_to_db() -> NotificationManager, on a separate DB and at an accelerated speed,
+and reports how long every stage took and how far behind the timeline the pipeline fell.
+
+    python -m simulator.replay --devices 100 --duration 600 --speed 100 --storm-at 60
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from alarm_library import AlarmCollector
+from models import database_manager, storage
+from models.config_manager import ConfigManager
+from models.customXMLParser import CustomXMLParser
+from models.database_manager import DBHandler
+from models.notification_manager import NotificationManager
+from simulator.workload import WorkloadGenerator
+
+
+def percentile(values, p) -> float:
+    """@return: the p-th percentile (nearest rank) of values, 0 if empty"""
+    if len(values) == 0:
+        return 0.0
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summary(values) -> Dict:
+    """@return: count, mean, p50, p99 and max of a list of durations in seconds, in milliseconds"""
+    return {'count': len(values),
+            'mean_ms': sum(values) / len(values) * 1000 if len(values) > 0 else 0.0,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': max(values) * 1000 if len(values) > 0 else 0.0}
+
+
+class _ReplayNotificationManager(NotificationManager):
+    """counts the messages instead of sending them (unless deliver is True)"""
+
+    def __init__(self):
+        super().__init__()
+        self.deliver = False
+        self.messages = 0
+
+    def notify(self, msg="DEBUG FROM NOTIFICATION MANAGER!"):
+        self.messages += 1
+
+        if self.deliver:
+            super().notify(msg)
+
+
+class ReplayHarness(object):
+
+    def __init__(self, config_manager=None, db_url=None, deliver=False):
+        """
+        @param config_manager: ConfigManager for severities and flags (a new one if None)
+        @param db_url: sqlite file the replay writes in (a new temporary file if None). Never use the local.db
+        @param deliver: if True the notifications are really sent (mail / telegram), as configured
+        """
+        self._config_manager = config_manager if config_manager is not None else ConfigManager()
+        self.db_url = db_url if db_url else os.path.join(tempfile.mkdtemp(prefix='replay-'), 'replay.db')
+        self._collector = AlarmCollector([], self._config_manager)
+        self._notifier = _ReplayNotificationManager()  # a singleton, like the NotificationManager
+        self._notifier.deliver = deliver
+        self._notifier.messages = 0
+
+    def replay(self, snapshots, speed=10.0, notify_interval=5.0) -> Dict:
+        """
+        @param snapshots: iterable of (seconds from the beginning, device ip, <rpc-reply> xml) sorted by time
+        @param speed: timeline seconds per real second (0: as fast as possible)
+        @param notify_interval: timeline seconds between two checks of the notifier (5 s in production)
+        @return: report of the replay (see summary() for the stages)
+        """
+        stages = {'parse': [], 'save': [], 'notify': []}
+        lag = []  # real seconds each poll was processed after its time in the accelerated timeline
+        alarms_parsed = 0
+        alarms_notified = 0
+        duration = 0.0
+        next_notify = notify_interval
+
+        previous_url = database_manager.default_url
+        database_manager.default_url = self.db_url  # every DBHandler of the pipeline writes in the replay DB
+        previous_backend = storage.set_backend('sqlite')
+
+        try:
+            db = DBHandler().open_connection()
+            db.create_alarm_table()
+            db.close_connection()
+
+            start = time.perf_counter()
+
+            for t, device, xml in snapshots:
+                duration = t
+
+                while t >= next_notify:  # the notifier runs on its own clock
+                    alarms_notified += len(self.__timed(stages['notify'], self._notifier.check_new_alarms))
+                    next_notify += notify_interval
+
+                if speed > 0:
+                    scheduled = start + t / speed
+                    time.sleep(max(0.0, scheduled - time.perf_counter()))
+                    lag.append(max(0.0, time.perf_counter() - scheduled))
+
+                alarms = self.__timed(stages['parse'], CustomXMLParser(xml).parse_all_alarms_xml)
+                alarms_parsed += len(alarms)
+                self.__timed(stages['save'], self._collector.save_to_db, device, alarms)
+
+            alarms_notified += len(self.__timed(stages['notify'], self._notifier.check_new_alarms))
+            wall_time = time.perf_counter() - start
+
+        finally:
+            database_manager.default_url = previous_url
+            storage.set_backend(previous_backend)
+
+        report = {'timeline_sec': duration,
+                  'wall_time_sec': wall_time,
+                  'requested_speed': speed,
+                  'achieved_speed': duration / wall_time if wall_time > 0 else 0.0,
+                  'alarms_parsed': alarms_parsed,
+                  'alarms_notified': alarms_notified,
+                  'notification_messages': self._notifier.messages,
+                  'lag': summary(lag)}
+        report.update({stage: summary(values) for stage, values in stages.items()})
+
+        return report
+
+    @staticmethod
+    def __timed(durations: List, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        durations.append(time.perf_counter() - start)
+
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m simulator.replay', description='replays a synthetic workload')
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--baseline-alarms', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=600, help='seconds of timeline')
+    parser.add_argument('--poll-interval', type=float, default=5)
+    parser.add_argument('--speed', type=float, default=10, help='e.g. 10 or 100 times the real rate, 0 for max')
+    parser.add_argument('--storm-at', type=float, action='append', default=[], help='second of a storm')
+    parser.add_argument('--storm-alarms', type=int, default=50, help='alarms per device hit by a storm')
+    parser.add_argument('--flapping-devices', type=int, default=1)
+    parser.add_argument('--clear-at', type=float, action='append', default=[], help='second of random clears')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', help='sqlite file of the replay (a temporary one by default)')
+    parser.add_argument('--deliver', action='store_true', help='really send the notifications')
+    args = parser.parse_args()
+
+    workload = WorkloadGenerator(args.devices, args.baseline_alarms, seed=args.seed)
+    flap_period = 4 * args.poll_interval
+    workload.add_flaps(0, args.flapping_devices, flap_period, count=int(args.duration // flap_period))
+
+    for at in args.storm_at:
+        workload.add_storm(at, alarms_per_device=args.storm_alarms)
+    for at in args.clear_at:
+        workload.add_random_clears(at)
+
+    report = ReplayHarness(db_url=args.db, deliver=args.deliver)\
+        .replay(workload.snapshots(args.duration, args.poll_interval), args.speed)
+
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
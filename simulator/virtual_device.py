@@ -0,0 +1,152 @@
+"""
+Alarm model of a simulated network element: a set of active alarms that changes over time (churn),
+rendered as the managed-element/alarm subtree returned by the real devices (see dummy_data.xml).
+"""
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List
+from xml.sax.saxutils import escape
+
+BASE_NAMESPACE = 'urn:ietf:params:xml:ns:netconf:base:1.0'
+ME_NAMESPACE = 'http://www.advaoptical.com/aos/netconf/aos-core-managed-element'
+FMT_NAMESPACE = 'http://www.advaoptical.com/aos/netconf/aos-core-fm-types'
+
+# (condition, condition-description) of the alarms found on the real devices
+_CONDITIONS = [('acor-etht:link-fail', 'Ethernet link failure'),
+               ('acor-factt:laser-on-delay', 'Laser on delay'),
+               ('acor-factt:loss-of-signal', 'Loss of Signal'),
+               ('acor-tmdtt:ntp-server-unavailable', 'NTP server unavailable'),
+               ('acor-factt:server-signal-fail', 'Server Signal Fail'),
+               ('acor-factt:server-signal-fail-payload', 'Server Signal Fail payload'),
+               ('acor-factt:tca-unavailable-seconds-hi', 'TCA unavailable seconds high')]
+
+_SEVERITIES = ['critical', 'major', 'minor', 'warning', 'not-alarmed', 'not-reported']
+
+RAISED = 'raised'
+CLEARED = 'cleared'
+
+
+def device_timestamp(seconds) -> str:
+    """@return: timestamp in the format of the devices, e.g. 2018-03-28T21:41:35.2749Z"""
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-2] + 'Z'
+
+
+class VirtualDevice(object):
+
+    def __init__(self, name, alarm_count=10, churn=0.0, latency=0.0, connect_failure_rate=0.0,
+                 rpc_failure_rate=0.0, seed=None, clock=time.time):
+        """
+        @param name: name of the device (it seeds its random generator if seed is None)
+        @param alarm_count: active alarms at any time
+        @param churn: alarms cleared (and replaced by a new one) per second
+        @param latency: seconds waited before answering each rpc
+        @param connect_failure_rate: probability [0, 1] that a connection is dropped before the SSH handshake
+        @param rpc_failure_rate: probability [0, 1] that a <get> is answered with an rpc-error
+        @param clock: function returning the current time in seconds (for testing)
+        """
+        self.name = name
+        self.churn = churn
+        self.latency = latency
+        self.connect_failure_rate = connect_failure_rate
+        self.rpc_failure_rate = rpc_failure_rate
+        self._random = random.Random(seed if seed is not None else name)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._alarms = {}  # key: alarm id, item: dict of the alarm's elements
+        self._next_id = 0
+        self._listeners = []
+        self._last_update = clock()
+        self._carry = 0.0  # fraction of churn event not happened yet
+        self._last_raised = 0.0
+
+        for _ in range(alarm_count):
+            self.__raise_alarm(self._last_update)
+
+    def add_listener(self, listener):
+        """@param listener: function(event, alarm) called at every raised / cleared alarm (notification streams)"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def has_listeners(self) -> bool:
+        with self._lock:
+            return len(self._listeners) > 0
+
+    def update(self) -> List:
+        """
+        applies the churn of the time passed since the previous update
+        @return: list of (event, alarm dict) that happened
+        """
+        with self._lock:
+            now = self._clock()
+            self._carry += self.churn * max(0.0, now - self._last_update)
+            self._last_update = now
+
+            events = []
+            while self._carry >= 1:
+                self._carry -= 1
+
+                if len(self._alarms) > 0:
+                    cleared = self._alarms.pop(self._random.choice(list(self._alarms)))
+                    events.append((CLEARED, cleared))
+
+                events.append((RAISED, self.__raise_alarm(now)))
+
+            listeners = list(self._listeners)
+
+        for event, alarm in events:
+            for listener in listeners:
+                listener(event, alarm)
+
+        return events
+
+    def alarms(self) -> List:
+        """@return: list of the active alarms (dicts), after applying the churn"""
+        self.update()
+
+        with self._lock:
+            return list(self._alarms.values())
+
+    def alarms_xml(self) -> str:
+        """@return: the <managed-element> subtree with the active alarms, as in a <get> reply"""
+        return f'<managed-element xmlns="{ME_NAMESPACE}">' \
+               + ''.join(alarm_xml(alarm) for alarm in self.alarms()) \
+               + '</managed-element>'
+
+    def connection_fails(self) -> bool:
+        return self._random.random() < self.connect_failure_rate
+
+    def rpc_fails(self) -> bool:
+        return self._random.random() < self.rpc_failure_rate
+
+    def __raise_alarm(self, now):
+        # the caller holds self._lock (or it is the constructor)
+        condition, description = self._random.choice(_CONDITIONS)
+        # every alarm gets its own timestamp: the collector deduplicates on (device, timestamp, severity)
+        self._last_raised = max(now, self._last_raised + 1e-4)
+        timestamp = device_timestamp(self._last_raised)
+
+        alarm = {'condition': condition,
+                 'condition-description': description,
+                 'ne-condition-timestamp': timestamp,
+                 'entity-display-name': f'{self.name} entity {self._next_id}',
+                 'notification-code': 'acor-fmt:' + self._random.choice(_SEVERITIES),
+                 'ne-notification-timestamp': timestamp}
+
+        self._alarms[self._next_id] = alarm
+        self._next_id += 1
+
+        return alarm
+
+
+def alarm_xml(alarm) -> str:
+    """@return: the <alarm> element of alarm (dict tag -> text)"""
+    return f'<alarm xmlns:acor-fmt="{FMT_NAMESPACE}">' \
+           + ''.join(f'<{tag}>{escape(text)}</{tag}>' for tag, text in alarm.items()) \
+           + '</alarm>'
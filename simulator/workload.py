@@ -0,0 +1,145 @@
+"""
+Synthetic alarm workload: a timeline of alarms raised and cleared on a set of devices, with
+a baseline of long standing alarms plus storms (many alarms on many devices at once, cleared together),
+flaps (the same alarm raised and cleared over and over) and random clears.
+
+The timeline is turned into the <rpc-reply> payloads the devices would return if polled every poll_interval
+seconds (see snapshots()), to be replayed by simulator/replay.py.
+"""
+import heapq
+import random
+from typing import Iterator
+
+from simulator.virtual_device import BASE_NAMESPACE, ME_NAMESPACE, _CONDITIONS, _SEVERITIES, alarm_xml, \
+    device_timestamp
+
+
+class _Alarm(object):
+    __slots__ = ('device', 'raised', 'cleared', 'element')
+
+    def __init__(self, device, raised, cleared, element):
+        self.device = device
+        self.raised = raised
+        self.cleared = cleared  # None if it is never cleared
+        self.element = element  # dict tag -> text, as rendered by alarm_xml()
+
+    def active_at(self, t) -> bool:
+        return self.raised <= t and (self.cleared is None or t < self.cleared)
+
+
+class WorkloadGenerator(object):
+
+    def __init__(self, devices=10, baseline_alarms=10, start_time=1600000000.0, seed=0):
+        """
+        @param devices: number of devices, named 10.0.x.y
+        @param baseline_alarms: alarms active on every device from the beginning and never cleared
+        @param start_time: epoch of the beginning of the timeline (timestamps of the alarms)
+        @param seed: seed of the random generator: the same calls give the same workload
+        """
+        self.devices = ['10.0.%d.%d' % (i // 250, i % 250 + 1) for i in range(devices)]
+        self.start_time = start_time
+        self._random = random.Random(seed)
+        self._alarms = {device: [] for device in self.devices}
+        self._timestamps = set()  # (device, timestamp) already used
+
+        for device in self.devices:
+            for _ in range(baseline_alarms):
+                self.__add(device, 0.0, None)
+
+    def add_storm(self, at, devices_fraction=0.5, alarms_per_device=50, spread=10.0, clear_after=300.0):
+        """
+        @param at: seconds from the beginning of the timeline
+        @param devices_fraction: fraction of the devices hit by the storm
+        @param alarms_per_device: alarms raised on each device hit
+        @param spread: the alarms are raised randomly within this many seconds
+        @param clear_after: seconds after which the alarms of the storm are cleared (None: never)
+        """
+        hit = self._random.sample(self.devices, max(1, int(len(self.devices) * devices_fraction)))
+
+        for device in hit:
+            for _ in range(alarms_per_device):
+                raised = at + self._random.uniform(0, spread)
+                cleared = None if clear_after is None else raised + clear_after + self._random.uniform(0, spread)
+                self.__add(device, raised, cleared)
+
+        return self
+
+    def add_flaps(self, at, devices=1, period=20.0, count=10):
+        """
+        the same alarm is raised for period / 2 seconds and cleared for period / 2, count times
+
+        @param devices: number of flapping devices
+        """
+        for device in self._random.sample(self.devices, min(devices, len(self.devices))):
+            element = self.__element(device)
+
+            for i in range(count):
+                raised = at + i * period
+                # a flap is a new occurrence of the alarm: new timestamp, same condition and severity
+                self.__add(device, raised, raised + period / 2, dict(element))
+
+        return self
+
+    def add_random_clears(self, at, fraction=0.2):
+        """clears a fraction of the alarms active at time at"""
+        for device in self.devices:
+            for alarm in self._alarms[device]:
+                if alarm.active_at(at) and self._random.random() < fraction:
+                    alarm.cleared = at
+
+        return self
+
+    def alarms_count(self) -> int:
+        return sum(len(alarms) for alarms in self._alarms.values())
+
+    def snapshots(self, duration, poll_interval=5.0) -> Iterator:
+        """
+        @param duration: seconds of the timeline to render
+        @param poll_interval: seconds between two polls of the same device
+        @return: iterator of (seconds from the beginning, device ip, <rpc-reply> xml) sorted by time.
+                 The polls of the devices are spread inside poll_interval, as the PollScheduler does.
+                 The payloads are rendered lazily: long timelines don't have to fit in memory
+        """
+        polls = [(poll_interval * index / len(self.devices), index) for index in range(len(self.devices))]
+        heapq.heapify(polls)
+
+        while len(polls) > 0 and polls[0][0] < duration:
+            t, index = polls[0]
+            device = self.devices[index]
+
+            yield t, device, self.reply_at(device, t)
+
+            heapq.heapreplace(polls, (t + poll_interval, index))
+
+    def reply_at(self, device, t) -> str:
+        """@return: the <rpc-reply> of device at time t (seconds from the beginning)"""
+        elements = ''.join(alarm_xml(alarm.element) for alarm in self._alarms[device] if alarm.active_at(t))
+
+        return f'<?xml version="1.0" encoding="UTF-8"?><rpc-reply xmlns="{BASE_NAMESPACE}" message-id="{int(t)}">' \
+               f'<data><managed-element xmlns="{ME_NAMESPACE}">{elements}</managed-element></data></rpc-reply>'
+
+    def __element(self, device):
+        condition, description = self._random.choice(_CONDITIONS)
+
+        return {'condition': condition,
+                'condition-description': description,
+                'ne-condition-timestamp': '',
+                'entity-display-name': f'{device} entity {self._random.randrange(1000)}',
+                'notification-code': 'acor-fmt:' + self._random.choice(_SEVERITIES),
+                'ne-notification-timestamp': ''}
+
+    def __add(self, device, raised, cleared, element=None):
+        if element is None:
+            element = self.__element(device)
+
+        # unique timestamps: the collector deduplicates the alarms on (device, timestamp, severity)
+        seconds = self.start_time + raised
+        timestamp = device_timestamp(seconds)
+        while (device, timestamp) in self._timestamps:
+            seconds += 1e-4
+            timestamp = device_timestamp(seconds)
+
+        self._timestamps.add((device, timestamp))
+        element['ne-condition-timestamp'] = element['ne-notification-timestamp'] = timestamp
+
+        self._alarms[device].append(_Alarm(device, raised, cleared, element))
@@ -0,0 +1,59 @@
+import alarm_library
+from models.adaptive_rate import AdaptiveRate, alarms_fingerprint
+from models.config_manager import ConfigManager
+from models.device import Device
+from models.poll_scheduler import PollScheduler
+
+KEYS = ('notification-code', 'ne-condition-timestamp')
+
+
+def test_quiet_and_unreachable_devices_back_off_up_to_the_bound():
+    rate = AdaptiveRate(min_rate=1, max_rate=60, factor=2)
+    rate.register('a', 5)
+    quiet = alarms_fingerprint([{'notification-code': 'major', 'ne-condition-timestamp': 't1'}], KEYS)
+
+    assert rate.observe('a', quiet, True) == 10
+    assert rate.observe('a', quiet, True) == 20
+    assert rate.observe('a', None, False) == 40
+    assert rate.observe('a', None, False) == 60
+    assert rate.observe('a', quiet, True) == 60
+
+
+def test_changes_shorten_the_interval_down_to_the_bound():
+    rate = AdaptiveRate(min_rate=1, max_rate=60, factor=2)
+    rate.register('a', 5)
+
+    for i in range(5):
+        rate.observe('a', alarms_fingerprint([{'notification-code': 'major', 'ne-condition-timestamp': i}], KEYS), True)
+
+    assert rate.get_rates()['a'] == 1
+
+
+def test_fingerprint_ignores_the_order_of_the_alarms():
+    first = {'notification-code': 'major', 'ne-condition-timestamp': 't1'}
+    second = {'notification-code': 'minor', 'ne-condition-timestamp': 't2'}
+
+    assert alarms_fingerprint([first, second], KEYS) == alarms_fingerprint([second, first], KEYS)
+
+
+def test_collector_backs_off_an_unreachable_device(monkeypatch):
+    def unreachable(device, timeout):
+        raise ConnectionRefusedError('no netconf')
+
+    monkeypatch.setattr(alarm_library, '_get_alarms_xml', unreachable)
+    config_manager = ConfigManager()
+    config_manager.data = dict(config_manager.data,
+                               Collector_config=dict(config_manager.data['Collector_config'], Adaptive_polling=True,
+                                                     Adaptive_max_rate_in_sec=60, Simulation_mode=False))
+    saved = []
+    collector = alarm_library.AlarmCollector([Device('10.0.0.1', 5, 830, 'user', 'password')], config_manager,
+                                             sink=lambda host, alarms: saved.append(host))
+    collector.scheduler = PollScheduler(workers=1)
+    collector._adaptive_rate.register('10.0.0.1', 5)
+    collector.scheduler.add('10.0.0.1', 5, lambda: None)
+
+    collector.poll(collector.devices[0])
+    collector.poll(collector.devices[0])
+
+    assert saved == []
+    assert collector.get_polling_rates() == {'10.0.0.1': 20}
@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+from models.database_manager import DBHandler
+
+
+def _new_db():
+    db_url = os.path.join(tempfile.mkdtemp(), 'local.db')
+    db = DBHandler(db_url).open_connection()
+    db.create_alarm_table()
+    return db
+
+
+def test_counters_follow_inserts_and_ceases():
+    db = _new_db()
+
+    db.insert_row_alarm(device_ip='10.0.0.1', severity=5, description='a', _time='2020-05-01 10:00:00')
+    db.insert_row_alarm(device_ip='10.0.0.1', severity=5, description='b', _time='2020-05-01 10:00:01')
+    db.insert_row_alarm(device_ip='10.0.0.2', severity=3, description='c', _time='2020-05-01 10:00:02')
+
+    db.update_ceased_alarms(1)
+    db.update_ceased_alarms(1)  # ceasing twice must not move the counters again
+
+    assert sorted(db.select_alarm_counters()) == [('10.0.0.1', '5', 0, 1),
+                                                  ('10.0.0.1', '5', 1, 1),
+                                                  ('10.0.0.2', '3', 0, 1)]
+    assert db.select_alarm_by_ID(1)[6] == 1
+    db.close_connection()
+
+
+def test_rebuild_matches_incremental_counters():
+    db = _new_db()
+
+    for i in range(10):
+        db.insert_row_alarm(device_ip='10.0.0.%d' % (i % 3), severity=i % 2, description=str(i))
+    db.update_ceased_alarms(4)
+
+    incremental = sorted(db.select_alarm_counters())
+    db.rebuild_alarm_counters()
+
+    assert sorted(db.select_alarm_counters()) == incremental
+    db.close_connection()
+
+
+def test_change_feed_reports_inserts_and_ceases():
+    db = _new_db()
+
+    assert db.select_last_change_seq() == 0
+
+    db.insert_row_alarm(device_ip='10.0.0.1', severity=5, description='a')
+    seq = db.select_last_change_seq()
+    db.insert_row_alarm(device_ip='10.0.0.1', severity=4, description='b')
+    db.update_ceased_alarms(1)
+
+    assert [(alarm_id, kind) for _, alarm_id, kind in db.select_changes_since(seq)] == [(2, 'insert'), (1, 'cease')]
+    assert [row[0] for row in db.select_alarms_by_IDs([2, 1])] == [1, 2]
+    db.close_connection()
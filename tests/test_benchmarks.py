@@ -0,0 +1,21 @@
+from benchmarks.__main__ import compare
+from benchmarks.datasets import alarm_payload, alarm_rows
+from models.customXMLParser import CustomXMLParser
+
+
+def test_datasets_are_reproducible():
+    assert alarm_payload(50) == alarm_payload(50)
+    assert len(CustomXMLParser(alarm_payload(50)).parse_all_alarms_xml()) == 50
+    # the time column depends on when they are generated, the rest must not
+    assert [row[:3] for row in alarm_rows(100)] == [row[:3] for row in alarm_rows(100)]
+
+
+def test_compare_flags_only_the_regressions():
+    previous = {'meta': {'commit': 'a'}, 'results': {'db': {'inserts_per_sec': 1000, 'select': {'p50_ms': 10}}}}
+    current = {'meta': {'commit': 'b'}, 'results': {'db': {'inserts_per_sec': 1200, 'select': {'p50_ms': 20}}}}
+
+    lines = compare(previous, current).splitlines()
+
+    assert lines[0] == 'a -> b'
+    assert 'worse' not in [line for line in lines if 'inserts_per_sec' in line][0]
+    assert 'worse' in [line for line in lines if 'p50_ms' in line][0]
@@ -0,0 +1,52 @@
+from models.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_the_threshold_and_probes_once_per_timeout():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+
+    for _ in range(3):
+        assert breaker.allow_request()
+        breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+    clock.now = 30
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow_request()  # a single probe at a time
+
+
+def test_failed_probes_double_the_backoff_up_to_the_max():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, max_reset_timeout=100, clock=clock)
+    breaker.record_failure()
+
+    for expected in (30, 60, 100, 100):
+        clock.now += expected - 1
+        assert not breaker.allow_request()
+        clock.now += 1
+        assert breaker.allow_request()
+        breaker.record_failure()
+
+
+def test_a_successful_probe_closes_the_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+
+    clock.now = 30
+    assert breaker.allow_request()
+    breaker.record_success()
+
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import threading
+
+import pytest
+
+from models import database_manager
+from models.cluster_coordinator import ClusterCoordinator
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _nodes(*names, shards=8):
+    db_url = os.path.join(tempfile.mkdtemp(), 'cluster.db')
+    clock = _Clock()
+    return clock, [ClusterCoordinator(name, shards, lease_ttl=15, db_url=db_url, clock=clock) for name in names]
+
+
+def test_single_node_owns_every_shard():
+    clock, (a,) = _nodes('a')
+
+    assert a.heartbeat() == set(range(8))
+    assert a.owns('10.0.0.1')
+
+
+def test_shards_are_rebalanced_when_a_node_joins_and_when_it_dies():
+    clock, (a, b) = _nodes('a', 'b')
+    a.heartbeat()
+
+    b.heartbeat()  # b is alive but a still holds everything
+    a.heartbeat()  # a gives back its extra shards
+    b.heartbeat()  # b claims them
+
+    assert len(a.owned_shards()) == 4 and len(b.owned_shards()) == 4
+    assert a.owned_shards().isdisjoint(b.owned_shards())
+
+    clock.now += 20  # b stops heartbeating: its node and its leases expire
+    assert a.heartbeat() == set(range(8))
+
+
+def test_release_all_frees_the_shards_immediately():
+    clock, (a, b) = _nodes('a', 'b')
+    a.heartbeat()
+
+    a.release_all()
+
+    assert b.heartbeat() == set(range(8))
+
+
+def test_heartbeat_does_not_need_the_db_semaphore():
+    clock, (a,) = _nodes('a')
+    owned = []
+
+    with database_manager.semaphore:  # e.g. a long query of a DBHandler of this process
+        heartbeat = threading.Thread(target=lambda: owned.append(a.heartbeat()), daemon=True)
+        heartbeat.start()
+        heartbeat.join(timeout=5)
+
+    assert owned == [set(range(8))]
+
+
+def test_a_node_that_cannot_heartbeat_stops_owning_its_shards():
+    clock, (a, b) = _nodes('a', 'b')
+    a.heartbeat()
+    assert a.owns('10.0.0.1')
+
+    a._db_url = tempfile.mkdtemp()  # the DB becomes unreachable for a: a directory is not a sqlite file
+    clock.now += 10
+    with pytest.raises(Exception):
+        a.heartbeat()
+    assert a.owned_shards() == set(range(8))  # still within its lease
+
+    clock.now += 6  # a's leases expired: b takes the shards over
+    assert b.heartbeat() == set(range(8))
+    assert not a.owns('10.0.0.1')
+    assert a.owned_shards() == set()
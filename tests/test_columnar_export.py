@@ -0,0 +1,56 @@
+import os
+import tempfile
+
+import numpy as np
+
+from models.columnar_export import MISSING_TIME, count_alarms_per_time_bucket, decode, export_alarms, load_columns
+from models.database_manager import DBHandler
+
+
+def _db(rows):
+    db_url = os.path.join(tempfile.mkdtemp(), 'local.db')
+    db = DBHandler(db_url).open_connection()
+    db.create_alarm_table()
+    for device_ip, severity, description, _time, ingested in rows:
+        db.insert_row_alarm(device_ip, severity, description, _time, 1, 0, ingested)
+    db.close_connection()
+
+    return db_url
+
+
+def test_export_round_trip():
+    db_url = _db([('10.0.0.1', 5, 'link down', '2020-05-01 10:00:00.25', 1588327200.5),
+                  ('10.0.0.2', 3, 'fan failure', '2020-05-01 10:00:01', 1588327201.0),
+                  ('10.0.0.1', 5, 'link down', 'not a time', 1588327202.0)])
+    root = tempfile.mkdtemp()
+
+    assert export_alarms(os.path.join(root, 'alarms'), db_url=db_url, chunk_size=2) == 3
+    assert export_alarms(os.path.join(root, 'alarms.npz'), db_url=db_url, chunk_size=2) == 3
+
+    columns = load_columns(os.path.join(root, 'alarms'))
+    packed = load_columns(os.path.join(root, 'alarms.npz'))
+
+    assert isinstance(columns['time'], np.memmap)
+    assert list(columns['ID']) == [1, 2, 3]
+    assert list(columns['deviceIP']) == [0, 1, 0]  # dictionary encoded across the chunks
+    assert list(decode(columns, 'description')) == ['link down', 'fan failure', 'link down']
+    assert list(columns['severity']) == [5, 3, 5]
+    assert list(columns['time']) == [1588327200250, 1588327201000, MISSING_TIME]
+    assert list(columns['ingested']) == [1588327200500, 1588327201000, 1588327202000]
+    assert all(columns['notified']) and not any(columns['ceased'])
+    assert sorted(packed) == sorted(columns)
+    assert all(np.array_equal(packed[name], columns[name]) for name in columns)
+
+
+def test_time_buckets_match_the_db():
+    db_url = _db([('10.0.0.%d' % (i % 3), i % 4 + 2, 'd', '2020-05-01 10:%02d:%02d' % (i // 7, i % 60), None)
+                  for i in range(200)])
+    path = os.path.join(tempfile.mkdtemp(), 'alarms')
+    export_alarms(path, db_url=db_url)
+
+    db = DBHandler(db_url).open_connection()
+    expected = db.count_alarms_per_time_bucket('2020-05-01 10:05:00', 300)
+    db.close_connection()
+
+    since = int(np.datetime64('2020-05-01T10:05:00', 'ms').astype(np.int64))
+    assert sorted(count_alarms_per_time_bucket(load_columns(path), since, 300)) == sorted(expected)
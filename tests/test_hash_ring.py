@@ -0,0 +1,33 @@
+from models.device import Device
+from models.hash_ring import HashRing, partition_devices
+
+
+def test_every_key_has_one_owner_and_owners_are_stable():
+    keys = ['10.0.%d.%d' % (i // 250, i % 250) for i in range(1000)]
+
+    first = HashRing(range(4)).partition(keys)
+    second = HashRing(range(4)).partition(keys)
+
+    assert first == second
+    assert sorted(key for owned in first.values() for key in owned) == sorted(keys)
+    assert all(len(owned) > 100 for owned in first.values())  # roughly even split
+
+
+def test_adding_a_node_moves_only_its_keys():
+    keys = ['10.0.%d.%d' % (i // 250, i % 250) for i in range(1000)]
+
+    before = HashRing(range(4))
+    after = HashRing(range(5))
+
+    moved = [key for key in keys if before.get_node(key) != after.get_node(key)]
+
+    assert all(after.get_node(key) == 4 for key in moved)
+
+
+def test_partition_devices_keeps_every_device():
+    devices = [Device('10.0.0.%d' % i, 5, 830, 'admin', 'admin') for i in range(20)]
+
+    shards = partition_devices(devices, 3)
+
+    assert len(shards) == 3
+    assert sorted(d.ip for shard in shards for d in shard) == sorted(d.ip for d in devices)
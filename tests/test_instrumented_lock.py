@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from models import database_manager
+from models.database_manager import DBHandler
+from models.instrumented_lock import InstrumentedLock, locks_report
+
+
+def _hold(lock, seconds):
+    with lock:
+        time.sleep(seconds)
+
+
+def test_wait_and_hold_are_recorded_per_call_site():
+    lock = InstrumentedLock('test-sites', threading.Semaphore(1))
+
+    holder = threading.Thread(target=_hold, args=(lock, 0.2))
+    holder.start()
+    time.sleep(0.05)
+
+    with lock:  # waits for _hold
+        pass
+    holder.join()
+
+    stats = lock.stats()
+    assert stats['test_instrumented_lock.py:_hold']['hold_max_ms'] >= 200
+    assert stats['test_instrumented_lock.py:test_wait_and_hold_are_recorded_per_call_site']['wait_max_ms'] >= 100
+
+
+def test_released_when_the_body_raises():
+    lock = InstrumentedLock('test-raise')
+
+    with pytest.raises(ValueError):
+        with lock:
+            raise ValueError
+
+    assert lock.acquire(blocking=False)
+    lock.release()
+    assert lock.holders() == []
+
+
+def test_long_holds_are_reported():
+    lock = InstrumentedLock('test-long', long_hold=0.01)
+
+    holder = threading.Thread(target=_hold, args=(lock, 0.1), name='slow-holder')
+    holder.start()
+    time.sleep(0.05)
+
+    report = {entry['lock']: entry for entry in json.loads(locks_report())}['test-long']
+    holder.join()
+
+    assert report['holders'][0]['thread'] == 'slow-holder'
+    assert lock.stats()['test_instrumented_lock.py:_hold']['long_holds'] == 1
+
+
+def test_the_call_site_is_the_caller_of_the_db_handler():
+    db = DBHandler(os.path.join(tempfile.mkdtemp(), 'local.db')).open_connection()
+    db.create_alarm_table()
+    db.count_alarms()
+    db.close_connection()
+
+    sites = database_manager.semaphore.stats()
+    assert 'test_instrumented_lock.py:test_the_call_site_is_the_caller_of_the_db_handler' in sites
+    assert not any(site.startswith('database_manager.py:') for site in sites)
@@ -0,0 +1,40 @@
+import json
+import logging
+import sys
+
+from models.log_manager import JsonFormatter, RateLimitFilter
+
+
+def _record(message, lineno=10, exc_info=None):
+    return logging.LogRecord('alarm_library', logging.ERROR, 'alarm_library.py', lineno, message, None, exc_info)
+
+
+def test_repeated_messages_are_written_once_per_period():
+    now = [0.0]
+    rate_limit = RateLimitFilter(period=60, clock=lambda: now[0])
+
+    assert rate_limit.filter(_record('device 10.0.0.1 unreachable'))
+    assert not rate_limit.filter(_record('device 10.0.0.1 unreachable'))
+    assert not rate_limit.filter(_record('device 10.0.0.1 unreachable'))
+    assert rate_limit.filter(_record('device 10.0.0.2 unreachable'))  # another message
+    assert rate_limit.filter(_record('device 10.0.0.1 unreachable', lineno=20))  # another line of code
+
+    now[0] = 61.0
+    record = _record('device 10.0.0.1 unreachable')
+
+    assert rate_limit.filter(record)
+    assert record.getMessage() == 'device 10.0.0.1 unreachable (repeated 2 more times in the last 60s)'
+
+
+def test_json_lines():
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = _record('poll failed', exc_info=sys.exc_info())
+
+    line = json.loads(JsonFormatter().format(record))
+
+    assert line['level'] == 'ERROR'
+    assert line['logger'] == 'alarm_library'
+    assert line['message'] == 'poll failed'
+    assert 'ValueError: boom' in line['exception']
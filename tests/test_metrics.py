@@ -0,0 +1,53 @@
+import urllib.request
+
+import pytest
+
+from models.metrics import MetricsRegistry, MetricsServer
+
+
+def test_exposition_of_counters_gauges_and_histograms():
+    registry = MetricsRegistry()
+    polls = registry.counter('polls_total', 'polls', ['device'])
+    depth = registry.gauge('queue_depth', 'depth')
+    seconds = registry.histogram('poll_seconds', 'seconds', buckets=(0.1, 1))
+
+    polls.labels('10.0.0.1').inc()
+    polls.labels('10.0.0.1').inc(2)
+    depth.set_function(lambda: 7)
+    for value in (0.05, 0.5, 5):
+        seconds.observe(value)
+
+    lines = registry.exposition().splitlines()
+
+    assert '# TYPE polls_total counter' in lines
+    assert 'polls_total{device="10.0.0.1"} 3' in lines
+    assert 'queue_depth 7' in lines
+    assert 'poll_seconds_bucket{le="0.1"} 1' in lines
+    assert 'poll_seconds_bucket{le="1"} 2' in lines
+    assert 'poll_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'poll_seconds_count 3' in lines
+
+
+def test_metrics_are_registered_once():
+    registry = MetricsRegistry()
+
+    assert registry.counter('a_total', 'a', ['x']) is registry.counter('a_total', 'a', ['x'])
+    with pytest.raises(ValueError):
+        registry.gauge('a_total', 'a')
+    with pytest.raises(ValueError):
+        registry.counter('a_total', 'a', ['x']).labels('1', '2')
+
+
+def test_the_endpoint_serves_the_registry():
+    registry = MetricsRegistry()
+    registry.counter('served_total', 'served').inc()
+    server = MetricsServer(port=0, registry=registry)
+    server.start()
+
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics', timeout=5) as response:
+            body = response.read().decode('utf-8')
+    finally:
+        server.shutdown()
+
+    assert 'served_total 1' in body.splitlines()
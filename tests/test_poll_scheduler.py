@@ -0,0 +1,69 @@
+import threading
+
+from models.poll_scheduler import PollScheduler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _wait_runs(scheduler, key, runs):
+    for _ in range(200):
+        if scheduler.stats()[key]['runs'] >= runs:
+            return
+        threading.Event().wait(0.01)
+
+
+def test_phases_are_spread_inside_the_interval():
+    clock = FakeClock()
+    scheduler = PollScheduler(workers=2, clock=clock)
+
+    for i in range(100):
+        scheduler.add('10.0.0.%d' % i, 5, lambda: None)
+
+    due = sorted(entry[0] - clock.now for entry in scheduler._heap)
+
+    assert 0 <= due[0] and due[-1] < 5
+    assert due[-1] - due[0] > 4  # not all at the same time
+    scheduler.stop()
+
+
+def test_late_runs_are_skipped_and_the_grid_is_kept():
+    clock = FakeClock()
+    scheduler = PollScheduler(workers=1, clock=clock)
+    scheduler.add('a', 10, lambda: None)
+    first = scheduler._jobs['a'].grid_time
+
+    clock.now = first + 35  # 3 whole intervals late
+    scheduler.run_pending()
+    _wait_runs(scheduler, 'a', 1)
+
+    stats = scheduler.stats()['a']
+    assert stats['runs'] == 1
+    assert stats['missed'] == 3
+    assert scheduler._jobs['a'].grid_time == first + 40  # no drift: still on the original grid
+    scheduler.stop()
+
+
+def test_a_run_still_going_is_not_overlapped():
+    clock = FakeClock()
+    scheduler = PollScheduler(workers=2, clock=clock)
+    release = threading.Event()
+    scheduler.add('a', 10, release.wait)
+
+    clock.now += 10
+    scheduler.run_pending()
+    clock.now += 10
+    scheduler.run_pending()  # the first run is still blocked
+
+    release.set()
+    _wait_runs(scheduler, 'a', 1)
+
+    stats = scheduler.stats()['a']
+    assert stats['runs'] == 1
+    assert stats['skipped_overlaps'] == 1
+    scheduler.stop()
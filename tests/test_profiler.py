@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from models.metrics import MetricsRegistry, MetricsServer
+from models.profiler import SamplingProfiler, profile_endpoint, write_report
+
+
+def _busy(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profile_has_the_stacks_of_every_thread():
+    output_dir = tempfile.mkdtemp()
+    profiler = SamplingProfiler(output_dir, interval=0.005, max_duration=5)
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy, args=(stop,), name='busy-worker')
+    worker.start()
+
+    written = threading.Event()
+    assert profiler.start(10, on_done=lambda path: written.set())
+    assert not profiler.start(10)  # one at a time
+    time.sleep(0.2)
+    profiler.stop()
+    assert written.wait(5)
+    stop.set()
+    worker.join()
+
+    with open(profiler.last_output) as _file:
+        report = _file.read()
+    with open(profiler.last_output[:-len('.txt')] + '.folded') as _file:
+        folded = _file.read()
+
+    assert os.path.dirname(profiler.last_output) == output_dir
+    assert '=== thread busy-worker' in report
+    assert '_busy (test_profiler.py' in report
+    assert any(line.startswith('busy-worker;') and '_busy (test_profiler.py' in line for line in folded.splitlines())
+
+
+def test_routes_with_query_parameters():
+    server = MetricsServer('127.0.0.1', 0, MetricsRegistry())
+    server.add_route('/echo', lambda params: json.dumps(params), with_params=True)
+    server.start()
+
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}/echo?start&seconds=5'
+        body = urllib.request.urlopen(url, timeout=5).read().decode('utf-8')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert json.loads(body) == {'start': [''], 'seconds': ['5']}
+
+
+def test_invalid_parameters_are_a_bad_request():
+    server = MetricsServer('127.0.0.1', 0, MetricsRegistry())
+    server.add_route('/debug/profile', profile_endpoint, with_params=True)
+    server.start()
+
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/debug/profile?start&seconds=abc',
+                                   timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert error.value.code == 400
+
+
+def test_reports_of_the_same_millisecond_do_not_overwrite_each_other():
+    output_dir = tempfile.mkdtemp()
+    started = datetime(2020, 5, 1, 10, 0, 0, 123456)
+    stacks = {'main': Counter({('f',): 1})}
+
+    paths = [write_report(stacks, output_dir, started, 1, 0.01) for _ in range(2)]
+
+    assert [os.path.basename(path) for path in paths] == ['profile-20200501-100000-123.txt',
+                                                          'profile-20200501-100000-123-1.txt']
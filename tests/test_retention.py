@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+
+import alarm_library
+from models import database_manager, storage
+from models.config_manager import ConfigManager
+from models.database_manager import DBHandler
+from models.retention import RetentionManager, read_archive
+
+
+def _retention(max_age, max_rows, max_changes=100):
+    root = tempfile.mkdtemp()
+    config_manager = ConfigManager()
+    config_manager.data = dict(config_manager.data,
+                               Retention_config={'Archive_dir': os.path.join(root, 'archive'), 'Batch_size': 2,
+                                                 'Batch_pause_in_sec': 0, 'Max_age_in_days': max_age,
+                                                 'Max_rows': max_rows, 'Max_changes': max_changes})
+    config_manager.data['Notification_config'] = dict(config_manager.data['Notification_config'],
+                                                      Severity_notification_threshold=3)
+
+    db_url = os.path.join(root, 'local.db')
+    db = DBHandler(db_url).open_connection()
+    db.create_alarm_table()
+    db.close_connection()
+
+    return RetentionManager(config_manager, db_url, clock=lambda: datetime(2020, 6, 1)), db_url
+
+
+def _insert(db_url, rows):
+    db = DBHandler(db_url).open_connection()
+    for severity, _time, notified, ceased in rows:
+        db.insert_row_alarm('10.0.0.1', severity, 'd', _time, notified, ceased, _epoch(_time))
+    db.close_connection()
+
+
+def _epoch(_time):
+    return datetime.fromisoformat(_time).replace(tzinfo=timezone.utc).timestamp()
+
+
+def test_old_alarms_are_archived_unless_waiting_for_a_notification():
+    retention, db_url = _retention({'critical': 30, 'warning': 30}, {})
+    _insert(db_url, [(5, '2020-04-01 10:00:00.1', 1, 0),  # old, notified: archived
+                     (5, '2020-04-01 11:00:00.1', 0, 0),  # old, still to notify: kept
+                     (5, '2020-05-20 10:00:00.1', 1, 1),  # recent: kept
+                     (2, '2020-04-02 10:00:00.1', 0, 0),  # old, below the threshold: archived
+                     (2, '2020-04-02 11:00:00.1', 0, 1),
+                     (2, '2020-04-02 12:00:00.1', 0, 0)])
+
+    report = retention.run_once()
+
+    db = DBHandler(db_url).open_connection()
+    kept = sorted(row[0] for row in db.select_all())
+    counters = db.select_alarm_counters()
+    changes = db.select_changes_since(0)
+    db.close_connection()
+
+    assert report['archived'] == {'critical': 1, 'major': 0, 'minor': 0, 'not-alarmed': 0, 'not-reported': 0,
+                                  'warning': 3}
+    assert kept == [2, 3]
+    assert sorted(counters) == [('10.0.0.1', '5', 0, 1), ('10.0.0.1', '5', 1, 1)]
+    assert sorted(alarm_id for _, alarm_id, kind in changes if kind == 'delete') == [1, 4, 5, 6]
+    assert [alarm['ID'] for alarm in read_archive(retention.archive_path('2020-04-02'))] == [4, 5, 6]
+
+
+def test_row_limit_archives_the_oldest_alarms_first():
+    retention, db_url = _retention({}, {'major': 2})
+    _insert(db_url, [(4, '2020-05-0%d 10:00:00.1' % day, 1, 0) for day in range(1, 6)])
+
+    retention.run_once()
+
+    db = DBHandler(db_url).open_connection()
+    kept = [row[4] for row in db.select_all()]
+    db.close_connection()
+
+    assert kept == ['2020-05-04 10:00:00.1', '2020-05-05 10:00:00.1']
+    assert len(list(read_archive(retention.archive_path('2020-05-01')))) == 1
+
+
+def test_archived_active_alarms_are_not_collected_again(monkeypatch):
+    retention, db_url = _retention({'critical': 30}, {})
+    monkeypatch.setattr(database_manager, 'default_url', db_url)
+    monkeypatch.setattr(storage, '_backend', 'sqlite')
+
+    collector = alarm_library.AlarmCollector([], retention._config_manager)
+    assert retention._config_manager.get_alarm_dummy_data_flag()
+    polled = [{'notification-code': 'critical', 'condition-description': 'link down',
+               'ne-condition-timestamp': '2018-03-28 21:41:35.1', 'ingested': _epoch('2020-04-01 10:00:00')},
+              {'notification-code': 'critical', 'condition-description': 'fan',
+               'ne-condition-timestamp': '2018-03-28 21:42:35.1', 'ingested': _epoch('2020-05-30 10:00:00')}]
+
+    collector.save_to_db('10.0.0.1', polled)
+    db = DBHandler(db_url).open_connection()
+    db.update_notified_by_ID([1, 2])
+    db.close_connection()
+
+    # aged from the ingest time: the alarm collected 2 days ago is kept, even if the device dates it 2018
+    assert retention.run_once()['archived']['critical'] == 1
+
+    collector.save_to_db('10.0.0.1', [dict(alarm, ingested=None) for alarm in polled])  # the device still reports both
+
+    db = DBHandler(db_url).open_connection()
+    kept = [row[0] for row in db.select_all()]
+    unnotified = db.select_alarm_by_severity_unnotified(0)
+    db.close_connection()
+
+    assert kept == [2]
+    assert unnotified == []
+
+
+def test_tombstones_and_changes_stay_bounded():
+    retention, db_url = _retention({'critical': 30}, {}, max_changes=3)
+    _insert(db_url, [(5, '2020-04-01 10:%02d:00.1' % i, 1, 0) for i in range(10)])
+
+    first = retention.run_once()
+    later = RetentionManager(retention._config_manager, db_url, clock=lambda: datetime(2020, 7, 15)).run_once()
+
+    connection = sqlite3.connect(db_url)
+    tombstones = connection.execute('SELECT count(*) FROM alarm_tombstone').fetchone()[0]
+    changes = connection.execute('SELECT count(*) FROM alarm_change').fetchone()[0]
+    connection.close()
+    db = DBHandler(db_url).open_connection()
+    horizon, last = db.select_change_horizon(), db.select_last_change_seq()
+    db.close_connection()
+
+    assert first['archived']['critical'] == 10 and first['changes_trimmed'] == 7
+    assert later['tombstones_expired'] == 10  # deleted on 2020-06-01, older than the 30 days of critical
+    assert tombstones == 0 and changes == 3
+    assert horizon == last - 3
@@ -0,0 +1,44 @@
+import paramiko
+
+import alarm_library
+from models.customXMLParser import CustomXMLParser
+from models.device import Device
+from simulator.netconf_server import NetconfSimulator
+from simulator.virtual_device import VirtualDevice, RAISED, CLEARED
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1600000000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_churn_replaces_alarms_and_notifies_the_listeners():
+    clock = FakeClock()
+    device = VirtualDevice('sim-0', alarm_count=5, churn=2, clock=clock)
+    events = []
+    device.add_listener(lambda event, alarm: events.append(event))
+
+    clock.now += 1.5
+    device.update()
+
+    assert len(device.alarms()) == 5
+    assert events == [CLEARED, RAISED, CLEARED, RAISED, CLEARED, RAISED]
+
+
+def test_the_collector_parses_the_alarms_of_a_simulated_device():
+    devices = [VirtualDevice('sim-%d' % i, alarm_count=7) for i in range(3)]
+    simulator = NetconfSimulator(devices, base_port=28830, host_key=paramiko.RSAKey.generate(1024))
+    simulator.start()
+
+    try:
+        _xml = alarm_library._get_alarms_xml(Device(simulator.host_of(2), 5, simulator.port_of(2), 'admin', 'admin'))
+        alarms = CustomXMLParser(_xml).parse_all_alarms_xml()
+    finally:
+        simulator.stop()
+
+    assert [device['device_ip'] for device in simulator.network_config()] == ['127.0.0.1', '127.0.0.2', '127.0.0.3']
+    assert len(alarms) == 7
+    assert sorted(alarms[0]) == ['condition-description', 'ne-condition-timestamp', 'notification-code']
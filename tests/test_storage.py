@@ -0,0 +1,179 @@
+import os
+import tempfile
+
+import pytest
+
+from models import log_store
+from models.database_manager import DBHandler
+from models.log_store import LogStore
+
+
+def _handler(backend):
+    root = tempfile.mkdtemp()
+    url = os.path.join(root, 'local.db' if backend is DBHandler else 'alarms.log')
+
+    db = backend(url).open_connection()
+    db.create_alarm_table()
+    db.close_connection()
+
+    return lambda: backend(url).open_connection()
+
+
+@pytest.mark.parametrize('backend', [DBHandler, LogStore])
+def test_backends_give_the_same_answers(backend):
+    handler = _handler(backend)
+
+    db = handler()
+    db.insert_alarms([('10.0.0.1', 5, 'link down', '2020-05-01 10:00:00.1', 1588327200.0),
+                      ('10.0.0.1', 2, 'fan', '2020-05-01 10:07:00.1', 1588327620.0),
+                      ('10.0.0.2', 4, 'link down', '2020-05-01 10:08:00.1', 1588327680.0)])
+    db.close_connection()
+
+    db = handler()
+    new = db.filter_new_alarms('10.0.0.1', [('2020-05-01 10:00:00.1', 5), ('2020-05-01 10:00:00.1', 4)])
+    unnotified = db.select_alarm_by_severity_unnotified(3)
+    db.update_notified_by_ID([1])
+    db.update_ceased_alarms(2)
+    seq = db.select_last_change_seq()
+    deleted = db.delete_alarms([1])
+    db.close_connection()
+
+    db = handler()
+    assert new == [('2020-05-01 10:00:00.1', 4)]
+    assert [row[0] for row in unnotified] == [1, 3]
+    assert db.select_all() == [(2, '10.0.0.1', '2', 'fan', '2020-05-01 10:07:00.1', 0, 1, 1588327620.0),
+                               (3, '10.0.0.2', '4', 'link down', '2020-05-01 10:08:00.1', 0, 0, 1588327680.0)]
+    assert deleted == 1
+    assert [row[0] for row in db.select_alarms_page(active_only=True)] == [3]
+    assert [row[0] for row in db.select_alarms_page(limit=1)] == [3, 2]
+    assert sorted(db.select_alarm_counters()) == [('10.0.0.1', '2', 1, 1), ('10.0.0.2', '4', 0, 1)]
+    assert sorted(db.count_alarms_by_description_and_device()) == [('fan', '10.0.0.1', 1),
+                                                                   ('link down', '10.0.0.2', 1)]
+    assert db.count_alarms_per_time_bucket('2020-05-01 10:05:00', 300) == [(1588327500, '2', 1),
+                                                                          (1588327500, '4', 1)]
+    assert db.select_changes_since(0) == [(2, 2, 'insert'), (3, 3, 'insert'), (4, 2, 'cease'), (5, 1, 'delete')]
+    assert db.select_changes_since(seq) == [(5, 1, 'delete')]
+    assert db.select_expired_alarms(2, None, 3, 10)[1] == [db.select_alarm_by_ID(2)]
+    assert db.filter_new_alarms('10.0.0.1', [('2020-05-01 10:00:00.1', 5)]) == []  # deleted, not ceased
+    db.close_connection()
+
+
+
+@pytest.mark.parametrize('backend', [DBHandler, LogStore])
+def test_the_ID_of_a_deleted_alarm_is_not_reused(backend):
+    handler = _handler(backend)
+
+    db = handler()
+    db.insert_alarms([('10.0.0.1', 5, 'link down', '2020-05-01 10:00:00.1', 1588327200.0),
+                      ('10.0.0.1', 2, 'fan', '2020-05-01 10:07:00.1', 1588327620.0)])
+    db.delete_alarms([2])
+    db.close_connection()
+
+    db = handler()
+    db.insert_alarms([('10.0.0.2', 4, 'link down', '2020-05-01 10:08:00.1', 1588327680.0)])
+    assert [row[0] for row in db.select_all()] == [1, 3]
+    db.close_connection()
+
+def test_log_is_replayed_after_a_crash():
+    path = os.path.join(tempfile.mkdtemp(), 'alarms.log')
+
+    db = LogStore(path).open_connection()
+    db.insert_alarms([('10.0.0.1', 5, 'link down', '2020-05-01 10:00:00.%d' % (i // 2 + 1), None) for i in range(3)])
+    db.update_notified_by_ID([1])
+    db.update_ceased_alarms(2)
+    db.delete_alarms([3])
+    db.close_connection()
+    expected = LogStore(path).open_connection().select_all()
+
+    with open(path, 'a') as _file:
+        _file.write('["i",9,[4,"10.0.0.9"')  # the process died while appending
+    log_store.release(path)
+
+    db = LogStore(path).open_connection()
+    assert db.select_all() == expected
+    assert db.select_changes_since(0) == [(1, 1, 'insert'), (2, 2, 'insert'), (4, 2, 'cease'), (5, 3, 'delete')]
+
+    db.compact(0)
+    db.insert_row_alarm('10.0.0.2', 4, 'fan', '2020-05-01 11:00:00.1')
+    db.close_connection()
+    log_store.release(path)
+
+    db = LogStore(path).open_connection()
+    assert [row[0] for row in db.select_all()] == [1, 2, 4]  # IDs are not reused after a compaction
+    assert db.filter_new_alarms('10.0.0.1', [('2020-05-01 10:00:00.2', 5)]) == []  # the tombstone survives
+    assert db.select_last_change_seq() == 6
+
+    assert db.trim_changes(2, 10) == 3
+    db.delete_alarms([4], deleted_at=100.0)
+    assert db.expire_tombstones(4, 101.0, 10) == 1
+    db.close_connection()
+    log_store.release(path)
+
+    db = LogStore(path).open_connection()
+    assert db.select_change_horizon() == 4
+    assert db.select_changes_since(0) == [(5, 3, 'delete'), (7, 4, 'delete')]
+    assert db.filter_new_alarms('10.0.0.2', [('2020-05-01 11:00:00.1', 4)]) == [('2020-05-01 11:00:00.1', 4)]
+    db.close_connection()
+
+
+def test_log_batches_are_replayed_whole():
+    path = os.path.join(tempfile.mkdtemp(), 'alarms.log')
+
+    db = LogStore(path).open_connection()
+    db.insert_alarms([('10.0.0.1', 5, 'link down', '2020-05-01 10:00:00.1', None)])
+    db.close_connection()
+    size = os.path.getsize(path)
+
+    db = LogStore(path).open_connection()
+    db.insert_alarms([('10.0.0.2', 4, 'fan', '2020-05-01 10:0%d:00.1' % i, None) for i in range(3)])
+    db.close_connection()
+    log_store.release(path)
+
+    with open(path, 'r+b') as _file:
+        _file.truncate(size + (os.path.getsize(path) - size) // 2)  # the process died while appending the batch
+
+    db = LogStore(path).open_connection()
+    assert [row[0] for row in db.select_all()] == [1]
+    db.close_connection()
+    log_store.release(path)
+
+
+def test_log_compaction_keeps_what_is_appended_meanwhile(monkeypatch):
+    path = os.path.join(tempfile.mkdtemp(), 'alarms.log')
+
+    db = LogStore(path).open_connection()
+    db.insert_alarms([('10.0.0.1', 5, 'link down', '2020-05-01 10:00:00.%d' % i, None) for i in range(1, 4)])
+    for _ in range(10):
+        db.update_notified_by_ID([2])
+    db.delete_alarms([1])
+    db.close_connection()
+
+    fsync = os.fsync
+    calls = []
+
+    def insert_while_writing(fd):
+        # the first fsync is the one of the snapshot, written without the lock
+        if len(calls) == 0:
+            other = LogStore(path).open_connection()
+            other.insert_row_alarm('10.0.0.2', 4, 'fan', '2020-05-01 11:00:00.1')
+            other.update_ceased_alarms(2)
+            other.close_connection()
+        calls.append(fd)
+        fsync(fd)
+
+    monkeypatch.setattr(log_store.os, 'fsync', insert_while_writing)
+    db = LogStore(path).open_connection()
+    db.compact(0)
+    db.close_connection()
+    monkeypatch.undo()
+    expected = LogStore(path).open_connection().select_all()
+    log_store.release(path)
+
+    db = LogStore(path).open_connection()
+    assert len(calls) == 2  # snapshot written and swapped
+    assert [row[0] for row in expected] == [2, 3, 4]
+    assert db.select_all() == expected
+    assert db.select_alarm_by_host_time_severity('10.0.0.2', '2020-05-01 11:00:00.1', 4)[0][0] == 4
+    assert not os.path.exists(path + '.tmp')
+    db.close_connection()
+    log_store.release(path)
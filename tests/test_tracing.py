@@ -0,0 +1,63 @@
+import os
+import sqlite3
+import tempfile
+
+from models import tracing
+from models.database_manager import DBHandler
+from models.metrics import metrics_snapshot
+from models.tracing import Tracer
+
+
+def test_sampled_trace_records_the_tree_of_spans():
+    tracer = Tracer(sample_rate=0.5, sampler=iter([0.1, 0.9]).__next__)
+
+    with tracer.trace('poll', device='10.0.0.1'):
+        with tracer.span('netconf_get'):
+            pass
+        with tracer.span('parse'):
+            with tracer.span('inner'):
+                pass
+
+    with tracer.trace('poll', device='10.0.0.2') as root:  # not sampled
+        assert root is None
+        assert tracer.current() is None
+
+    traces = tracer.recent()
+
+    assert len(traces) == 1
+    assert traces[0]['attributes'] == {'device': '10.0.0.1'}
+    assert [child['name'] for child in traces[0]['children']] == ['netconf_get', 'parse']
+    assert traces[0]['children'][1]['children'][0]['name'] == 'inner'
+    assert traces[0]['duration_ms'] >= traces[0]['children'][1]['duration_ms']
+
+
+def test_alarm_latency_from_ne_timestamp_and_ingest_time():
+    ne = tracing.ne_timestamp_to_epoch('2020-05-01 10:00:00.5')
+    before = metrics_snapshot().get('alarm_latency_seconds_count{stage="ne_to_sent"}', 0)
+
+    tracing.observe_alarm_latency('2020-05-01 10:00:00.5', ne + 2, ne + 7)
+    tracing.observe_alarm_latency('not a timestamp', None, ne)
+
+    snapshot = metrics_snapshot()
+    assert tracing.ne_timestamp_to_epoch('2020-05-01 10:00:01') == ne + 0.5
+    assert snapshot['alarm_latency_seconds_count{stage="ne_to_sent"}'] == before + 1
+    assert snapshot['alarm_latency_seconds_bucket{stage="ingest_to_sent",le="5"}'] >= 1
+
+
+def test_ingested_column_is_added_to_existing_tables():
+    db_url = os.path.join(tempfile.mkdtemp(), 'local.db')
+    connection = sqlite3.connect(db_url)
+    connection.execute('''CREATE TABLE alarm (ID INTEGER PRIMARY KEY ,deviceIP text , severity text,
+                          description text, time timestamp, notified integer, ceased integer)''')
+    connection.execute("INSERT INTO alarm (deviceIP, severity, description, time, notified, ceased) "
+                       "VALUES ('10.0.0.1', '5', 'old', '2020-05-01 10:00:00', 0, 0)")
+    connection.commit()
+    connection.close()
+
+    db = DBHandler(db_url).open_connection()
+    db.create_alarm_table()
+    db.insert_row_alarm(device_ip='10.0.0.1', severity=5, description='new', ingested=1600000000.0)
+
+    assert db.select_alarm_by_ID(1)[7] is None
+    assert db.select_alarm_by_ID(2)[7] == 1600000000.0
+    db.close_connection()
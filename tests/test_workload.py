@@ -0,0 +1,43 @@
+from models.config_manager import ConfigManager
+from models.customXMLParser import CustomXMLParser
+from models.database_manager import DBHandler
+from simulator.replay import ReplayHarness
+from simulator.workload import WorkloadGenerator
+
+
+def _alarms(workload, device, t):
+    return CustomXMLParser(workload.reply_at(device, t)).parse_all_alarms_xml()
+
+
+def test_storms_are_raised_and_cleared():
+    workload = WorkloadGenerator(devices=4, baseline_alarms=3).add_storm(100, 1.0, 20, spread=10, clear_after=60)
+    device = workload.devices[0]
+
+    assert len(_alarms(workload, device, 50)) == 3
+    assert len(_alarms(workload, device, 120)) == 23
+    assert len(_alarms(workload, device, 200)) == 3
+
+
+def test_snapshots_follow_the_timeline():
+    workload = WorkloadGenerator(devices=3, baseline_alarms=1).add_flaps(0, devices=1, period=10, count=3)
+
+    snapshots = list(workload.snapshots(30, poll_interval=5))
+
+    assert len(snapshots) == 3 * 6
+    assert [t for t, _, _ in snapshots] == sorted(t for t, _, _ in snapshots)
+
+
+def test_replay_saves_and_notifies_every_alarm_once(tmp_path):
+    db_url = str(tmp_path / 'replay.db')
+    workload = WorkloadGenerator(devices=3, baseline_alarms=5).add_storm(20, 1.0, 10, spread=5, clear_after=None)
+
+    report = ReplayHarness(db_url=db_url).replay(workload.snapshots(60, poll_interval=5), speed=0)
+
+    db = DBHandler(db_url).open_connection()
+    saved = db.select_all()
+    db.close_connection()
+
+    assert len(saved) == 3 * 15
+    assert report['save']['count'] == 3 * 12
+    threshold = ConfigManager().get_severity_notification_threshold()
+    assert report['alarms_notified'] == len([row for row in saved if int(row[2]) >= threshold])